@@ -0,0 +1,210 @@
+import argparse
+import logging
+import csv
+import os
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    import pyarrow.feather as feather
+except ImportError:
+    pa = None
+
+# Columnar storage for the files handed off between pipeline stages (nodes, edges, texts,
+# scores, topics). An artifact keeps its historical CSV name ('src/nlp/cleaned_dataset.csv')
+# and its columnar copy lives next to it:
+#   .parquet  typed and zstd-compressed, the default
+#   .arrow    uncompressed Arrow IPC, memory-mapped with zero copy on read
+# Reads pick the newest of the three files, so a CSV re-exported by an external tool
+# (e.g. Gephi's statistical_nodes.csv) wins over an older columnar copy.
+# Without pyarrow everything falls back to plain CSV
+
+# Low-cardinality string columns stored as dictionaries (one copy of each distinct value)
+DICTIONARY_COLUMNS = {
+    'author', 'source', 'target', 'community_id', 'community_type',
+    'type', 'model', 'predicted_sentiment', 'topic',
+}
+
+COLUMNAR_FORMATS = {'parquet': '.parquet', 'arrow': '.arrow'}
+
+_warned = False
+
+def columnar_available():
+    global _warned
+    if pa is None and not _warned:
+        logging.warning("pyarrow is not installed: artifacts are read and written as CSV (pip install pyarrow)")
+        _warned = True
+    return pa is not None
+
+def artifact_paths(path):
+    base, _ = os.path.splitext(path)
+    return {'csv': base + '.csv', 'parquet': base + '.parquet', 'arrow': base + '.arrow'}
+
+def resolve_artifact(path):
+    paths = artifact_paths(path)
+    formats = ('csv', 'parquet', 'arrow') if columnar_available() else ('csv',)
+    existing = [(os.path.getmtime(paths[fmt]), fmt != 'csv', paths[fmt]) for fmt in formats if os.path.exists(paths[fmt])]
+    if not existing:
+        raise FileNotFoundError(f"No artifact found for {path}")
+    # On equal timestamps the columnar file is preferred
+    return max(existing)[2]
+
+def is_text(data_type):
+    return pa.types.is_string(data_type) or pa.types.is_large_string(data_type)
+
+def encode_dictionaries(table):
+    for i, field in enumerate(table.schema):
+        if field.name in DICTIONARY_COLUMNS and is_text(field.type):
+            table = table.set_column(i, field.name, table.column(i).dictionary_encode())
+    return table
+
+def decode_dictionaries(table):
+    for i, field in enumerate(table.schema):
+        if pa.types.is_dictionary(field.type):
+            table = table.set_column(i, field.name, table.column(i).cast(field.type.value_type))
+    return table
+
+def read_table(path, columns=None, memory_map=True):
+    if path.endswith('.arrow'):
+        return feather.read_table(path, columns=columns, memory_map=memory_map)
+    return pq.read_table(path, columns=columns, memory_map=memory_map)
+
+# Loads an artifact as a DataFrame. Only the requested columns are read from columnar
+# files; dictionary columns come back as plain strings unless categories=True.
+# csv_options are passed to pd.read_csv when the CSV is the file being read
+def read_artifact(path, columns=None, memory_map=True, categories=False, **csv_options):
+    resolved = resolve_artifact(path)
+    if resolved.endswith('.csv'):
+        df = pd.read_csv(resolved, usecols=columns, **csv_options)
+        return df[columns] if columns is not None else df
+
+    table = read_table(resolved, columns, memory_map)
+    if not categories:
+        table = decode_dictionaries(table)
+    return table.to_pandas()
+
+# Writes a DataFrame as a columnar artifact; csv_copy also keeps the CSV for tools that
+# only read CSV (Gephi) or for small files tracked in the repository
+def write_artifact(df, path, fmt='parquet', csv_copy=False, compression='zstd'):
+    paths = artifact_paths(path)
+    if csv_copy or not columnar_available():
+        df.to_csv(paths['csv'], sep=',', encoding='utf-8', index=False)
+        if not columnar_available():
+            return paths['csv']
+
+    # Written after the CSV copy, so that it is the newest file
+    table = encode_dictionaries(pa.Table.from_pandas(df, preserve_index=False))
+    if fmt == 'arrow':
+        feather.write_feather(table, paths['arrow'], compression='uncompressed')
+    elif fmt == 'parquet':
+        pq.write_table(table, paths['parquet'], compression=compression)
+    else:
+        raise ValueError(f"Unknown artifact format: {fmt}")
+    return paths[fmt]
+
+# Incremental writer for row batches (tuples) that do not fit in memory at once: each batch
+# becomes a Parquet row group, and the CSV copy is streamed alongside.
+# types maps columns to Arrow type names ('string', 'int64', ...); the other columns are
+# inferred. A column with only None values has no type yet: batches are held back until a
+# later one brings values (or PENDING_ROWS is reached, leaving it a string column), so that the
+# file schema is not fixed to null by the first batch
+PENDING_ROWS = 1_000_000
+
+class ArtifactWriter:
+    def __init__(self, path, columns, csv_copy=False, compression='zstd', types=None):
+        self.paths = artifact_paths(path)
+        self.columns = columns
+        self.compression = compression
+        self.types = types or {}
+        self.schema = None
+        self.parquet_writer = None
+        self.pending = []
+        self.rows_written = 0
+        self.columnar = columnar_available()
+
+        self.csv_file = None
+        if csv_copy or not self.columnar:
+            self.csv_file = open(self.paths['csv'], 'w', newline='')
+            self.csv_writer = csv.writer(self.csv_file, delimiter=',')
+            self.csv_writer.writerow(columns)
+
+    def to_table(self, rows):
+        arrays = [pa.array(values, type=pa.type_for_alias(self.types[name]) if name in self.types else None)
+                  for name, values in zip(self.columns, zip(*rows))]
+        return encode_dictionaries(pa.Table.from_arrays(arrays, names=self.columns))
+
+    # First non-null type of each column among the held back batches
+    def resolve_schema(self, force=False):
+        fields = []
+        for i, name in enumerate(self.columns):
+            types = [table.schema.field(i).type for table in self.pending]
+            resolved = next((t for t in types if not pa.types.is_null(t)), None)
+            if resolved is None:
+                if not force:
+                    return None
+                resolved = pa.string()
+            fields.append(pa.field(name, resolved))
+        return pa.schema(fields)
+
+    def flush_pending(self, force=False):
+        schema = self.resolve_schema(force)
+        if schema is None:
+            return
+        self.schema = schema
+        self.parquet_writer = pq.ParquetWriter(self.paths['parquet'], self.schema, compression=self.compression)
+        for table in self.pending:
+            self.parquet_writer.write_table(table.cast(self.schema))
+        self.pending = []
+
+    def write(self, rows):
+        if not rows:
+            return
+        if self.csv_file is not None:
+            self.csv_writer.writerows(rows)
+        if self.columnar:
+            table = self.to_table(rows)
+            if self.parquet_writer is None:
+                self.pending.append(table)
+                self.flush_pending(force=sum(t.num_rows for t in self.pending) >= PENDING_ROWS)
+            else:
+                # Later batches follow the schema of the file
+                self.parquet_writer.write_table(table.cast(self.schema))
+        self.rows_written += len(rows)
+
+    def close(self):
+        if self.csv_file is not None:
+            self.csv_file.close()
+        if self.columnar:
+            if self.pending:
+                self.flush_pending(force=True)
+            if self.parquet_writer is None:
+                # No rows: still leave a file with the header
+                empty = pa.table({name: pa.array([], pa.type_for_alias(self.types.get(name, 'string')))
+                                  for name in self.columns})
+                pq.write_table(empty, self.paths['parquet'], compression=self.compression)
+            else:
+                self.parquet_writer.close()
+        return self.rows_written
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+# Converts existing CSV artifacts (e.g. the ones produced by Gephi or by older runs)
+def main():
+    parser = argparse.ArgumentParser(description="Convert CSV hand-off files to columnar artifacts")
+    parser.add_argument('paths', nargs='+')
+    parser.add_argument('--format', choices=list(COLUMNAR_FORMATS), default='parquet')
+    args = parser.parse_args()
+
+    for path in args.paths:
+        df = pd.read_csv(artifact_paths(path)['csv'])
+        written = write_artifact(df, path, fmt=args.format)
+        print(f"{path} -> {written} ({len(df)} rows)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import pandas as pd
+
+from artifacts import read_artifact, write_artifact, artifact_paths
+
+# Loading time of a hand-off file shaped like cleaned_dataset.csv (the largest one, read by
+# every NLP notebook) through the current CSV path and through the columnar artifacts,
+# for a full load and for a two-column projection
+
+WORDS = [f"word{i}" for i in range(5000)]
+
+def synthetic_texts(num_rows, num_users, seed=42):
+    rng = random.Random(seed)
+
+    def text(length):
+        return ' '.join(rng.choice(WORDS) for _ in range(length))
+
+    rows = []
+    for i in range(num_rows):
+        clean = text(rng.randint(5, 60))
+        rows.append({
+            'author': f"user_{int(rng.paretovariate(1.2)) % num_users}",
+            'id': f"t1_{i:08x}",
+            'text': clean,
+            'type': 'comment' if rng.random() < 0.9 else 'post',
+            'date': f"2025-{rng.randint(1, 9):02d}-{rng.randint(1, 28):02d}T12:00:00+00:00",
+            'clean_text': clean,
+            'lemmatized_text': clean,
+        })
+    return pd.DataFrame(rows)
+
+def timed(load, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        df = load()
+        best = min(best, time.perf_counter() - start)
+    return best, df
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=500000)
+    parser.add_argument('--users', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    df = synthetic_texts(args.rows, args.users)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        base = os.path.join(tmp, 'cleaned_dataset.csv')
+        paths = artifact_paths(base)
+        arrow_path = artifact_paths(os.path.join(tmp, 'cleaned_dataset_ipc.csv'))['arrow']
+
+        df.to_csv(paths['csv'], sep=',', encoding='utf-8', index=False)
+        write_artifact(df, base, fmt='parquet')
+        write_artifact(df, arrow_path, fmt='arrow')
+
+        projection = ['author', 'id']
+        loaders = {
+            'csv (pd.read_csv)': (paths['csv'], lambda columns: pd.read_csv(paths['csv'], usecols=columns)),
+            'parquet': (paths['parquet'], lambda columns: read_artifact(paths['parquet'], columns)),
+            'arrow (mmap)': (arrow_path, lambda columns: read_artifact(arrow_path, columns)),
+        }
+
+        # The CSV has to be the older file for read_artifact to pick the columnar copies
+        old = time.time() - 60
+        os.utime(paths['csv'], (old, old))
+
+        print(f"{args.rows} rows, {len(df.columns)} columns\n")
+        print(f"{'format':<20}{'size MB':>10}{'full s':>10}{'speed-up':>10}{'2 cols s':>10}{'speed-up':>10}")
+        baseline = None
+        for name, (path, load) in loaders.items():
+            full_time, loaded = timed(lambda: load(None), args.repeat)
+            projected_time, _ = timed(lambda: load(projection), args.repeat)
+            assert len(loaded) == len(df) and list(loaded.columns) == list(df.columns)
+            if baseline is None:
+                baseline = (full_time, projected_time)
+            print(f"{name:<20}{os.path.getsize(path) / 2**20:>10.1f}{full_time:>10.2f}{baseline[0] / full_time:>9.1f}x"
+                  f"{projected_time:>10.2f}{baseline[1] / projected_time:>9.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import argparse
+import os
+import time
+from collections import defaultdict
+
+import numpy as np
+import torch
+
+from artifacts import read_artifact, resolve_artifact
+from graph_core import index_ids, coalesce_undirected
+from gnn_dataframe import build_graph
+
+# Timing and equivalence check of the vectorized edge_index/coalesce path of gnn_dataframe
+# against the previous implementation (dict lookups and a per-edge merge loop), on a synthetic
+# edge list and, when the artifacts are available, against the stored graph_data.pt
+
+# Previous implementation, returning the merged edges in insertion order and their float sums
+def legacy_coalesce(source, target, weight, node_ids):
+    user2idx = {uid: idx for idx, uid in enumerate(node_ids)}
+    edges_index = torch.tensor([
+        [user2idx[src] for src in source],
+        [user2idx[dst] for dst in target],
+    ], dtype=torch.long)
+    edges_weight = torch.tensor(weight, dtype=torch.float)
+
+    src_list = edges_index[0].tolist()
+    trg_list = edges_index[1].tolist()
+    w_list = edges_weight.tolist()
+
+    edge_dict = defaultdict(int)
+    for u, v, w in zip(src_list, trg_list, w_list):
+        key = tuple(sorted((u, v)))
+        edge_dict[key] += w
+    return list(edge_dict.keys()), list(edge_dict.values())
+
+def vectorized_coalesce(source, target, weight, node_ids):
+    src = index_ids(source, node_ids, 'sources')
+    dst = index_ids(target, node_ids, 'targets')
+    return coalesce_undirected(src, dst, weight, len(node_ids))
+
+def synthetic_edges(num_nodes, num_edges, seed=42):
+    rng = np.random.default_rng(seed)
+    node_ids = np.array([f"user_{i}" for i in range(num_nodes)], dtype=object)
+    # Skewed endpoints, so that repeated and reversed pairs are common
+    src = np.minimum(rng.zipf(1.5, num_edges) - 1, num_nodes - 1)
+    dst = rng.integers(0, num_nodes, num_edges)
+    weight = rng.random(num_edges).astype(np.float32)
+    return node_ids, node_ids[src], node_ids[dst], weight
+
+def check_equivalence(legacy, vectorized):
+    legacy_edges, legacy_weights = legacy
+    edge_index, edge_weight = vectorized
+
+    order = sorted(range(len(legacy_edges)), key=legacy_edges.__getitem__)
+    expected_index = np.array([legacy_edges[i] for i in order], dtype=np.int64).T.reshape(2, -1)
+    expected_weight = np.array([legacy_weights[i] for i in order])
+
+    assert np.array_equal(edge_index, expected_index), "edge_index differs"
+    assert np.array_equal(edge_weight, expected_weight), "summed weights differ"
+    # The old output truncated the sums with an integer cast
+    assert np.array_equal(torch.tensor(edge_weight).int().numpy(), torch.tensor(expected_weight).int().numpy())
+
+# Rebuilds the graph from the current artifacts and compares it with the saved one
+def check_saved_graph(path):
+    saved = torch.load(path, weights_only=False)
+    nodes = read_artifact('src/data/statistical_nodes.csv')
+    edges = read_artifact('src/data/edges.csv', columns=['source', 'target', 'weight'])
+    data, idx2user = build_graph(nodes, edges)
+    old = saved['data']
+
+    assert idx2user == saved['idx2user'], "node order differs"
+    assert torch.allclose(data.x, old.x), "node features differ"
+
+    old_pairs = dict(zip(map(tuple, old.edge_index.t().tolist()), old.edge_weight.tolist()))
+    new_pairs = dict(zip(map(tuple, data.edge_index.t().tolist()), data.edge_weight.tolist()))
+    assert old_pairs.keys() == new_pairs.keys(), "edges differ"
+    # Saved weights are the truncated sums (the float32 rounding of the new ones aside)
+    assert all(old_pairs[pair] - 1e-6 <= w < old_pairs[pair] + 1 + 1e-6 for pair, w in new_pairs.items()), "weights differ"
+    truncated = sum(1 for pair, w in new_pairs.items() if old_pairs[pair] == 0 and w > 0)
+    print(f"{path}: {len(new_pairs)} edges match ({truncated} nonzero weights had been truncated to 0)")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nodes', type=int, default=100000)
+    parser.add_argument('--edges', type=int, nargs='+', default=[100000, 1000000, 10000000])
+    parser.add_argument('--legacy-max', type=int, default=1000000, help="Skip the legacy loop above this many edges")
+    args = parser.parse_args()
+
+    print(f"{'edges':>12}{'legacy s':>10}{'vectorized s':>14}{'speed-up':>10}{'merged':>12}")
+    for num_edges in args.edges:
+        node_ids, source, target, weight = synthetic_edges(args.nodes, num_edges)
+
+        start = time.perf_counter()
+        vectorized = vectorized_coalesce(source, target, weight, node_ids)
+        new_time = time.perf_counter() - start
+
+        if num_edges <= args.legacy_max:
+            start = time.perf_counter()
+            legacy = legacy_coalesce(source, target, weight, node_ids)
+            old_time = time.perf_counter() - start
+            check_equivalence(legacy, vectorized)
+            print(f"{num_edges:>12}{old_time:>10.2f}{new_time:>14.2f}{old_time / new_time:>9.1f}x{vectorized[1].size:>12}")
+        else:
+            print(f"{num_edges:>12}{'-':>10}{new_time:>14.2f}{'-':>10}{vectorized[1].size:>12}")
+
+    saved_path = 'src/data/graph_data.pt'
+    try:
+        resolve_artifact('src/data/edges.csv')
+    except FileNotFoundError:
+        print(f"No edges artifact: skipping the comparison with {saved_path}")
+        return
+    if os.path.exists(saved_path):
+        check_saved_graph(saved_path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scraping_functions'))
+from schema import migrate_schema
+from csv_query_converter import (
+    ENGAGEMENT_DELTA_QUERY, POST_COMMENT_PAIRS, COMMENT_COMMENT_PAIRS, RECOUNT_ENGAGEMENT_QUERY, ingest_watermarks
+)
+
+# EXPLAIN QUERY PLAN check and timing of the graph-construction queries on a synthetic
+# database, before (legacy schema, SUBSTR self-join) and after the v1 schema migration.
+# The current queries are run as a full build, i.e. over the ingest_seq window (0, max].
+# The (author, date, num_*) indexes do not serve the full build: they serve the incremental
+# engagement recount of the authors touched by a delta, timed last with the indexes and after
+# dropping them, together with the cost of the indexes on a bulk insert of new comments
+
+LEGACY_ENGAGEMENT_QUERY = '''
+    SELECT author, COUNT(*) AS engagement
+    FROM(
+        SELECT p.author FROM posts AS p
+        WHERE p.author <> '[deleted]' AND p.num_comments <> 0 AND p.date >= '2025-01-01'
+        UNION ALL
+        SELECT c.author FROM comments AS c
+        WHERE c.author <> '[deleted]' AND c.num_replies <> 0 AND c.date >= '2025-01-01'
+    ) GROUP BY author
+'''
+
+LEGACY_POST_COMMENT_EDGES_QUERY = '''
+    SELECT p.author AS src, c.author as dst, COUNT(*) as weight
+    FROM posts AS p
+    JOIN comments AS c ON p.id = c.post_id
+    GROUP BY p.author, c.author
+    HAVING (p.author <> '[deleted]' AND c.author <> '[deleted]')
+        AND (p.author <> c.author)
+        AND (p.text <> '[removed]' AND c.text <> '[removed]')
+        AND (p.date >= '2025-01-01' AND c.date >= '2025-01-01')
+'''
+
+LEGACY_COMMENT_COMMENT_EDGES_QUERY = '''
+    SELECT c1.author AS src, c2.author AS dst, COUNT(*) as weight
+    FROM comments c1
+    JOIN comments c2 ON SUBSTR(c1.parent_id, 4) = c2.comment_id
+    WHERE c1.author <> '[deleted]' AND c2.author <> '[deleted]'
+        AND c1.text <> '[removed]' AND c2.text <> '[removed]'
+        AND c1.author <> c2.author AND c1.parent_id LIKE 't1_%'
+        AND c1.date >= '2025-01-01' AND c2.date >= '2025-01-01'
+    GROUP BY c1.author, c2.author
+'''
+
+NEW_QUERIES = {
+    'engagement': ENGAGEMENT_DELTA_QUERY,
+    'post→comment': f"SELECT src, dst, COUNT(*) FROM ({POST_COMMENT_PAIRS}) GROUP BY src, dst",
+    'comment→comment': f"SELECT src, dst, COUNT(*) FROM ({COMMENT_COMMENT_PAIRS}) GROUP BY src, dst",
+}
+
+# Schema as it was before the migration (no parent_comment_id, no secondary indexes)
+def create_legacy_tables(conn):
+    conn.execute('''
+        CREATE TABLE posts(
+            id TEXT PRIMARY KEY, subreddit TEXT, author TEXT, title TEXT, date TEXT,
+            text TEXT, num_comments INTEGER, score INTEGER, upvote_ratio REAL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE comments(
+            post_id TEXT, comment_id TEXT PRIMARY KEY, text TEXT, author TEXT, date TEXT,
+            parent_id TEXT, depth INTEGER, num_replies INTEGER, score INTEGER,
+            FOREIGN KEY (post_id) REFERENCES posts(id)
+        )
+    ''')
+    conn.execute('CREATE TABLE scraping_state (subreddit TEXT PRIMARY KEY, newest_processed_utc REAL)')
+    conn.commit()
+
+def iso(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat()
+
+def populate(conn, num_comments, num_users, comments_per_post=50, seed=42, chunk=50000):
+    rng = random.Random(seed)
+    num_posts = max(1, num_comments // comments_per_post)
+    start_ts = 1.72e9  # late 2024, so that the date filter drops part of the rows
+    span = 3.6e7
+
+    def author():
+        return '[deleted]' if rng.random() < 0.03 else f"user_{int(rng.paretovariate(1.2)) % num_users}"
+
+    posts = [
+        (f"p{i}", 'synthetic', author(), 'title', iso(start_ts + span * i / num_posts),
+         '[removed]' if rng.random() < 0.02 else 'body', rng.randint(0, 200), 1, 0.9)
+        for i in range(num_posts)
+    ]
+    conn.executemany('INSERT INTO posts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', posts)
+
+    rows = []
+    for i in range(num_comments):
+        post_index = i // comments_per_post
+        first_in_post = post_index * comments_per_post
+        parent = (f"t1_c{rng.randint(first_in_post, i - 1)}"
+                  if i > first_in_post and rng.random() < 0.6 else f"t3_p{post_index}")
+        rows.append((
+            f"p{post_index}", f"c{i}", '[removed]' if rng.random() < 0.02 else 'text', author(),
+            iso(start_ts + span * post_index / num_posts + i % comments_per_post),
+            parent, 0, rng.randint(0, 3), 1
+        ))
+        if len(rows) >= chunk:
+            conn.executemany('INSERT INTO comments VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            rows.clear()
+    conn.executemany('INSERT INTO comments VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+    conn.commit()
+
+def full_build_params(conn):
+    new_posts, new_comments = ingest_watermarks(conn)
+    return {
+        'old_posts': 0, 'new_posts': new_posts,
+        'old_comments': 0, 'new_comments': new_comments,
+        'since': '2025-01-01',
+    }
+
+def timed(conn, query, params=()):
+    start = time.perf_counter()
+    rows = conn.execute(query, params).fetchall()
+    return time.perf_counter() - start, len(rows)
+
+def query_plan(conn, query, params=()):
+    return [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + query, params)]
+
+def timed_insert(conn, label, num_rows, num_users, seed=7):
+    rng = random.Random(seed)
+    num_posts = conn.execute('SELECT COUNT(*) FROM posts').fetchone()[0]
+    rows = [
+        (f"p{rng.randrange(num_posts)}", f"{label}{i}", 'text', f"user_{int(rng.paretovariate(1.2)) % num_users}",
+         iso(1.75e9 + i), f"t3_p0", 0, rng.randint(0, 3), 1)
+        for i in range(num_rows)
+    ]
+    start = time.perf_counter()
+    conn.executemany('''
+        INSERT INTO comments (post_id, comment_id, text, author, date, parent_id, depth, num_replies, score)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    conn.commit()
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--comments', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=50000)
+    parser.add_argument('--db', default=None, help="Keep the synthetic database at this path")
+    parser.add_argument('--touched', type=int, default=100, help="Authors recounted by the incremental benchmark")
+    parser.add_argument('--insert-rows', type=int, default=50000, help="Comments of the bulk insert benchmark")
+    args = parser.parse_args()
+
+    tmp = None
+    if args.db is None:
+        tmp = tempfile.TemporaryDirectory()
+        args.db = os.path.join(tmp.name, 'bench.db')
+
+    # No statement cache: plans are explained again after the indexes are dropped
+    conn = sqlite3.connect(args.db, cached_statements=0)
+    create_legacy_tables(conn)
+
+    start = time.perf_counter()
+    populate(conn, args.comments, args.users)
+    print(f"Synthetic database: {args.comments} comments in {time.perf_counter() - start:.1f} s")
+
+    legacy_queries = {
+        'engagement': LEGACY_ENGAGEMENT_QUERY,
+        'post→comment': LEGACY_POST_COMMENT_EDGES_QUERY,
+        'comment→comment': LEGACY_COMMENT_COMMENT_EDGES_QUERY,
+    }
+    legacy_plans = {name: query_plan(conn, query) for name, query in legacy_queries.items()}
+    legacy = {name: timed(conn, query) for name, query in legacy_queries.items()}
+
+    start = time.perf_counter()
+    migrate_schema(conn)
+    print(f"Migration (column backfill + indexes): {time.perf_counter() - start:.1f} s\n")
+
+    # A plan passes when every table access goes through an index: no bare SCAN of a table
+    # and no AUTOMATIC index built at query time
+    failed = False
+    print("=== EXPLAIN QUERY PLAN ===")
+    params = full_build_params(conn)
+    new_plans = {name: query_plan(conn, query, params) for name, query in NEW_QUERIES.items()}
+    for label, plans in (('legacy', legacy_plans), ('indexed', new_plans)):
+        for name, plan in plans.items():
+            unindexed = [step for step in plan if 'AUTOMATIC' in step
+                         or (step.startswith('SCAN ') and 'INDEX' not in step and 'subquery' not in step)]
+            # The driving table of a join is read once in full by design; only the inner side must be indexed
+            ok = len(unindexed) <= (1 if plan and plan[0] in unindexed and len(plan) > 1 else 0)
+            if label == 'indexed':
+                failed |= not ok
+            print(f"[{'OK' if ok else 'SLOW'}] {label} {name}")
+            for step in plan:
+                print(f"      {step}")
+
+    print("\n=== Timing ===")
+    print(f"{'query':<18}{'legacy s':>10}{'rows':>10}{'indexed s':>12}{'rows':>10}{'speed-up':>10}")
+    for name, query in NEW_QUERIES.items():
+        old_time, old_rows = legacy[name]
+        new_time, new_rows = timed(conn, query, params)
+        print(f"{name:<18}{old_time:>10.2f}{old_rows:>10}{new_time:>12.2f}{new_rows:>10}{old_time / new_time:>9.1f}x")
+
+    authors = sorted(row[0] for row in conn.execute("SELECT DISTINCT author FROM comments WHERE author <> '[deleted]'"))
+    conn.execute('CREATE TEMP TABLE touched_authors (author TEXT PRIMARY KEY)')
+    conn.executemany('INSERT INTO touched_authors VALUES (?)',
+                     [(a,) for a in random.Random(0).sample(authors, min(args.touched, len(authors)))])
+    print(f"\n=== Incremental engagement recount ({args.touched} authors) and bulk insert ({args.insert_rows} comments) ===")
+    results = {}
+    for label in ('indexed', 'no author index'):
+        if label != 'indexed':
+            conn.execute('DROP INDEX idx_comments_author_date')
+            conn.execute('DROP INDEX idx_posts_author_date')
+        params = full_build_params(conn)
+        print(f"[{label}]")
+        for step in query_plan(conn, RECOUNT_ENGAGEMENT_QUERY, params):
+            print(f"      {step}")
+        recount_time, _ = timed(conn, RECOUNT_ENGAGEMENT_QUERY, params)
+        insert_time = timed_insert(conn, 'x' if label == 'indexed' else 'y', args.insert_rows, args.users)
+        results[label] = (recount_time, insert_time)
+
+    print(f"{'':<18}{'recount s':>10}{'insert s':>10}")
+    for label, (recount_time, insert_time) in results.items():
+        print(f"{label:<18}{recount_time:>10.3f}{insert_time:>10.2f}")
+
+    conn.close()
+    if tmp is not None:
+        tmp.cleanup()
+
+    # Legacy post→comment filtered after GROUP BY (on an arbitrary row of each group), so its row count may differ
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import json
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import StandardScaler
+from sklearn.cluster import KMeans
+
+# Metrics of all the communities of a partition at once. Every node carries an integer
+# community code (-1 when unassigned) and each edge of the CSR graph is classified as inside or
+# cut by comparing the codes of its endpoints; the per-community sums are then bincounts, so
+# the cost is a few passes over the edge list whatever the number of communities.
+# The definitions are the ones of the subclustering notebooks:
+#   density          2 * edges_inside / (n * (n - 1))
+#   conductance      edges_cut / (2 * edges_inside + edges_cut), as cdlib's conductance
+#   modularity_gain  edges_inside / (edges_inside + edges_cut)
+#   modularity       edges_inside / m - (degree_sum / 2m)^2, summing to the Newman-Girvan score
+
+CATEGORY_NAMES = ["Weak", "Moderate", "Strong", "Very Strong"]
+
+# Node codes from a list of communities (lists of node indices, as returned by cdlib)
+def community_codes(communities, num_nodes):
+    codes = np.full(num_nodes, -1, dtype=np.int64)
+    for k, members in enumerate(communities):
+        codes[np.asarray(members, dtype=np.int64)] = k
+    return codes
+
+def community_metrics(graph, codes, num_communities=None):
+    k = num_communities if num_communities is not None else int(codes.max()) + 1
+    zeros = np.zeros(k)
+
+    u, v, _ = graph.edge_list()
+    cu, cv = codes[u], codes[v]
+    inside = (cu == cv) & (cu >= 0)
+    edges_inside = np.bincount(cu[inside], minlength=k)
+    # A cut edge counts once for the community of each endpoint
+    edges_cut = (np.bincount(cu[~inside & (cu >= 0)], minlength=k)
+                 + np.bincount(cv[~inside & (cv >= 0)], minlength=k))
+
+    assigned = codes >= 0
+    num_users = np.bincount(codes[assigned], minlength=k)
+    degree_sum = np.bincount(codes[assigned], weights=graph.degree()[assigned], minlength=k)
+    m = graph.num_edges
+
+    pairs = num_users * (num_users - 1)
+    volume = 2 * edges_inside + edges_cut
+    return pd.DataFrame({
+        'id': np.arange(k),
+        'num_users': num_users,
+        'density': np.divide(2 * edges_inside, pairs, out=zeros.copy(), where=pairs > 0),
+        'conductance': np.divide(edges_cut, volume, out=zeros.copy(), where=volume > 0),
+        'modularity_gain': edges_inside / (edges_inside + edges_cut + 1e-9),
+        'edges_inside': edges_inside,
+        'edges_cut': edges_cut,
+        'modularity': edges_inside / m - (degree_sum / (2 * m)) ** 2 if m else zeros.copy(),
+    })
+
+# (x - mean) / (std + 1e-9) within each group, with the sample std as pandas computes it.
+# NaN for nodes outside any group (code -1) and for single-node groups
+def group_zscore(values, codes):
+    values = np.asarray(values, dtype=np.float64)
+    valid = codes >= 0
+    k = int(codes.max()) + 1 if valid.any() else 0
+    counts = np.bincount(codes[valid], minlength=k)
+    means = np.bincount(codes[valid], weights=values[valid], minlength=k) / np.maximum(counts, 1)
+    squares = np.bincount(codes[valid], weights=(values[valid] - means[codes[valid]]) ** 2, minlength=k)
+    stds = np.sqrt(np.divide(squares, counts - 1, out=np.full(k, np.nan), where=counts > 1))
+
+    z = np.full(len(values), np.nan)
+    z[valid] = (values[valid] - means[codes[valid]]) / (stds[codes[valid]] + 1e-9)
+    return z
+
+# numpy's linear percentile within each group, broadcast back to the nodes; groups with
+# fewer than min_size members take their maximum instead
+def group_percentile(values, codes, q, min_size=1):
+    values = np.asarray(values, dtype=np.float64)
+    valid = codes >= 0
+    k = int(codes.max()) + 1 if valid.any() else 0
+
+    group = codes[valid]
+    order = np.lexsort((values[valid], group))
+    ordered = values[valid][order]
+    sizes = np.bincount(group, minlength=k)
+    starts = np.cumsum(sizes) - sizes
+
+    result = np.full(k, np.nan)
+    present = sizes > 0
+    h = (q / 100) * (sizes[present] - 1)
+    lo = np.floor(h).astype(np.int64)
+    hi = np.minimum(lo + 1, sizes[present] - 1)
+    a = ordered[starts[present] + lo]
+    b = ordered[starts[present] + hi]
+    t = h - lo
+    # numpy's lerp
+    result[present] = np.where(t < 0.5, a + (b - a) * t, b - (b - a) * (1 - t))
+
+    small = present & (sizes < min_size)
+    result[small] = ordered[starts[small] + sizes[small] - 1]
+
+    per_node = np.full(len(values), np.nan)
+    per_node[valid] = result[group]
+    return per_node
+
+# KMeans over the community metrics, categories named by increasing mean inverse conductance
+def categorize_communities(df, n_clusters=4, random_state=42):
+    df = df.copy()
+    df["inv_conductance"] = 1 - df["conductance"]
+    features = df[["density", "num_users", "modularity_gain", "inv_conductance"]]
+
+    X = StandardScaler().fit_transform(features)
+
+    # Automatic clustering based on score metric
+    kmeans = KMeans(n_clusters=n_clusters, random_state=random_state, n_init=10)
+    df["category"] = kmeans.fit_predict(X)
+    df["cluster_score"] = kmeans.transform(X).min(axis=1)
+
+    order = df.groupby("category")["inv_conductance"].mean().sort_values().index
+    cat_map = {cat: name for cat, name in zip(order, CATEGORY_NAMES)}
+    df["category_name"] = df["category"].map(cat_map)
+    return df
+
+# cluster_tree_base.json content; users[k] are the user ids of community k
+def cluster_tree_base(df, users):
+    tree = {}
+    for row in df.to_dict("records"):
+        tree[str(row["id"])] = {
+            "users": [str(u) for u in users[row["id"]]],
+            "type": row["category_name"],
+            "conductance": float(row["conductance"]),
+            "internal_density": float(row["density"]),
+            "edges_inside": int(row["edges_inside"]),
+            "edges_cut": int(row["edges_cut"]),
+            "modularity_gain": float(row["modularity_gain"]),
+            "num_users": int(row["num_users"]),
+            "cluster_score": float(row["cluster_score"])
+        }
+        # Optional: changed (incremental runs, False when the members are the same as in the
+        # previous tree) and stability (consensus runs)
+        for key, cast in (("changed", bool), ("stability", float)):
+            if key in row:
+                tree[str(row["id"])][key] = cast(row[key])
+    return tree
+
+def write_cluster_tree(tree, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(tree, f, indent=4, ensure_ascii=False)
@@ -0,0 +1,152 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+
+from artifacts import write_artifact
+from graph_core import load_graph
+from community_metrics import community_metrics, categorize_communities, cluster_tree_base, write_cluster_tree
+from incremental_communities import ALGORITHMS, run_algorithm, load_tree, previous_codes, match_ids
+
+# Robustness sweep of the community detection: every (algorithm, seed) pair runs in a worker
+# process. Each worker builds the igraph graph once from the shared CSR graph and keeps it for
+# all its runs; only the membership vectors travel back.
+# The consensus partition is built from how often the endpoints of each edge share a community.
+# The stability of a consensus community is the mean, over the runs, of its best Jaccard
+# overlap with a community of that run (1 when every run reproduces it exactly)
+
+_graph = None
+
+def _init_worker(graph):
+    global _graph
+    _graph = graph.to_igraph(names=False)
+    # Unweighted, as in the subclustering notebooks
+    del _graph.es['weight']
+
+def _run(task):
+    algorithm, seed, resolution = task
+    start = time.perf_counter()
+    membership = run_algorithm(_graph, algorithm, resolution=resolution, seed=seed)
+    return algorithm, seed, membership, time.perf_counter() - start
+
+def run_sweep(graph, algorithms=ALGORITHMS, seeds=8, resolution=1, workers=None):
+    workers = workers or os.cpu_count() or 1
+    tasks = [(algorithm, seed, resolution) for algorithm in algorithms for seed in range(seeds)]
+
+    if workers == 1:
+        _init_worker(graph)
+        return [_run(task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(graph,)) as executor:
+        return list(executor.map(_run, tasks))
+
+def run_summary(graph, runs):
+    records = []
+    for algorithm, seed, membership, seconds in runs:
+        df = community_metrics(graph, membership)
+        records.append({
+            'algorithm': algorithm,
+            'seed': seed,
+            'num_communities': len(df),
+            'modularity': df['modularity'].sum(),
+            # Conductance of the average node's community
+            'conductance': np.average(df['conductance'], weights=df['num_users']),
+            'seconds': seconds
+        })
+    return pd.DataFrame(records)
+
+# Fraction of the memberships that put the endpoints of each edge in the same community
+def edge_agreement(u, v, memberships):
+    agreement = np.zeros(len(u))
+    for membership in memberships:
+        agreement += membership[u] == membership[v]
+    return agreement / len(memberships)
+
+# Consensus clustering (Lancichinetti-Fortunato): the edges on which at least `threshold` of the
+# runs agree, weighted by that agreement, are clustered again with Leiden `runs` times, until
+# the re-runs agree on every remaining edge. The communities are then the connected components
+def consensus_partition(graph, memberships, threshold=0.5, runs=10, max_iter=10, seed=0):
+    import igraph as ig
+    u, v, _ = graph.edge_list()
+    agreement = edge_agreement(u, v, memberships)
+
+    for _ in range(max_iter):
+        keep = agreement >= threshold
+        u, v, agreement = u[keep], v[keep], agreement[keep]
+        if (agreement == 1).all():
+            break
+        g = ig.Graph(n=graph.num_nodes, edges=np.column_stack([u, v]), directed=False)
+        g.es['weight'] = agreement
+        agreement = edge_agreement(u, v, [run_algorithm(g, 'leiden', seed=seed + i) for i in range(runs)])
+
+    keep = agreement >= threshold
+    kept = sparse.coo_matrix((np.ones(keep.sum()), (u[keep], v[keep])), shape=(graph.num_nodes, graph.num_nodes))
+    _, codes = connected_components(kept, directed=False)
+    return codes.astype(np.int64)
+
+def community_stability(codes, memberships):
+    k = int(codes.max()) + 1
+    sizes = np.bincount(codes, minlength=k)
+    stability = np.zeros(k)
+    for membership in memberships:
+        run_sizes = np.bincount(membership)
+        m = len(run_sizes)
+        pairs, overlap = np.unique(codes * m + membership, return_counts=True)
+        c, r = pairs // m, pairs % m
+        jaccard = overlap / (sizes[c] + run_sizes[r] - overlap)
+        best = np.zeros(k)
+        np.maximum.at(best, c, jaccard)
+        stability += best
+    return stability / len(memberships)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--edges', default='src/data/edges.csv')
+    parser.add_argument('--nodes', default='src/data/statistical_nodes.csv')
+    parser.add_argument('--algorithms', nargs='+', choices=ALGORITHMS, default=ALGORITHMS)
+    parser.add_argument('--seeds', type=int, default=8, help="Runs per algorithm, seeded 0..seeds-1")
+    parser.add_argument('--resolution', type=float, default=1, help="Leiden modularity resolution")
+    parser.add_argument('--threshold', type=float, default=0.5, help="Share of runs agreeing on an edge to keep it in the consensus")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--output-dir', default='src/graph_dir/consensus_dir')
+    args = parser.parse_args()
+
+    graph = load_graph(args.edges, args.nodes)
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    runs = run_sweep(graph, args.algorithms, args.seeds, args.resolution, args.workers)
+    elapsed = time.perf_counter() - start
+
+    summary = run_summary(graph, runs)
+    write_artifact(summary, os.path.join(args.output_dir, 'runs.csv'), csv_copy=True)
+    print(summary.groupby('algorithm')[['num_communities', 'modularity', 'conductance', 'seconds']]
+          .agg(['mean', 'std', 'min', 'max']).round(4).T)
+    print(f"{len(runs)} runs in {elapsed:.2f}s ({summary['seconds'].sum():.2f}s of run time)")
+
+    memberships = [membership for _, _, membership, _ in runs]
+    codes = consensus_partition(graph, memberships, args.threshold)
+    df = community_metrics(graph, codes)
+    df['stability'] = community_stability(codes, memberships)
+    modularity_score = df['modularity'].sum()
+    df = categorize_communities(df)
+
+    # Ids matched to the previous consensus, as in the subclustering notebooks
+    tree_path = os.path.join(args.output_dir, 'cluster_tree_base.json')
+    if os.path.exists(tree_path):
+        old_codes, old_ids = previous_codes(graph, load_tree(tree_path))
+        df['id'], unchanged = match_ids(codes, old_codes, old_ids)
+        df['changed'] = ~unchanged
+    members = {comm_id: graph.ids[codes == k] for k, comm_id in enumerate(df['id'])}
+    write_cluster_tree(cluster_tree_base(df, members), tree_path)
+
+    print(f"Consensus: {len(df)} communities, modularity {modularity_score:.4f}, "
+          f"{int((df['num_users'] == 1).sum())} singletons")
+    print(f"Stability (weighted by size): {np.average(df['stability'], weights=df['num_users']):.3f}")
+
+if __name__ == "__main__":
+    main()
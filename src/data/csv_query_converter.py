@@ -1,116 +1,422 @@
 import sqlite3
-import csv
-from collections import Counter, defaultdict
+import argparse
+import sys
+import os
+from collections import Counter
 import math
 import numpy as np
 
-# Database connection
-connection = sqlite3.connect('reddit-posts.db')
-cursor = connection.cursor()
+# Schema (parent_comment_id column and indexes) is shared with the scrapers
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scraping_functions'))
+from schema import create_tables
+from artifacts import ArtifactWriter
 
-# User retrieval and engagement computation
-cursor.execute('''
+# Interactions are folded into materialized tables one delta at a time. A delta is the ingest_seq
+# window (old, new] of posts/comments inserted since the previous build, tracked in graph_state
+# the same way scraping_state tracks newest_processed_utc. Window (0, max] is a full build.
+# Engagement also depends on reply counts, which can change after insertion: the authors of new
+# rows and the authors logged in engagement_changes are recounted, so that an incremental build
+# ends up with the same tables as a rebuild
+SINCE_DATE = '2025-01-01'
+
+def create_graph_tables(conn):
+    c = conn.cursor()
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS user_engagement (
+            author TEXT PRIMARY KEY,
+            engagement INTEGER
+        )
+    ''')
+
+    # Undirected pairs stored once with src < dst, raw interaction counts
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS user_interactions (
+            src TEXT,
+            dst TEXT,
+            weight INTEGER,
+            PRIMARY KEY (src, dst)
+        ) WITHOUT ROWID
+    ''')
+
+    # Watermarks were rowids before schema v2: such a state is dropped, forcing one full build
+    columns = {row[1] for row in c.execute('PRAGMA table_info(graph_state)')}
+    if columns and 'posts_seq' not in columns:
+        c.execute('DROP TABLE graph_state')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS graph_state (
+            name TEXT PRIMARY KEY,
+            since_date TEXT,
+            posts_seq INTEGER,
+            comments_seq INTEGER
+        )
+    ''')
+
+    conn.commit()
+
+# User retrieval and engagement computation: one row per engaging post/comment
+ENGAGEMENT_ROWS = '''
+    SELECT p.author, p.date
+    FROM posts AS p
+    WHERE p.ingest_seq > :old_posts AND p.ingest_seq <= :new_posts
+        AND p.author <> '[deleted]' AND p.num_comments <> 0 AND p.date >= :since
+    UNION ALL
+    SELECT c.author, c.date
+    FROM comments AS c
+    WHERE c.ingest_seq > :old_comments AND c.ingest_seq <= :new_comments
+        AND c.author <> '[deleted]' AND c.num_replies <> 0 AND c.date >= :since
+'''
+
+ENGAGEMENT_DELTA_QUERY = f'''
     SELECT author, COUNT(*) AS engagement
-    FROM(
-        SELECT p.author
-        FROM posts AS p
-        WHERE p.author <> '[deleted]' AND p.num_comments <> 0 AND p.date >= '2025-01-01'
-        UNION ALL
-        SELECT c.author
-        FROM comments AS c
-        WHERE c.author <> '[deleted]' AND c.num_replies <> 0 AND c.date >= '2025-01-01'
-    ) GROUP BY author
-''')
-
-distinct_users = cursor.fetchall()
-all_users = {user: count for user, count in distinct_users}
-
-# Computing engagement value distribuition
-engagement_values = np.array(list(all_users.values()))
-
-# Cutoff
-engagement_cutoff = np.quantile(engagement_values, 0.8)  # keepin 20% most active users
-print(f"Engagement threshold: {engagement_cutoff}")
-valid_users = {user for user, count in all_users.items() if count >= engagement_cutoff}
-print(f"Users after engagement filter: {len(valid_users)}")
-
-# Edges post→comment
-cursor.execute('''
-    SELECT p.author AS src, c.author as dst, COUNT(*) as weight
+    FROM({ENGAGEMENT_ROWS}) GROUP BY author
+'''
+
+# Pairs post→comment: a pair is new when its comment is new, or when its post is new
+# and the comment was already there (e.g. comments imported before their post).
+# The second branch is skipped as a whole on full builds (:old_comments = 0).
+# Pairs carry the date of both sides for the temporal snapshots
+POST_COMMENT_PAIRS = '''
+    SELECT p.author AS src, c.author AS dst, p.date AS parent_date, c.date AS child_date
+    FROM comments AS c
+    JOIN posts AS p ON p.id = c.post_id
+    WHERE c.ingest_seq > :old_comments AND c.ingest_seq <= :new_comments AND p.ingest_seq <= :new_posts
+        AND p.author <> '[deleted]' AND c.author <> '[deleted]'
+        AND p.author <> c.author
+        AND p.text <> '[removed]' AND c.text <> '[removed]'
+        AND p.date >= :since AND c.date >= :since
+    UNION ALL
+    SELECT p.author AS src, c.author AS dst, p.date AS parent_date, c.date AS child_date
     FROM posts AS p
-    JOIN comments AS c ON p.id = c.post_id
-    GROUP BY p.author, c.author
-    HAVING (p.author <> '[deleted]' AND c.author <> '[deleted]')
-        AND (p.author <> c.author)
-        AND (p.text <> '[removed]' AND c.text <> '[removed]')
-        AND (p.date >= '2025-01-01' AND c.date >= '2025-01-01') 
-''')
-edges_type_ac = cursor.fetchall()
-
-# Edges comment→comment
-cursor.execute('''
-    SELECT 
-        c1.author AS src, 
-        c2.author AS dst, 
-        COUNT(*) as weight
+    JOIN comments AS c ON c.post_id = p.id
+    WHERE :old_comments > 0 AND p.ingest_seq > :old_posts AND p.ingest_seq <= :new_posts AND c.ingest_seq <= :old_comments
+        AND p.author <> '[deleted]' AND c.author <> '[deleted]'
+        AND p.author <> c.author
+        AND p.text <> '[removed]' AND c.text <> '[removed]'
+        AND p.date >= :since AND c.date >= :since
+'''
+
+# Pairs comment→comment: new replies (c1) join their parent through the primary key,
+# new parents (c2) join their older replies through idx_comments_parent_comment
+COMMENT_COMMENT_PAIRS = '''
+    SELECT c1.author AS src, c2.author AS dst, c2.date AS parent_date, c1.date AS child_date
     FROM comments c1
-    JOIN comments c2 ON SUBSTR(c1.parent_id, 4) = c2.comment_id
-    WHERE c1.author <> '[deleted]' AND c2.author <> '[deleted]'
+    JOIN comments c2 ON c2.comment_id = c1.parent_comment_id
+    WHERE c1.ingest_seq > :old_comments AND c1.ingest_seq <= :new_comments AND c2.ingest_seq <= :new_comments
+        AND c1.author <> '[deleted]' AND c2.author <> '[deleted]'
         AND c1.text <> '[removed]' AND c2.text <> '[removed]'
-        AND c1.author <> c2.author AND c1.parent_id LIKE 't1_%'
-        AND c1.date >= '2025-01-01' AND c2.date >= '2025-01-01'
-    GROUP BY c1.author, c2.author
-''')
-edges_type_cc = cursor.fetchall()
-
-print(f"Total edges: {len(edges_type_cc) + len(edges_type_ac)}")
-
-# Filtering valid users
-filtered_edges = [
-    (src, dst, weight) for src, dst, weight in edges_type_ac + edges_type_cc
-    if src in valid_users and dst in valid_users
-]
-
-print(f"Edges after user filter: {len(filtered_edges)}")
-
-# Making edges undirectioned
-edge_dict = defaultdict(int)
-for src, dst, w in filtered_edges:
-    u, v = sorted([src, dst]) 
-    edge_dict[(u, v)] += w
-
-# Normalizzazione log(1+w)
-final_edges = [(u, v, math.log1p(w)) for (u, v), w in edge_dict.items()]
-print(f"Unique undirected edges: {len(final_edges)}")
-
-# Computing degree value distribuition
-degree_counter = Counter()
-for u, v, w in final_edges:
-    degree_counter[u] += 1
-    degree_counter[v] += 1
-
-degree_values = np.array([deg for user, deg in degree_counter.items()])
-
-# Cutoff
-degree_cutoff = np.quantile(degree_values, 0.5)
-print(f"Degree threshold: {degree_cutoff}")
-final_users = {user for user in valid_users if degree_counter[user] >= degree_cutoff}
-
-final_edges = [(u, v, w) for u, v, w in final_edges if u in final_users and v in final_users]
-final_nodes = [(user, all_users[user]) for user in final_users]
-
-print(f"Final filtered users: {len(final_nodes)}")
-print(f"Final edges count: {len(final_edges)}")
-
-# CSV saving process
-with open('src/data/nodes.csv', 'w') as csv_file:
-    writer = csv.writer(csv_file, delimiter=',')
-    writer.writerow(['id', 'engagement'])
-    writer.writerows(final_nodes)
-
-with open('src/data/edges.csv', 'w') as csv_file:
-    writer = csv.writer(csv_file, delimiter=',')
-    writer.writerow(['source', 'target', 'weight'])
-    writer.writerows(final_edges)
-
-print("Nodes and edges CSV exported successfully.")
+        AND c1.author <> c2.author
+        AND c1.date >= :since AND c2.date >= :since
+    UNION ALL
+    SELECT c1.author AS src, c2.author AS dst, c2.date AS parent_date, c1.date AS child_date
+    FROM comments c2
+    JOIN comments c1 ON c1.parent_comment_id = c2.comment_id
+    WHERE :old_comments > 0 AND c2.ingest_seq > :old_comments AND c2.ingest_seq <= :new_comments AND c1.ingest_seq <= :old_comments
+        AND c1.author <> '[deleted]' AND c2.author <> '[deleted]'
+        AND c1.text <> '[removed]' AND c2.text <> '[removed]'
+        AND c1.author <> c2.author
+        AND c1.date >= :since AND c2.date >= :since
+'''
+
+UPSERT_ENGAGEMENT = f'''
+    INSERT INTO user_engagement (author, engagement)
+    SELECT author, engagement FROM ({ENGAGEMENT_DELTA_QUERY}) WHERE true
+    ON CONFLICT(author) DO UPDATE SET engagement = engagement + excluded.engagement
+'''
+
+# Authors of the delta rows, plus the authors whose posts/comments crossed zero replies since
+TOUCHED_AUTHORS = '''
+    INSERT OR IGNORE INTO touched_authors (author)
+    SELECT author FROM posts WHERE ingest_seq > :old_posts AND ingest_seq <= :new_posts
+    UNION ALL
+    SELECT author FROM comments WHERE ingest_seq > :old_comments AND ingest_seq <= :new_comments
+    UNION ALL
+    SELECT author FROM engagement_changes WHERE seq <= :changes
+'''
+
+# Engagement of the touched authors counted again over all their rows, through the
+# (author, date, num_*) indexes (CROSS JOIN keeps touched_authors as the outer loop)
+RECOUNT_ENGAGEMENT_QUERY = '''
+    SELECT author, COUNT(*) AS engagement
+    FROM (
+        SELECT p.author
+        FROM touched_authors AS t
+        CROSS JOIN posts AS p ON p.author = t.author
+        WHERE p.ingest_seq <= :new_posts
+            AND p.author <> '[deleted]' AND p.num_comments <> 0 AND p.date >= :since
+        UNION ALL
+        SELECT c.author
+        FROM touched_authors AS t
+        CROSS JOIN comments AS c ON c.author = t.author
+        WHERE c.ingest_seq <= :new_comments
+            AND c.author <> '[deleted]' AND c.num_replies <> 0 AND c.date >= :since
+    )
+    GROUP BY author
+'''
+
+RECOUNT_ENGAGEMENT = f'''
+    INSERT INTO user_engagement (author, engagement)
+    SELECT author, engagement FROM ({RECOUNT_ENGAGEMENT_QUERY})
+'''
+
+# Directed pairs of both kinds are symmetrized as (MIN, MAX) and summed in SQL
+UPSERT_INTERACTIONS = f'''
+    INSERT INTO user_interactions (src, dst, weight)
+    SELECT MIN(src, dst) AS u, MAX(src, dst) AS v, COUNT(*)
+    FROM ({POST_COMMENT_PAIRS} UNION ALL {COMMENT_COMMENT_PAIRS})
+    WHERE true
+    GROUP BY u, v
+    ON CONFLICT(src, dst) DO UPDATE SET weight = weight + excluded.weight
+'''
+
+# Last ingest_seq handed out for posts and comments: every row up to them is committed
+def ingest_watermarks(conn):
+    seqs = dict(conn.execute('SELECT name, seq FROM ingest_sequence'))
+    return seqs.get('posts', 0), seqs.get('comments', 0)
+
+def get_graph_watermark(conn, since=SINCE_DATE):
+    c = conn.cursor()
+    c.execute('SELECT since_date, posts_seq, comments_seq FROM graph_state WHERE name = ?', ('interactions',))
+    row = c.fetchone()
+
+    # A different date cutoff invalidates everything folded so far
+    if row and row[0] == since:
+        return row[1], row[2]
+    return 0, 0
+
+def set_graph_watermark(conn, posts_seq, comments_seq, since=SINCE_DATE):
+    conn.execute('''
+        INSERT OR REPLACE INTO graph_state (name, since_date, posts_seq, comments_seq)
+        VALUES (?, ?, ?, ?)
+    ''', ('interactions', since, posts_seq, comments_seq))
+
+# Folds the rows inserted since the last build into user_engagement / user_interactions.
+# Delta and watermark are committed in the same transaction
+def refresh_interactions(conn, since=SINCE_DATE, rebuild=False):
+    create_graph_tables(conn)
+    c = conn.cursor()
+
+    old_posts, old_comments = (0, 0) if rebuild else get_graph_watermark(conn, since)
+    new_posts, new_comments = ingest_watermarks(conn)
+    changes = c.execute('SELECT COALESCE(MAX(seq), 0) FROM engagement_changes').fetchone()[0]
+
+    # A counter behind the watermark (e.g. a database rebuilt from scratch) cannot be trusted
+    if new_posts < old_posts or new_comments < old_comments:
+        print("Ingestion counters behind the stored watermark: rebuilding")
+        old_posts, old_comments = 0, 0
+
+    params = {
+        'old_posts': old_posts, 'new_posts': new_posts,
+        'old_comments': old_comments, 'new_comments': new_comments,
+        'changes': changes, 'since': since,
+    }
+    if old_posts == 0 and old_comments == 0:
+        print("Full build of the interaction tables")
+        c.execute('DELETE FROM user_engagement')
+        c.execute('DELETE FROM user_interactions')
+        c.execute(UPSERT_ENGAGEMENT, params)
+    else:
+        print(f"Incremental build: {new_posts - old_posts} new posts, {new_comments - old_comments} new comments")
+        c.execute('DROP TABLE IF EXISTS temp.touched_authors')
+        c.execute('CREATE TEMP TABLE touched_authors (author TEXT PRIMARY KEY)')
+        c.execute(TOUCHED_AUTHORS, params)
+        c.execute('DELETE FROM user_engagement WHERE author IN (SELECT author FROM touched_authors)')
+        c.execute(RECOUNT_ENGAGEMENT, params)
+
+    c.execute(UPSERT_INTERACTIONS, params)
+    # Logged changes are folded in either way
+    c.execute('DELETE FROM engagement_changes WHERE seq <= ?', (changes,))
+    set_graph_watermark(conn, new_posts, new_comments, since)
+    conn.commit()
+
+# Engagement/degree cutoffs and log1p normalization over {user: engagement} and {(u, v): weight}
+def filter_graph(all_users, edge_dict):
+    # Computing engagement value distribuition
+    engagement_values = np.array(list(all_users.values()))
+
+    # Cutoff
+    engagement_cutoff = np.quantile(engagement_values, 0.8)  # keepin 20% most active users
+    print(f"Engagement threshold: {engagement_cutoff}")
+    valid_users = {user for user, count in all_users.items() if count >= engagement_cutoff}
+    print(f"Users after engagement filter: {len(valid_users)}")
+
+    print(f"Total edges: {len(edge_dict)}")
+
+    # Filtering valid users
+    edge_dict = {
+        (u, v): w for (u, v), w in edge_dict.items()
+        if u in valid_users and v in valid_users
+    }
+
+    print(f"Edges after user filter: {len(edge_dict)}")
+
+    # Normalizzazione log(1+w)
+    final_edges = [(u, v, math.log1p(w)) for (u, v), w in edge_dict.items()]
+    print(f"Unique undirected edges: {len(final_edges)}")
+
+    # Computing degree value distribuition
+    degree_counter = Counter()
+    for u, v, w in final_edges:
+        degree_counter[u] += 1
+        degree_counter[v] += 1
+
+    degree_values = np.array([deg for user, deg in degree_counter.items()])
+
+    # Cutoff
+    degree_cutoff = np.quantile(degree_values, 0.5)
+    print(f"Degree threshold: {degree_cutoff}")
+    final_users = {user for user in valid_users if degree_counter[user] >= degree_cutoff}
+
+    final_edges = [(u, v, w) for u, v, w in final_edges if u in final_users and v in final_users]
+    final_nodes = [(user, all_users[user]) for user in final_users]
+
+    print(f"Final filtered users: {len(final_nodes)}")
+    print(f"Final edges count: {len(final_edges)}")
+
+    return final_nodes, final_edges
+
+# Nodes and edges are written as columnar artifacts for the pipeline, plus the CSV read by Gephi
+NODE_TYPES = {'id': 'string', 'engagement': 'int64'}
+# Edge weights are log(1+w)
+EDGE_TYPES = {'source': 'string', 'target': 'string', 'weight': 'double'}
+
+def write_graph(final_nodes, final_edges, nodes_path, edges_path):
+    with ArtifactWriter(nodes_path, ['id', 'engagement'], csv_copy=True, types=NODE_TYPES) as writer:
+        writer.write(final_nodes)
+
+    with ArtifactWriter(edges_path, ['source', 'target', 'weight'], csv_copy=True, types=EDGE_TYPES) as writer:
+        writer.write(final_edges)
+
+    print("Nodes and edges exported successfully.")
+
+# In-memory export: cutoffs and filters computed in Python over the materialized tables
+def export_graph(connection, nodes_path='src/data/nodes.csv', edges_path='src/data/edges.csv'):
+    cursor = connection.cursor()
+
+    cursor.execute('SELECT author, engagement FROM user_engagement')
+    all_users = {user: count for user, count in cursor.fetchall()}
+
+    # Undirected edges, already symmetrized by refresh_interactions
+    cursor.execute('SELECT src, dst, weight FROM user_interactions')
+    edge_dict = {(u, v): w for u, v, w in cursor.fetchall()}
+
+    final_nodes, final_edges = filter_graph(all_users, edge_dict)
+    write_graph(final_nodes, final_edges, nodes_path, edges_path)
+
+# Same as numpy.quantile (linear method) computed with an ordered pass in SQLite,
+# which sorts out of core instead of loading the column
+def sql_quantile(cursor, table, column, q):
+    n = cursor.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+    if n == 0:
+        raise ValueError(f"Cannot compute a quantile of an empty {table}")
+
+    h = (n - 1) * q
+    lo = math.floor(h)
+    values = [row[0] for row in cursor.execute(
+        f'SELECT {column} FROM {table} ORDER BY {column} LIMIT 2 OFFSET ?', (lo,)
+    )]
+    a = values[0]
+    b = values[1] if len(values) > 1 else a
+    t = h - lo
+
+    # numpy's lerp
+    diff = b - a
+    return a + diff * t if t < 0.5 else b - diff * (1 - t)
+
+def write_stream(cursor, path, header, batch_size, transform=None, types=None):
+    with ArtifactWriter(path, header, csv_copy=True, types=types) as writer:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            writer.write(list(map(transform, rows)) if transform else rows)
+    return writer.rows_written
+
+# Out-of-core export: user filtering, degree counting and cutoffs are pushed down into
+# temporary SQLite tables and nodes/edges are written in batches, so peak memory no
+# longer depends on the number of users, comments or edges
+def export_graph_streaming(connection, nodes_path='src/data/nodes.csv', edges_path='src/data/edges.csv', batch_size=50000):
+    cursor = connection.cursor()
+    cursor.execute('PRAGMA temp_store = FILE')
+
+    for table in ('valid_users', 'valid_edges', 'degrees', 'final_users'):
+        cursor.execute(f'DROP TABLE IF EXISTS temp.{table}')
+
+    # Cutoff
+    engagement_cutoff = sql_quantile(cursor, 'user_engagement', 'engagement', 0.8)  # keepin 20% most active users
+    print(f"Engagement threshold: {engagement_cutoff}")
+    cursor.execute('''
+        CREATE TEMP TABLE valid_users AS
+        SELECT author AS user, engagement FROM user_engagement WHERE engagement >= ?
+    ''', (engagement_cutoff,))
+    cursor.execute('CREATE UNIQUE INDEX temp.idx_valid_users ON valid_users(user)')
+    print(f"Users after engagement filter: {cursor.execute('SELECT COUNT(*) FROM valid_users').fetchone()[0]}")
+
+    print(f"Total edges: {cursor.execute('SELECT COUNT(*) FROM user_interactions').fetchone()[0]}")
+
+    # Filtering valid users
+    cursor.execute('''
+        CREATE TEMP TABLE valid_edges AS
+        SELECT i.src, i.dst, i.weight
+        FROM user_interactions AS i
+        JOIN valid_users AS a ON a.user = i.src
+        JOIN valid_users AS b ON b.user = i.dst
+    ''')
+    print(f"Edges after user filter: {cursor.execute('SELECT COUNT(*) FROM valid_edges').fetchone()[0]}")
+
+    # Computing degree value distribuition
+    cursor.execute('''
+        CREATE TEMP TABLE degrees AS
+        SELECT user, COUNT(*) AS degree
+        FROM (SELECT src AS user FROM valid_edges UNION ALL SELECT dst AS user FROM valid_edges)
+        GROUP BY user
+    ''')
+
+    # Cutoff
+    degree_cutoff = sql_quantile(cursor, 'degrees', 'degree', 0.5)
+    print(f"Degree threshold: {degree_cutoff}")
+    cursor.execute('''
+        CREATE TEMP TABLE final_users AS
+        SELECT v.user, v.engagement
+        FROM degrees AS d
+        JOIN valid_users AS v ON v.user = d.user
+        WHERE d.degree >= ?
+    ''', (degree_cutoff,))
+    cursor.execute('CREATE UNIQUE INDEX temp.idx_final_users ON final_users(user)')
+
+    # Saving process
+    cursor.execute('SELECT user, engagement FROM final_users')
+    nodes_count = write_stream(cursor, nodes_path, ['id', 'engagement'], batch_size, types=NODE_TYPES)
+
+    # Normalizzazione log(1+w)
+    cursor.execute('''
+        SELECT e.src, e.dst, e.weight
+        FROM valid_edges AS e
+        JOIN final_users AS a ON a.user = e.src
+        JOIN final_users AS b ON b.user = e.dst
+    ''')
+    edges_count = write_stream(cursor, edges_path, ['source', 'target', 'weight'], batch_size, types=EDGE_TYPES,
+                               transform=lambda row: (row[0], row[1], math.log1p(row[2])))
+
+    print(f"Final filtered users: {nodes_count}")
+    print(f"Final edges count: {edges_count}")
+    print("Nodes and edges exported successfully.")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rebuild', action='store_true', help="Rebuild the interaction tables from scratch")
+    parser.add_argument('--streaming', action='store_true', help="Out-of-core export for very large databases")
+    args = parser.parse_args()
+
+    # Database connection
+    connection = sqlite3.connect('reddit-posts.db')
+    create_tables(connection)  # Applies pending schema migrations
+
+    refresh_interactions(connection, rebuild=args.rebuild)
+
+    if args.streaming:
+        export_graph_streaming(connection)
+    else:
+        export_graph(connection)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Betweenness for the hub/bridge stage, on an undirected igraph graph.
+#   exact:       Brandes over every source vertex, O(nm)
+#   approximate: Brandes-Pich pivot sampling. k sources are drawn uniformly without
+#                replacement and their shortest-path dependencies, rescaled by n/k, are an
+#                unbiased estimate of the exact values.
+# The pivots are split in batches that run in worker processes; the spread of the per-batch
+# estimates gives the standard error of every node's value
+
+_graph = None
+
+def _init_worker(graph):
+    global _graph
+    _graph = graph
+
+def _batch_betweenness(sources):
+    return np.array(_graph.betweenness(directed=False, sources=sources), dtype=np.float64)
+
+def exact_betweenness(g):
+    return np.array(g.betweenness(directed=False), dtype=np.float64)
+
+# Returns (estimate, stderr), both indexed by vertex id
+def approximate_betweenness(g, pivots=512, workers=None, batches=None, seed=42):
+    n = g.vcount()
+    if pivots >= n:
+        return exact_betweenness(g), np.zeros(n)
+
+    workers = workers or os.cpu_count() or 1
+    batches = max(2, min(batches or max(workers, 8), pivots))
+
+    rng = np.random.default_rng(seed)
+    sources = rng.choice(n, size=pivots, replace=False)
+    groups = [group.tolist() for group in np.array_split(sources, batches)]
+
+    if workers == 1:
+        _init_worker(g)
+        partial = [_batch_betweenness(group) for group in groups]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(g,)) as executor:
+            partial = list(executor.map(_batch_betweenness, groups))
+
+    partial = np.vstack(partial)
+    sizes = np.array([len(group) for group in groups], dtype=np.float64)
+    estimate = partial.sum(axis=0) * n / pivots
+
+    # Each batch on its own is an estimate with fewer pivots
+    per_batch = partial * n / sizes[:, None]
+    stderr = per_batch.std(axis=0, ddof=1) / np.sqrt(len(groups))
+    return estimate, stderr
+
+# How far the sampled values can be trusted around the percentile threshold used by is_bridge
+def error_report(estimate, stderr, q=0.75):
+    threshold = np.quantile(estimate, q)
+    above = estimate > threshold
+    relative = np.divide(stderr, estimate, out=np.zeros_like(stderr), where=estimate > 0)
+    return {
+        'threshold': float(threshold),
+        'median_relative_stderr_above_threshold': float(np.median(relative[above])) if above.any() else 0.0,
+        # Nodes whose side of the threshold is within two standard errors
+        'uncertain_nodes': int((np.abs(estimate - threshold) < 2 * stderr).sum()),
+        'nodes': int(len(estimate)),
+    }
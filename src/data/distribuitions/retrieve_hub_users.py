@@ -1,103 +1,136 @@
 import pandas as pd
 import numpy as np
-import networkx as nx
+import argparse
 import json
-import igraph as ig
+import sys
+import os
 
-nodes = pd.read_csv('src/data/statistical_nodes.csv')
-edges = pd.read_csv('src/data/edges.csv')
-G_nx = nx.from_pandas_edgelist(edges, source="source", target="target")
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from artifacts import read_artifact, write_artifact
+from graph_core import load_graph
+from community_metrics import group_zscore, group_percentile
+from betweenness import exact_betweenness, approximate_betweenness, error_report
 
-# Mapping node to id
-node_list = list(G_nx.nodes())
-node2idx = {node: idx for idx, node in enumerate(node_list)}
+def load_communities(tree_path):
+    with open(tree_path, 'r') as f:
+        tree = json.load(f)
+
+    node2comm = {}
+    node2comm_type = {}
+
+    for comm_id, comm_data in tree.items():
+        ctype = comm_data.get('type')
+        for u in comm_data.get('users', []):
+            node2comm[u] = comm_id
+            node2comm_type[u] = ctype
+
+    community_map = pd.Series(node2comm, name="community_id")
+    community_type_map = pd.Series(node2comm_type, name="community_type")
+    return community_map, community_type_map
 
 # Calculating external and internal degree
-with open('src/graph_dir/infomap_dir/cluster_tree_base.json', 'r') as f:
-    tree = json.load(f)
-
-node2comm = {}
-node2comm_type = {}
-
-for comm_id, comm_data in tree.items():
-    ctype = comm_data.get('type')
-    for u in comm_data.get('users', []):
-        node2comm[u] = comm_id
-        node2comm_type[u] = ctype
-
-community_map = pd.Series(node2comm, name="community_id")
-community_type_map = pd.Series(node2comm_type, name="community_type")
-
-# Labeling each edge node with its community and then filtering edges of the same community 
-edges['src_comm'] = edges['source'].map(community_map)
-edges['dst_comm'] = edges['target'].map(community_map)
-
-# Internal degree
-edges_internal = edges[(edges["src_comm"] == edges["dst_comm"]) & edges["src_comm"].notna()]
-endpoints = pd.concat([edges_internal["source"], edges_internal["target"]])
-internal_deg = endpoints.value_counts().rename("internal_degree")
-
-df_deg = internal_deg.to_frame().join(community_map)
-
-# Merge with nodes
-df_final = nodes.merge(df_deg, left_on='id', right_index=True, how='left')
-df_final = df_final.join(community_type_map, on='id')
-
-df_final["internal_degree"] = df_final["internal_degree"].fillna(0).astype(int)
-df_final["external_degree"] = (df_final["degree"] - df_final["internal_degree"].astype(int)).clip(lower=0)
-
-# Computing degrees percentage
-df_final["pct_internal"] = df_final["internal_degree"] / df_final["degree"].replace(0, np.nan)
-df_final["pct_external"] = df_final["external_degree"] / df_final["degree"].replace(0, np.nan)
-
-# Scaling
-df_final["z_internal"] = df_final.groupby("community_id")["internal_degree"].transform(
-    lambda x: (x - x.mean()) / (x.std() + 1e-9)
-)
-
-# Computing betweeness intra-community and centrality
-df_final["z_internal"] = df_final.groupby("community_id")["internal_degree"].transform(
-    lambda x: (x - x.mean()) / (x.std() + 1e-9)
-)
-
-g = ig.Graph.TupleList(G_nx.edges(), directed=False)
-betw = g.betweenness()
-betw_dict = {node: betw[idx] for node, idx in node2idx.items()}
-df_final["betweenness"] = df_final["id"].map(betw_dict)
-
-# Defining adaptive thresholds
-internal_degree_threshold = df_final.groupby("community_id")["internal_degree"].transform(
-    lambda x: np.percentile(x, 90) if len(x) > 10 else max(x)
-)
-
-pct_external_threshold = df_final['pct_external'].quantile(0.75)
-external_degree_threshold = df_final['external_degree'].median()
-betweenness_threshold = df_final["betweenness"].quantile(0.75)
-
-# Hub and Bridge classification
-df_final["is_hub"] = (
-    (df_final["z_internal"] > 2) &  # molto sopra la media della community
-    (df_final["internal_degree"] >= internal_degree_threshold) &
-    (df_final["pct_external"] < 0.2)
-)
-
-df_final["is_bridge"] = (
-    ~df_final['is_hub'] &
-    (df_final["pct_external"] > pct_external_threshold) &
-    (df_final["external_degree"] > external_degree_threshold) &
-    (df_final["betweenness"] > betweenness_threshold)
-)
-
-# --- Salvataggio ---
-df_final = df_final.drop(
-    columns=['engagement','weighted_degree','eccentricity','closeness_centrality',
-             'harmonic_closeness_centrality','betweenness_centrality',
-             'authority','hub','pagerank'], errors="ignore"
-)
-
-df_final.to_csv('src/data/distribuitions/hub_bridge_df.csv', sep=',', encoding='utf-8', index=False)
-
-# Report
-print(f"Totale Hub: {df_final['is_hub'].sum()}")
-print(f"Totale Bridge: {df_final['is_bridge'].sum()}")
-print(df_final.groupby("community_type")[["is_hub","is_bridge"]].sum())
\ No newline at end of file
+def degree_table(nodes, graph, community_map, community_type_map):
+    # Internal degree: neighbours in the same community, counted over the CSR arrays
+    codes, _ = graph.label_codes(community_map)
+    internal_deg = pd.Series(graph.internal_degree(codes), index=graph.ids, name="internal_degree")
+    internal_deg = internal_deg[internal_deg > 0]
+
+    df_deg = internal_deg.to_frame().join(community_map)
+
+    # Merge with nodes
+    df_final = nodes.merge(df_deg, left_on='id', right_index=True, how='left')
+    df_final = df_final.join(community_type_map, on='id')
+
+    df_final["internal_degree"] = df_final["internal_degree"].fillna(0).astype(int)
+    df_final["external_degree"] = (df_final["degree"] - df_final["internal_degree"].astype(int)).clip(lower=0)
+
+    # Computing degrees percentage
+    df_final["pct_internal"] = df_final["internal_degree"] / df_final["degree"].replace(0, np.nan)
+    df_final["pct_external"] = df_final["external_degree"] / df_final["degree"].replace(0, np.nan)
+
+    # Scaling, within each community
+    community_codes = pd.factorize(df_final["community_id"])[0]
+    df_final["z_internal"] = group_zscore(df_final["internal_degree"], community_codes)
+    return df_final
+
+# Betweenness of every node, indexed by user id; 'approximate' samples `pivots` source nodes
+def compute_betweenness(graph, mode='exact', pivots=512, workers=None, seed=42):
+    g = graph.to_igraph(names=False)
+
+    if mode == 'exact':
+        betw = exact_betweenness(g)
+    else:
+        betw, stderr = approximate_betweenness(g, pivots=pivots, workers=workers, seed=seed)
+        report = error_report(betw, stderr)
+        print(f"Approximate betweenness: {pivots} pivots over {report['nodes']} nodes")
+        print(f"  75th percentile threshold: {report['threshold']:.2f}")
+        print(f"  Median relative std. error above threshold: {report['median_relative_stderr_above_threshold']:.2%}")
+        print(f"  Nodes within 2 std. errors of the threshold: {report['uncertain_nodes']}")
+
+    return pd.Series(betw, index=graph.ids, name='betweenness')
+
+# Hub and Bridge classification with adaptive thresholds
+def classify(df_final):
+    # Defining adaptive thresholds
+    # 90th percentile of the community, or its maximum when it has at most 10 members
+    community_codes = pd.factorize(df_final["community_id"])[0]
+    internal_degree_threshold = group_percentile(df_final["internal_degree"], community_codes, 90, min_size=11)
+
+    pct_external_threshold = df_final['pct_external'].quantile(0.75)
+    external_degree_threshold = df_final['external_degree'].median()
+    betweenness_threshold = df_final["betweenness"].quantile(0.75)
+
+    df_final["is_hub"] = (
+        (df_final["z_internal"] > 2) &  # molto sopra la media della community
+        (df_final["internal_degree"] >= internal_degree_threshold) &
+        (df_final["pct_external"] < 0.2)
+    )
+
+    df_final["is_bridge"] = (
+        ~df_final['is_hub'] &
+        (df_final["pct_external"] > pct_external_threshold) &
+        (df_final["external_degree"] > external_degree_threshold) &
+        (df_final["betweenness"] > betweenness_threshold)
+    )
+    return df_final
+
+def hub_bridge_roles(nodes, graph, tree_path, betweenness='exact', pivots=512, workers=None, seed=42):
+    community_map, community_type_map = load_communities(tree_path)
+    df_final = degree_table(nodes, graph, community_map, community_type_map)
+
+    # Computing betweeness centrality
+    df_final["betweenness"] = df_final["id"].map(compute_betweenness(graph, betweenness, pivots, workers, seed))
+    return classify(df_final)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nodes', default='src/data/statistical_nodes.csv')
+    parser.add_argument('--edges', default='src/data/edges.csv')
+    parser.add_argument('--tree', default='src/graph_dir/infomap_dir/cluster_tree_base.json')
+    parser.add_argument('--output', default='src/data/distribuitions/hub_bridge_df.csv')
+    parser.add_argument('--betweenness', choices=['exact', 'approximate'], default='exact')
+    parser.add_argument('--pivots', type=int, default=512, help="Sampled source nodes for the approximate betweenness")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    nodes = read_artifact(args.nodes)
+    graph = load_graph(args.edges)
+    df_final = hub_bridge_roles(nodes, graph, args.tree, args.betweenness, args.pivots, args.workers, args.seed)
+
+    # --- Salvataggio ---
+    df_final = df_final.drop(
+        columns=['engagement','weighted_degree','eccentricity','closeness_centrality',
+                 'harmonic_closeness_centrality','betweenness_centrality',
+                 'authority','hub','pagerank'], errors="ignore"
+    )
+
+    write_artifact(df_final, args.output, csv_copy=True)
+
+    # Report
+    print(f"Totale Hub: {df_final['is_hub'].sum()}")
+    print(f"Totale Bridge: {df_final['is_bridge'].sum()}")
+    print(df_final.groupby("community_type")[["is_hub","is_bridge"]].sum())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import argparse
+import time
+import sys
+import os
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from artifacts import read_artifact
+from graph_core import load_graph
+from betweenness import exact_betweenness, approximate_betweenness, error_report
+from retrieve_hub_users import load_communities, degree_table, classify
+
+# Agreement of the is_bridge labels obtained with the approximate betweenness against the
+# exact computation, for several pivot counts
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nodes', default='src/data/statistical_nodes.csv')
+    parser.add_argument('--edges', default='src/data/edges.csv')
+    parser.add_argument('--tree', default='src/graph_dir/infomap_dir/cluster_tree_base.json')
+    parser.add_argument('--pivots', type=int, nargs='+', default=[64, 128, 256, 512, 1024])
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    nodes = read_artifact(args.nodes)
+    graph = load_graph(args.edges)
+    base = degree_table(nodes, graph, *load_communities(args.tree))
+
+    g = graph.to_igraph(names=False)
+    print(f"Graph: {g.vcount()} nodes, {g.ecount()} edges")
+
+    start = time.perf_counter()
+    exact = pd.Series(exact_betweenness(g), index=graph.ids)
+    exact_time = time.perf_counter() - start
+    reference = classify(base.assign(betweenness=base['id'].map(exact)))
+    exact_bridges = reference['is_bridge']
+
+    print(f"{'pivots':>8}{'time s':>9}{'speed-up':>10}{'rel. err':>10}{'uncertain':>11}"
+          f"{'bridges':>9}{'agree':>9}{'precision':>11}{'recall':>8}")
+    print(f"{'exact':>8}{exact_time:>9.2f}{'1.0x':>10}{'-':>10}{'-':>11}{int(exact_bridges.sum()):>9}{'-':>9}{'-':>11}{'-':>8}")
+
+    for pivots in args.pivots:
+        start = time.perf_counter()
+        estimate, stderr = approximate_betweenness(g, pivots=pivots, workers=args.workers, seed=args.seed)
+        elapsed = time.perf_counter() - start
+        report = error_report(estimate, stderr)
+
+        labels = classify(base.assign(betweenness=base['id'].map(pd.Series(estimate, index=graph.ids))))
+        bridges = labels['is_bridge']
+        both = int((bridges & exact_bridges).sum())
+        precision = both / bridges.sum() if bridges.sum() else 1.0
+        recall = both / exact_bridges.sum() if exact_bridges.sum() else 1.0
+
+        print(f"{pivots:>8}{elapsed:>9.2f}{exact_time / elapsed:>9.1f}x"
+              f"{report['median_relative_stderr_above_threshold']:>10.1%}{report['uncertain_nodes']:>11}"
+              f"{int(bridges.sum()):>9}{(bridges == exact_bridges).mean():>9.2%}{precision:>11.2%}{recall:>8.2%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from artifacts import read_artifact
+
+# Shared in-memory form of the interaction graph for the graph stages (hub/bridge roles,
+# subclustering, GNN dataset). The edge artifact is read once into compressed sparse row
+# arrays over a stable id <-> index table:
+#   ids       index -> user id (node artifact order when given, sorted ids otherwise)
+#   indptr    row offsets, indices/weights the neighbours of each row
+# The graph is undirected and simple: both directions of every edge are stored, duplicate
+# pairs are merged by summing their weights and self-loops are dropped
+
+# Position of each id in node_ids. Dictionary-encoded columns (edges artifact read with
+# categories=True) only need their distinct values looked up; plain strings are hashed once each
+def index_ids(ids, node_ids, label):
+    ids = pd.Series(ids)
+    if isinstance(ids.dtype, pd.CategoricalDtype):
+        positions = pd.Index(node_ids).get_indexer(ids.cat.categories)
+        codes = ids.cat.codes.to_numpy()
+        codes = np.where(codes >= 0, positions[codes], -1).astype(np.int64)
+    else:
+        codes = pd.Categorical(ids, categories=node_ids).codes.astype(np.int64)
+    assert (codes >= 0).all(), f"Some edge {label} not in node list"
+    return codes
+
+# Undirected coalescing: (u, v) and (v, u) become one (min, max) edge carrying the sum of their
+# weights. Edges come out sorted by (u, v); the stable sort keeps the summation order of the input
+def coalesce_undirected(src, dst, weight, num_nodes):
+    u = np.minimum(src, dst)
+    v = np.maximum(src, dst)
+    keys = u * num_nodes + v
+
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.empty(0, dtype=np.int64)
+
+    weights = weight[order].astype(np.float64)
+    summed = np.add.reduceat(weights, starts) if len(keys) else weights
+    unique_keys = keys[starts]
+    return np.vstack([unique_keys // num_nodes, unique_keys % num_nodes]), summed
+
+class CSRGraph:
+    def __init__(self, ids, indptr, indices, weights):
+        self.ids = ids
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self._id_index = None
+
+    @classmethod
+    def from_edges(cls, ids, src, dst, weight=None):
+        n = len(ids)
+        if weight is None:
+            weight = np.ones(len(src), dtype=np.float64)
+        keep = src != dst
+        (u, v), w = coalesce_undirected(src[keep], dst[keep], weight[keep], n)
+
+        # Both directions, grouped by row. 32-bit indices when they fit, as SciPy would
+        # otherwise downcast them into a copy
+        index_dtype = np.int32 if max(n, 2 * len(w)) < 2**31 else np.int64
+        rows = np.concatenate([u, v])
+        cols = np.concatenate([v, u])
+        order = np.lexsort((cols, rows))
+        indptr = np.zeros(n + 1, dtype=index_dtype)
+        np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+        return cls(np.asarray(ids), indptr, cols[order].astype(index_dtype), np.concatenate([w, w])[order])
+
+    @property
+    def num_nodes(self):
+        return len(self.ids)
+
+    @property
+    def num_edges(self):
+        return len(self.indices) // 2
+
+    def index_of(self, ids):
+        if self._id_index is None:
+            self._id_index = pd.Index(self.ids)
+        return self._id_index.get_indexer(ids)
+
+    # Row of every stored entry (the COO expansion of indptr)
+    def rows(self):
+        return np.repeat(np.arange(self.num_nodes), np.diff(self.indptr))
+
+    # Each undirected edge once, as (u, v) with u < v, and its weight
+    def edge_list(self):
+        rows = self.rows()
+        upper = rows < self.indices
+        return rows[upper], self.indices[upper], self.weights[upper]
+
+    # Integer code of each node's label (-1 when the node has none) from a {user id: label} mapping
+    def label_codes(self, node2label):
+        labels = pd.Series(node2label)
+        codes, uniques = pd.factorize(labels)
+        node_codes = np.full(self.num_nodes, -1, dtype=np.int64)
+        positions = self.index_of(labels.index)
+        found = positions >= 0
+        node_codes[positions[found]] = codes[found]
+        return node_codes, uniques
+
+    def degree(self):
+        return np.diff(self.indptr)
+
+    def weighted_degree(self):
+        return np.bincount(self.rows(), weights=self.weights, minlength=self.num_nodes)
+
+    # Neighbours sharing the node's label
+    def internal_degree(self, codes):
+        rows = self.rows()
+        same = (codes[rows] == codes[self.indices]) & (codes[rows] >= 0)
+        return np.bincount(rows[same], minlength=self.num_nodes)
+
+    # Views over the same arrays, no copy
+    def to_scipy(self):
+        return sparse.csr_matrix((self.weights, self.indices, self.indptr), shape=(self.num_nodes, self.num_nodes), copy=False)
+
+    def to_torch_csr(self):
+        import torch
+        return torch.sparse_csr_tensor(torch.from_numpy(self.indptr), torch.from_numpy(self.indices),
+                                       torch.from_numpy(self.weights), size=(self.num_nodes, self.num_nodes))
+
+    # igraph keeps its own edge vector, so this one is a copy of the upper triangle
+    def to_igraph(self, names=True):
+        import igraph as ig
+        u, v, w = self.edge_list()
+        g = ig.Graph(n=self.num_nodes, edges=np.column_stack([u, v]), directed=False)
+        g.es['weight'] = w
+        if names:
+            g.vs['name'] = self.ids.tolist()
+        return g
+
+    # Nodes are the integer indices, as torch_geometric's to_networkx produced them (no weights
+    # unless asked, since some community algorithms pick the attribute up when present)
+    def to_networkx(self, weighted=False):
+        import networkx as nx
+        G = nx.Graph()
+        G.add_nodes_from(range(self.num_nodes))
+        u, v, w = self.edge_list()
+        if weighted:
+            G.add_weighted_edges_from(zip(u.tolist(), v.tolist(), w.tolist()))
+        else:
+            G.add_edges_from(zip(u.tolist(), v.tolist()))
+        return G
+
+    # edge_index with both directions and edge_weight sharing the weights array
+    def to_pyg(self, x=None):
+        import torch
+        from torch_geometric.data import Data
+        edge_index = torch.from_numpy(np.vstack([self.rows(), self.indices]).astype(np.int64))
+        return Data(x=x, edge_index=edge_index, edge_weight=torch.from_numpy(self.weights), num_nodes=self.num_nodes)
+
+def distinct_values(column):
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return column.cat.categories.to_numpy(dtype=object)
+    return column.unique().astype(object)
+
+# Loads the edge artifact (source, target[, weight]); nodes_path fixes the index order
+# to the one of a node artifact, which must then contain every endpoint
+def load_graph(edges_path='src/data/edges.csv', nodes_path=None):
+    edges = read_artifact(edges_path, categories=True)
+
+    if nodes_path is not None:
+        ids = read_artifact(nodes_path, columns=['id'])['id'].to_numpy()
+    else:
+        ids = np.unique(np.concatenate([distinct_values(edges['source']), distinct_values(edges['target'])]))
+
+    src = index_ids(edges['source'], ids, 'sources')
+    dst = index_ids(edges['target'], ids, 'targets')
+    weight = edges['weight'].to_numpy(np.float64) if 'weight' in edges else None
+    return CSRGraph.from_edges(ids, src, dst, weight)
@@ -0,0 +1,204 @@
+import argparse
+import json
+import random
+import time
+
+import numpy as np
+
+from graph_core import load_graph, coalesce_undirected
+from community_metrics import community_metrics, categorize_communities, cluster_tree_base, write_cluster_tree
+
+# Incremental re-clustering after a graph update, warm-started from the previous
+# cluster_tree_base.json.
+#   1. affected nodes: nodes new to the partition and endpoints of added/removed edges (or,
+#      without the previous edges, every member of a community whose stored edges_inside /
+#      edges_cut / num_users no longer match the graph), optionally grown by `hops`
+#      neighbourhoods
+#   2. every other node is frozen: the unaffected members of each old community are contracted
+#      into one super-node, internal edges becoming a self-loop, so degrees and modularity
+#      are the same as on the full graph
+#   3. Leiden runs on the contracted graph starting from the old partition (new nodes as
+#      singletons); Infomap has no warm start and just runs on the contracted graph
+#   4. the communities found are matched to the old ones by overlap, so ids stay stable; a
+#      community whose members did not change keeps its id and is flagged as unchanged
+# The graph is treated as unweighted, as in the subclustering notebooks
+
+ALGORITHMS = ['leiden', 'infomap']
+
+def load_tree(tree_path):
+    with open(tree_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+# Node codes of the previous partition on the current graph (-1 for nodes it did not have)
+# and the old community id of each code
+def previous_codes(graph, tree):
+    node2comm = {u: comm_id for comm_id, data in tree.items() for u in data.get('users', [])}
+    codes, uniques = graph.label_codes(node2comm)
+    return codes, np.asarray(uniques, dtype=object)
+
+# Nodes whose neighbourhood differs between previous_graph and graph
+def changed_nodes(graph, previous_graph):
+    n = graph.num_nodes
+    u, v, _ = graph.edge_list()
+    keys = u.astype(np.int64) * n + v
+
+    pu, pv, _ = previous_graph.edge_list()
+    pu, pv = graph.index_of(previous_graph.ids[pu]), graph.index_of(previous_graph.ids[pv])
+    changed = np.zeros(n, dtype=bool)
+    # Edges towards nodes that are gone mark the surviving endpoint
+    gone = (pu < 0) | (pv < 0)
+    changed[pu[gone & (pu >= 0)]] = True
+    changed[pv[gone & (pv >= 0)]] = True
+    pu, pv = np.minimum(pu[~gone], pv[~gone]), np.maximum(pu[~gone], pv[~gone])
+    previous_keys = pu.astype(np.int64) * n + pv
+
+    added = keys[~np.isin(keys, previous_keys)]
+    removed = previous_keys[~np.isin(previous_keys, keys)]
+    for diff in (added, removed):
+        changed[diff // n] = True
+        changed[diff % n] = True
+    return changed
+
+# Members of the communities whose stored metrics do not match the current graph
+def stale_nodes(graph, codes, tree, old_ids):
+    current = community_metrics(graph, codes, len(old_ids))
+    stale = np.zeros(len(old_ids), dtype=bool)
+    for k, comm_id in enumerate(old_ids):
+        stored = tree[comm_id]
+        stale[k] = (current['num_users'][k] != len(stored.get('users', []))
+                    or current['edges_inside'][k] != stored.get('edges_inside')
+                    or current['edges_cut'][k] != stored.get('edges_cut'))
+    return (codes >= 0) & stale[np.maximum(codes, 0)]
+
+def expand(graph, mask, hops):
+    for _ in range(hops):
+        rows = graph.rows()
+        grown = mask.copy()
+        grown[graph.indices[mask[rows]]] = True
+        mask = grown
+    return mask
+
+# Vertex of every node in the contracted graph: frozen nodes share the vertex of their old
+# community, affected nodes keep one each. Returns (vertex, initial membership per vertex)
+def contraction(codes, affected):
+    k = int(codes.max()) + 1 if len(codes) else 0
+    labels = np.where(affected, k + np.arange(len(codes)), codes)
+    _, vertex = np.unique(labels, return_inverse=True)
+
+    # Old community of each vertex, new nodes start as singletons
+    initial = np.where(codes >= 0, codes, k + np.arange(len(codes)))
+    membership = np.zeros(int(vertex.max()) + 1 if len(vertex) else 0, dtype=np.int64)
+    membership[vertex] = initial
+    _, membership = np.unique(membership, return_inverse=True)
+    return vertex, membership
+
+def contracted_graph(graph, vertex):
+    import igraph as ig
+    u, v, _ = graph.edge_list()
+    (cu, cv), w = coalesce_undirected(vertex[u], vertex[v], np.ones(len(u)), int(vertex.max()) + 1)
+    g = ig.Graph(n=int(vertex.max()) + 1, edges=np.column_stack([cu, cv]), directed=False)
+    g.es['weight'] = w
+    return g
+
+# One run of the algorithm on g, unweighted unless g has a 'weight' edge attribute; Leiden
+# optimizes modularity and starts from membership when given
+def run_algorithm(g, algorithm, membership=None, resolution=1, seed=42):
+    random.seed(seed)
+    weights = 'weight' if 'weight' in g.es.attributes() else None
+    if algorithm == 'leiden':
+        # Node weights given explicitly: the default ones count self-loops once, which makes
+        # the super-nodes look lighter than the nodes they replace
+        partition = g.community_leiden(objective_function='modularity', weights=weights,
+                                       node_weights=g.strength(weights=weights), resolution=resolution,
+                                       initial_membership=None if membership is None else membership.tolist(),
+                                       n_iterations=-1)
+    elif algorithm == 'infomap':
+        partition = g.community_infomap(edge_weights=weights)
+    else:
+        raise ValueError(f"Unknown algorithm: {algorithm}")
+    return np.asarray(partition.membership, dtype=np.int64)
+
+# Old id for each new community, greedily by decreasing overlap; unmatched communities get
+# fresh ids after the largest old one. unchanged[k] is True when community k has exactly the
+# members of the old community whose id it takes
+def match_ids(codes, old_codes, old_ids):
+    k = int(codes.max()) + 1
+    m = max(len(old_ids), 1)
+    both = (codes >= 0) & (old_codes >= 0)
+    pairs, overlap = np.unique(codes[both] * m + old_codes[both], return_counts=True)
+    new, old = pairs // m, pairs % m
+
+    sizes = np.bincount(codes[codes >= 0], minlength=k)
+    old_sizes = np.bincount(old_codes[old_codes >= 0], minlength=len(old_ids))
+
+    ids = np.full(k, None, dtype=object)
+    unchanged = np.zeros(k, dtype=bool)
+    taken = np.zeros(len(old_ids), dtype=bool)
+    for i in np.lexsort((old, new, -overlap)):
+        if ids[new[i]] is None and not taken[old[i]]:
+            ids[new[i]] = old_ids[old[i]]
+            taken[old[i]] = True
+            unchanged[new[i]] = overlap[i] == sizes[new[i]] == old_sizes[old[i]]
+
+    next_id = max((int(i) for i in old_ids if str(i).isdigit()), default=-1) + 1
+    for c in np.flatnonzero(ids == None):
+        ids[c] = str(next_id)
+        next_id += 1
+    return ids, unchanged
+
+# New partition of graph warm-started from `tree`. Returns node codes, the stable id of each
+# code and the unchanged flags
+def recluster(graph, tree, algorithm='leiden', previous_graph=None, hops=0, resolution=1, seed=42):
+    old_codes, old_ids = previous_codes(graph, tree)
+
+    if previous_graph is not None:
+        affected = changed_nodes(graph, previous_graph)
+    else:
+        affected = stale_nodes(graph, old_codes, tree, old_ids)
+    affected = expand(graph, affected | (old_codes < 0), hops)
+
+    vertex, membership = contraction(old_codes, affected)
+    g = contracted_graph(graph, vertex)
+    print(f"Affected nodes: {int(affected.sum())} of {graph.num_nodes}, "
+          f"contracted graph: {g.vcount()} vertices, {g.ecount()} edges")
+
+    _, codes = np.unique(run_algorithm(g, algorithm, membership, resolution, seed)[vertex], return_inverse=True)
+    ids, unchanged = match_ids(codes, old_codes, old_ids)
+    return codes, ids, unchanged
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--edges', default='src/data/edges.csv')
+    parser.add_argument('--nodes', default='src/data/statistical_nodes.csv')
+    parser.add_argument('--previous-edges', default=None, help="Edges of the previous run; without them changed communities are found from the stored metrics")
+    parser.add_argument('--tree', default='src/graph_dir/leiden_dir/cluster_tree_base.json')
+    parser.add_argument('--output', default=None, help="Defaults to --tree")
+    parser.add_argument('--algorithm', choices=ALGORITHMS, default='leiden')
+    parser.add_argument('--hops', type=int, default=0, help="Neighbourhoods of the changed nodes re-optimized with them")
+    parser.add_argument('--resolution', type=float, default=1, help="Leiden modularity resolution")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    graph = load_graph(args.edges, args.nodes)
+    previous_graph = load_graph(args.previous_edges) if args.previous_edges else None
+    tree = load_tree(args.tree)
+
+    codes, ids, unchanged = recluster(graph, tree, args.algorithm, previous_graph, args.hops, args.resolution, args.seed)
+
+    df = community_metrics(graph, codes)
+    modularity_score = df['modularity'].sum()
+    df = categorize_communities(df)
+    members = [graph.ids[codes == k] for k in range(len(ids))]
+    df['id'] = ids
+    df['changed'] = ~unchanged
+    write_cluster_tree(cluster_tree_base(df, dict(zip(ids, members))), args.output or args.tree)
+
+    new = sum(comm_id not in tree for comm_id in ids)
+    print(f"Communities: {len(ids)} ({int(unchanged.sum())} unchanged, {new} new, "
+          f"{len(set(tree) - set(ids))} dissolved)")
+    print(f"Modularity: {modularity_score:.4f}")
+    print(f"Done in {time.perf_counter() - start:.2f}s")
+
+if __name__ == "__main__":
+    main()
@@ -10,53 +10,18 @@ import sqlite3
 from datetime import datetime, timezone
 import random
 from prawcore.exceptions import RequestException, ResponseException, ServerError
-
-def setup_logging():
-    logging.basicConfig(
-        level=logging.INFO,
-    )
-
-# Database set-up functions
-# Creating main table
-def create_tables(conn):
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS posts(
-        id TEXT PRIMARY KEY,
-        subreddit TEXT,
-        author TEXT,
-        title TEXT,
-        date TEXT,
-        text TEXT,
-        num_comments INTEGER,
-        score INTEGER,
-        upvote_ratio REAL
-    )      
-    ''')
-
-    c.execute('''
-       CREATE TABLE IF NOT EXISTS comments(
-        post_id TEXT,
-        comment_id TEXT PRIMARY KEY,
-        text TEXT,
-        author TEXT,
-        date TEXT,
-        parent_id TEXT,
-        depth INTEGER,
-        num_replies INTEGER,
-        score INTEGER,
-        FOREIGN KEY (post_id) REFERENCES posts(id)
-    )  
-    ''')
-
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS scraping_state (
-            subreddit TEXT PRIMARY KEY,
-            newest_processed_utc REAL
-        )
-    ''')
-
-    conn.commit()
+from bulk_writer import BulkWriter, CommitPolicy, configure_connection
+from schema import create_tables, setup_logging, parent_comment_id
+
+# Bulk INSERT statements, listed parents first so that foreign keys hold on flush
+INSERT_STATEMENTS = {
+    'posts': '''INSERT OR IGNORE INTO posts
+                (id, subreddit, author, title, date, text, num_comments, score, upvote_ratio)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+    'comments': '''INSERT OR IGNORE INTO comments
+                   (post_id, comment_id, text, author, date, parent_id, depth, num_replies, score, parent_comment_id)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+}
 
 def get_last_timestamp(conn, subreddit_name):
     c = conn.cursor()
@@ -79,7 +44,7 @@ def set_last_timestamp(conn, subreddit_name, timestamp_utc):
 
     conn.commit()
 
-def reddit_scraping(subreddit, conn=None, max_posts_per_session=1000, batch_size=100):
+def reddit_scraping(subreddit, conn=None, max_posts_per_session=1000, batch_size=100, commit_interval=None):
     subreddit_name = subreddit.display_name
     
     # Retrieving last known timestamp in the db
@@ -87,8 +52,8 @@ def reddit_scraping(subreddit, conn=None, max_posts_per_session=1000, batch_size
     
     current_session_newest = None
     posts_processed = 0
-    ops_since_commit = 0
     total_comments_processed = 0
+    writer = BulkWriter(conn, INSERT_STATEMENTS, CommitPolicy(max_rows=batch_size, max_seconds=commit_interval))
     
     try:
         for submission in subreddit.new(limit=None):
@@ -107,9 +72,7 @@ def reddit_scraping(subreddit, conn=None, max_posts_per_session=1000, batch_size
                 break
             
             try:
-                posts_processed, ops_since_commit, comments_count = process_submission(
-                    submission, conn, posts_processed, ops_since_commit, batch_size
-                )
+                posts_processed, comments_count = process_submission(submission, writer, posts_processed)
                 total_comments_processed += comments_count
                 
             except Exception as e:
@@ -124,9 +87,7 @@ def reddit_scraping(subreddit, conn=None, max_posts_per_session=1000, batch_size
     
     finally:
         # Final commit
-        if ops_since_commit > 0:
-            conn.commit()
-            logging.info(f"Final commit di {ops_since_commit} ops")
+        writer.close()
         
         # If new posts have been found then updated the state param
         if current_session_newest is not None and current_session_newest > last_known_timestamp:
@@ -135,8 +96,7 @@ def reddit_scraping(subreddit, conn=None, max_posts_per_session=1000, batch_size
         
         logging.info(f"SCRAPE ENDED for r/{subreddit_name}. Processed: {posts_processed} post, {total_comments_processed} comments")
 
-def process_submission(submission, conn, posts_processed, ops_since_commit, batch_size):
-    c = conn.cursor()
+def process_submission(submission, writer, posts_processed):
     comments_processed = 0
 
     logging.info(f"Processing post {submission.id}")
@@ -144,100 +104,78 @@ def process_submission(submission, conn, posts_processed, ops_since_commit, batc
     # Skip post with empty body - images or other objs
     if not submission.selftext or submission.selftext.strip() == '':
         logging.debug(f"Skipping post {submission.id} - empty body")
-        return posts_processed, ops_since_commit, comments_processed
+        return posts_processed, comments_processed
     
-    post_data = {
-        'id': submission.id,
-        'subreddit_name': submission.subreddit.display_name,
-        'author': str(submission.author) if submission.author else "[deleted]",
-        'title': submission.title,
-        'date': datetime.fromtimestamp(submission.created_utc, timezone.utc).isoformat(),
-        'text': submission.selftext,
-        'num_comments': submission.num_comments,
-        'score': submission.score,
-        'upvote_ratio': submission.upvote_ratio
-    }
-    
-    try:
-        c.execute('''INSERT OR IGNORE INTO posts
-                  (id, subreddit, author, title, date, text, num_comments, score, upvote_ratio) 
-                  VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-            (post_data['id'], post_data['subreddit_name'], post_data['author'], 
-             post_data['title'], post_data['date'], post_data['text'], 
-             post_data['num_comments'], post_data['score'],post_data['upvote_ratio']))
-        ops_since_commit += 1
-    except Exception as e:
-        logging.error(f"ERROR during post loading {submission.id}: {e}")
-        return posts_processed, ops_since_commit, comments_processed
+    writer.add('posts', post_row(submission))
     
     # Separatelly processing comments
-    comments_processed = process_comments(submission, conn, ops_since_commit)
-    ops_since_commit += comments_processed
-    
-    # Commit batch
-    if ops_since_commit >= batch_size:
-        conn.commit()
-        ops_since_commit = 0
+    comments_processed = process_comments(submission, writer)
     
     posts_processed += 1
     logging.debug(f"Procesed post {submission.id} with {comments_processed} comments")
     
-    return posts_processed, ops_since_commit, comments_processed
+    return posts_processed, comments_processed
+
+# Row builders shared by the sequential and the concurrent scraper
+def post_row(submission):
+    return (
+        submission.id,
+        submission.subreddit.display_name,
+        str(submission.author) if submission.author else "[deleted]",
+        submission.title,
+        datetime.fromtimestamp(submission.created_utc, timezone.utc).isoformat(),
+        submission.selftext,
+        submission.num_comments,
+        submission.score,
+        submission.upvote_ratio
+    )
 
-def process_comments(submission, conn, initial_ops_count):
-    c = conn.cursor()
-    comments_processed = 0
-    ops_count = initial_ops_count
-    
+def comment_row(submission, comment):
+    # Skip empty comments or of automod
+    if (not comment.body or comment.body.strip() == '' or 
+        getattr(comment.author, 'name', '') == 'AutoModerator'):
+        return None
+
+    return (
+        submission.id,
+        comment.id,
+        comment.body,
+        str(comment.author) if comment.author else "[deleted]",
+        datetime.fromtimestamp(comment.created_utc, timezone.utc).isoformat(),
+        comment.parent_id,
+        getattr(comment, 'depth', 0),
+        len(comment.replies) if hasattr(comment, 'replies') else 0,
+        getattr(comment, 'score', 0),
+        parent_comment_id(comment.parent_id)
+    )
+
+def fetch_comments(submission):
     retries = 3
     while retries > 0:
         try:
             # Expand hidden comments (MoreComments)
             submission.comments.replace_more(limit=None)
-            
-            for comment in submission.comments.list():
-                # Skip empty comments or of automod
-                if (not comment.body or comment.body.strip() == '' or 
-                    getattr(comment.author, 'name', '') == 'AutoModerator'):
-                    continue
-                
-                comment_data = {
-                    'post_id': submission.id,
-                    'comment_id': comment.id,
-                    'text': comment.body,
-                    'author': str(comment.author) if comment.author else "[deleted]",
-                    'date': datetime.fromtimestamp(comment.created_utc, timezone.utc).isoformat(),
-                    'parent_id': comment.parent_id,
-                    'depth': getattr(comment, 'depth', 0),
-                    'num_replies': len(comment.replies) if hasattr(comment, 'replies') else 0,
-                    'score': getattr(comment, 'score', 0)
-                }
+            return submission.comments.list()
 
-                try:
-                    c.execute('''INSERT OR IGNORE INTO comments 
-                              (post_id, comment_id, text, author, date, parent_id, depth, num_replies, score)
-                              VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                            (comment_data['post_id'], comment_data['comment_id'], comment_data['text'],
-                            comment_data['author'], comment_data['date'], comment_data['parent_id'],
-                            comment_data['depth'], comment_data['num_replies'], comment_data['score']))
-                    ops_count += 1
-                    comments_processed += 1
-                    
-                except Exception as e:
-                    logging.error(f"ERROR during comment insertion {comment.id}: {e}")
-                    continue
-            
-            break
-            
         except (RequestException, ResponseException, ServerError, PrawcoreException) as e:
             retry_delay = 30 * (4 - retries)  # Exponential Backoff: 30, 60, 90 sec
             logging.warning(f"SERVER ERROR ({e}). Retry in {retry_delay}s... (Tries {4-retries}/3)")
             time.sleep(retry_delay)
             retries -= 1
-    else:
-        logging.error(f"FAILED fetching post's comments {submission.id}")
+
+    logging.error(f"FAILED fetching post's comments {submission.id}")
+    return []
+
+def process_comments(submission, writer):
+    rows = []
+    for comment in fetch_comments(submission):
+        row = comment_row(submission, comment)
+        if row is not None:
+            rows.append(row)
+
+    writer.add_many('comments', rows)
     
-    return comments_processed
+    return len(rows)
     
 def main():
     setup_logging()
@@ -255,6 +193,7 @@ def main():
     # SQL database connection
     conn = sqlite3.connect('reddit-posts.db')
     conn.execute("PRAGMA foreign_keys = ON") # Activate foreign keys
+    configure_connection(conn)
     create_tables(conn)
 
     start_time = time.time()
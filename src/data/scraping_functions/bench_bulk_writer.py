@@ -0,0 +1,102 @@
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from bulk_writer import BulkWriter, CommitPolicy, configure_connection
+
+# Micro-benchmark: rows/s of the old per-comment INSERT path vs the bulk writer
+# on a synthetic comment stream, each on a fresh on-disk database
+
+CREATE_COMMENTS = '''
+    CREATE TABLE comments(
+        post_id TEXT,
+        comment_id TEXT PRIMARY KEY,
+        text TEXT,
+        author TEXT,
+        date TEXT,
+        parent_id TEXT,
+        depth INTEGER,
+        num_replies INTEGER,
+        score INTEGER
+    )
+'''
+
+INSERT_COMMENT = '''INSERT OR IGNORE INTO comments
+                    (post_id, comment_id, text, author, date, parent_id, depth, num_replies, score)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)'''
+
+def synthetic_comments(n, seed=42):
+    rng = random.Random(seed)
+    for i in range(n):
+        post_id = f"p{i // 200}"
+        yield (
+            post_id,
+            f"c{i}",
+            "lorem ipsum " * rng.randint(5, 60),
+            f"user_{rng.randint(0, 5000)}",
+            datetime.fromtimestamp(1.735e9 + i, timezone.utc).isoformat(),
+            f"t1_c{rng.randint(0, i)}" if i and rng.random() < 0.7 else f"t3_{post_id}",
+            rng.randint(0, 8),
+            rng.randint(0, 5),
+            rng.randint(-10, 500),
+        )
+
+# Mirrors the original process_comments: a dict per comment, one execute per row,
+# commit every `batch_size` ops, default journal settings
+def old_path(conn, comments, batch_size=100):
+    c = conn.cursor()
+    ops = 0
+    for row in comments:
+        comment_data = dict(zip(
+            ['post_id', 'comment_id', 'text', 'author', 'date', 'parent_id', 'depth', 'num_replies', 'score'], row
+        ))
+        c.execute(INSERT_COMMENT, (
+            comment_data['post_id'], comment_data['comment_id'], comment_data['text'],
+            comment_data['author'], comment_data['date'], comment_data['parent_id'],
+            comment_data['depth'], comment_data['num_replies'], comment_data['score']))
+        ops += 1
+        if ops >= batch_size:
+            conn.commit()
+            ops = 0
+    conn.commit()
+
+def new_path(conn, comments, batch_size=5000):
+    configure_connection(conn)
+    writer = BulkWriter(conn, {'comments': INSERT_COMMENT}, CommitPolicy(max_rows=batch_size))
+    for row in comments:
+        writer.add('comments', row)
+    writer.close()
+
+def run(name, path_fn, rows, **kwargs):
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, 'bench.db'))
+        conn.execute(CREATE_COMMENTS)
+        conn.commit()
+
+        start = time.perf_counter()
+        path_fn(conn, synthetic_comments(rows), **kwargs)
+        elapsed = time.perf_counter() - start
+
+        stored = conn.execute('SELECT COUNT(*) FROM comments').fetchone()[0]
+        conn.close()
+
+    print(f"{name:<40} {stored:>9} rows {elapsed:>8.2f} s {stored / elapsed:>12,.0f} rows/s")
+    return stored / elapsed
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--old-batch-size', type=int, default=100)
+    parser.add_argument('--new-batch-size', type=int, default=5000)
+    args = parser.parse_args()
+
+    old = run(f"old (execute, commit/{args.old_batch_size})", old_path, args.rows, batch_size=args.old_batch_size)
+    new = run(f"bulk (executemany+WAL, commit/{args.new_batch_size})", new_path, args.rows, batch_size=args.new_batch_size)
+    print(f"Speed-up: {new / old:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import logging
+import sqlite3
+import time
+
+# Enables WAL journaling so that readers (converter, notebooks) don't block the scraper,
+# and relaxes fsyncs to checkpoints which is still crash-safe in WAL mode
+def configure_connection(conn):
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    return conn
+
+# Decides when buffered rows are committed: after `max_rows` rows, after `max_seconds`
+# since the last commit, or whichever comes first when both are set
+class CommitPolicy:
+    def __init__(self, max_rows=1000, max_seconds=None):
+        if max_rows is None and max_seconds is None:
+            raise ValueError("CommitPolicy needs at least one of max_rows or max_seconds")
+        self.max_rows = max_rows
+        self.max_seconds = max_seconds
+
+    def is_due(self, pending_rows, last_commit):
+        if pending_rows == 0:
+            return False
+        if self.max_rows is not None and pending_rows >= self.max_rows:
+            return True
+        if self.max_seconds is not None and time.monotonic() - last_commit >= self.max_seconds:
+            return True
+        return False
+
+# Buffers rows as tuples per statement and flushes them with executemany.
+# `statements` maps a name to its INSERT; buffers are flushed in the mapping order,
+# so parents (posts) must be listed before children (comments)
+class BulkWriter:
+    def __init__(self, conn, statements, policy=None):
+        self.conn = conn
+        self.statements = statements
+        self.policy = policy or CommitPolicy()
+        self.buffers = {name: [] for name in statements}
+        self.pending_rows = 0
+        self.total_rows = 0
+        self.last_commit = time.monotonic()
+
+    def add(self, name, row):
+        self.buffers[name].append(row)
+        self.pending_rows += 1
+        self.maybe_commit()
+
+    def add_many(self, name, rows):
+        rows = list(rows)
+        self.buffers[name].extend(rows)
+        self.pending_rows += len(rows)
+        self.maybe_commit()
+
+    def flush(self):
+        c = self.conn.cursor()
+        for name, rows in self.buffers.items():
+            if not rows:
+                continue
+            try:
+                c.executemany(self.statements[name], rows)
+            except sqlite3.Error as e:
+                # One bad row must not drop the whole batch: isolate it row by row
+                logging.warning(f"Bulk insert into {name} failed ({e}). Retrying row by row")
+                for row in rows:
+                    try:
+                        c.execute(self.statements[name], row)
+                    except sqlite3.Error as row_error:
+                        logging.error(f"ERROR during {name} insertion {row[:2]}: {row_error}")
+            rows.clear()
+
+    def commit(self):
+        self.flush()
+        self.conn.commit()
+        self.total_rows += self.pending_rows
+        self.pending_rows = 0
+        self.last_commit = time.monotonic()
+
+    def maybe_commit(self):
+        if self.policy.is_due(self.pending_rows, self.last_commit):
+            self.commit()
+            return True
+        return False
+
+    def close(self):
+        if self.pending_rows > 0:
+            logging.info(f"Final commit di {self.pending_rows} ops")
+        self.commit()
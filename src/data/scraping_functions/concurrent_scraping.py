@@ -0,0 +1,253 @@
+from concurrent.futures import ThreadPoolExecutor
+from prawcore.requestor import Requestor
+from dotenv import load_dotenv
+from datetime import datetime
+import threading
+import logging
+import sqlite3
+import queue
+import praw
+import time
+import os
+
+from bulk_writer import BulkWriter, CommitPolicy, configure_connection
+from schema import create_tables
+from advanced_scraping import (
+    INSERT_STATEMENTS, setup_logging, get_last_timestamp, set_last_timestamp,
+    post_row, comment_row, fetch_comments
+)
+
+# Reddit OAuth clients are allowed ~100 requests per minute
+DEFAULT_REQUESTS_PER_MINUTE = 100
+
+# Queue messages sent from the scraping workers to the writer
+POST, COMMENT, STATE, DONE = 'post', 'comment', 'state', 'done'
+
+# Raised in the workers once the writer has died, so that they stop instead of blocking on the queue
+class WriterError(Exception):
+    pass
+
+# Token bucket shared by all the workers: each HTTP request takes one token,
+# tokens refill continuously at `rate` per second up to `capacity`
+class TokenBucket:
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.last_refill = clock()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def per_minute(cls, requests_per_minute, burst=None):
+        return cls(requests_per_minute / 60, capacity=burst or max(1, requests_per_minute // 10))
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def acquire(self, tokens=1):
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            self.sleep(wait)
+
+# prawcore requestor taking a token of the shared limiter for every HTTP request, so that listing
+# pages, replace_more expansions and retries are all paced, across the per-worker clients
+class RateLimitedRequestor(Requestor):
+    def __init__(self, *args, limiter, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.limiter = limiter
+
+    def request(self, *args, **kwargs):
+        self.limiter.acquire()
+        return super().request(*args, **kwargs)
+
+def reddit_client(limiter):
+    return praw.Reddit(
+        client_id = os.getenv('REDDIT_CLIENT_ID'),
+        client_secret = os.getenv('REDDIT_CLIENT_SECRET'),
+        user_agent = os.getenv('REDDIT_USER_AGENT'),
+        requestor_class = RateLimitedRequestor,
+        requestor_kwargs = {'limiter': limiter}
+    )
+
+# Single writer owning the only SQLite connection: drains the queue into a BulkWriter,
+# which commits according to `policy` (rows and/or seconds)
+def sqlite_writer(db_path, rows_queue, num_workers, policy=None):
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA foreign_keys = ON")
+    configure_connection(conn)
+    create_tables(conn)
+    writer = BulkWriter(conn, INSERT_STATEMENTS, policy or CommitPolicy(max_rows=500, max_seconds=5))
+
+    workers_done = 0
+    totals = {POST: 0, COMMENT: 0}
+
+    try:
+        while workers_done < num_workers:
+            try:
+                kind, payload = rows_queue.get(timeout=1)
+            except queue.Empty:
+                # Lets the time-based policy fire while the workers wait on the limiter
+                writer.maybe_commit()
+                continue
+
+            if kind == POST:
+                writer.add('posts', payload)
+            elif kind == COMMENT:
+                writer.add('comments', payload)
+            elif kind == STATE:
+                # Rows of the subreddit must be durable before moving its watermark
+                writer.commit()
+                subreddit_name, newest_utc = payload
+                logging.info(f"UPDATING newest_processed_utc for r/{subreddit_name} a {datetime.fromtimestamp(newest_utc)}")
+                set_last_timestamp(conn, subreddit_name, newest_utc)
+                continue
+            elif kind == DONE:
+                workers_done += 1
+                continue
+
+            totals[kind] += 1
+    finally:
+        writer.close()
+        conn.close()
+
+    logging.info(f"WRITER ENDED. Stored: {totals[POST]} post, {totals[COMMENT]} comments")
+    return totals
+
+# Hands an item to the writer, giving up when the writer has died instead of blocking on a full queue
+def put_row(rows_queue, item, writer_failed, timeout=1):
+    while True:
+        if writer_failed.is_set():
+            raise WriterError("SQLite writer stopped")
+        try:
+            rows_queue.put(item, timeout=timeout)
+            return
+        except queue.Full:
+            continue
+
+# Scraping worker: same traversal as reddit_scraping, but rows are handed to the writer
+# instead of being inserted inline. API calls are paced by the client's RateLimitedRequestor
+def scrape_worker(subreddit, rows_queue, writer_failed, last_known_timestamp, max_posts_per_session=1000):
+    subreddit_name = subreddit.display_name
+    current_session_newest = None
+    posts_processed = 0
+    total_comments_processed = 0
+
+    try:
+        for submission in subreddit.new(limit=None):
+            if posts_processed >= max_posts_per_session:
+                logging.info(f"Reached max limit {max_posts_per_session} posts per session")
+                break
+
+            post_created_utc = submission.created_utc
+
+            if current_session_newest is None or post_created_utc > current_session_newest:
+                current_session_newest = post_created_utc
+
+            if post_created_utc < last_known_timestamp:
+                logging.info(f"Reached already-processed posts ({(datetime.fromtimestamp(post_created_utc))}). Exiting.")
+                break
+
+            # Skip post with empty body - images or other objs
+            if not submission.selftext or submission.selftext.strip() == '':
+                continue
+
+            try:
+                put_row(rows_queue, (POST, post_row(submission)), writer_failed)
+
+                for comment in fetch_comments(submission):
+                    row = comment_row(submission, comment)
+                    if row is not None:
+                        put_row(rows_queue, (COMMENT, row), writer_failed)
+                        total_comments_processed += 1
+
+            except WriterError:
+                raise
+            except Exception as e:
+                logging.error(f"ERROR for submission {submission.id}: {e}. Skipping.")
+                continue
+
+            posts_processed += 1
+
+    except WriterError:
+        raise
+    except Exception as e:
+        logging.error(f"ERROR in r/{subreddit_name}: {e}")
+
+    finally:
+        if not writer_failed.is_set():
+            if current_session_newest is not None and current_session_newest > last_known_timestamp:
+                put_row(rows_queue, (STATE, (subreddit_name, current_session_newest)), writer_failed)
+            put_row(rows_queue, (DONE, subreddit_name), writer_failed)
+
+        logging.info(f"SCRAPE ENDED for r/{subreddit_name}. Processed: {posts_processed} post, {total_comments_processed} comments")
+
+    return posts_processed, total_comments_processed
+
+# Runs one worker per subreddit and a single writer thread. `subreddits` only needs PRAW's
+# Subreddit interface, so a fake client can be passed in; rate limiting belongs to the clients
+# (see reddit_client). An exception of the writer stops the workers and is re-raised here
+def concurrent_scraping(subreddits, db_path='reddit-posts.db', max_workers=None,
+                        max_posts_per_session=1000, policy=None, queue_size=10000):
+    # Reading watermarks up-front so that workers never touch the database
+    conn = sqlite3.connect(db_path)
+    create_tables(conn)
+    last_timestamps = {sub.display_name: get_last_timestamp(conn, sub.display_name) for sub in subreddits}
+    conn.close()
+
+    rows_queue = queue.Queue(maxsize=queue_size)
+    writer_failed = threading.Event()
+
+    def run_writer():
+        try:
+            return sqlite_writer(db_path, rows_queue, len(subreddits), policy)
+        except BaseException:
+            writer_failed.set()
+            raise
+
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix='sqlite-writer') as writer_pool:
+        writer = writer_pool.submit(run_writer)
+
+        with ThreadPoolExecutor(max_workers=max_workers or len(subreddits)) as pool:
+            futures = [
+                pool.submit(scrape_worker, sub, rows_queue, writer_failed,
+                            last_timestamps[sub.display_name], max_posts_per_session)
+                for sub in subreddits
+            ]
+            for future in futures:
+                try:
+                    future.result()
+                except WriterError:
+                    pass
+
+        # The writer's own exception, if it died
+        return writer.result()
+
+def main():
+    setup_logging()
+    load_dotenv()
+
+    targeted_subreddits = ["PoliticalDiscussion", "AmItheAsshole", "offmychest", "changemyview", "TrueAskReddit", "unpopularopinion", "confession"]
+
+    requests_per_minute = int(os.getenv('REDDIT_REQUESTS_PER_MINUTE', DEFAULT_REQUESTS_PER_MINUTE))
+    limiter = TokenBucket.per_minute(requests_per_minute)
+
+    start_time = time.time()
+
+    # PRAW instances are not thread-safe: one client per worker, same credentials and limiter
+    subreddits = [reddit_client(limiter).subreddit(sub) for sub in targeted_subreddits]
+    concurrent_scraping(subreddits, db_path='reddit-posts.db')
+
+    elapsed_time = time.time() - start_time
+    logging.info(f"Total execution time: {elapsed_time} s")
+
+if __name__ == "__main__":
+    main()
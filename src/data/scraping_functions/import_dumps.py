@@ -0,0 +1,220 @@
+from datetime import datetime, timezone
+import argparse
+import logging
+import sqlite3
+import json
+import gzip
+import time
+import io
+
+from bulk_writer import BulkWriter, CommitPolicy, configure_connection
+from schema import create_tables, setup_logging, parent_comment_id
+
+# Offline importer for newline-delimited JSON Reddit dumps (plain, .gz or .zst).
+# Lines are streamed one at a time, so memory stays constant whatever the dump size
+
+IMPORT_STATEMENTS = {
+    'posts': '''INSERT OR IGNORE INTO posts
+                (id, subreddit, author, title, date, text, num_comments, score, upvote_ratio)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+    # Temporary list of the posts touched by this import
+    'imported_posts': 'INSERT OR IGNORE INTO imported_posts (id) VALUES (?)',
+    # Comments are kept only for posts that passed the filters, as the live scraper does
+    'comments': '''INSERT OR IGNORE INTO comments
+                   (post_id, comment_id, text, author, date, parent_id, depth, num_replies, score, parent_comment_id)
+                   SELECT ?, ?, ?, ?, ?, ?, ?, 0, ?, ?
+                   WHERE EXISTS (SELECT 1 FROM posts WHERE id = ?)''',
+}
+
+def open_dump(path):
+    if path.endswith('.zst'):
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("Reading .zst dumps requires the 'zstandard' package (pip install zstandard)")
+        # Pushshift/Arctic Shift archives are compressed with a long window
+        reader = zstandard.ZstdDecompressor(max_window_size=2**31).stream_reader(open(path, 'rb'))
+        return io.TextIOWrapper(reader, encoding='utf-8', errors='replace')
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', errors='replace')
+    return open(path, 'r', encoding='utf-8', errors='replace')
+
+def iter_records(path):
+    with open_dump(path) as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                logging.warning(f"Skipping malformed line {line_number} in {path}: {e}")
+
+def strip_prefix(fullname):
+    return fullname.split('_', 1)[1] if fullname and '_' in fullname else fullname
+
+def to_iso(created_utc):
+    return datetime.fromtimestamp(float(created_utc), timezone.utc).isoformat()
+
+# Same shape and filters as advanced_scraping.post_row
+def submission_record_row(record):
+    text = record.get('selftext')
+    # Skip post with empty body - images or other objs
+    if not text or text.strip() == '':
+        return None
+
+    return (
+        record['id'],
+        record.get('subreddit'),
+        record.get('author') or "[deleted]",
+        record.get('title'),
+        to_iso(record['created_utc']),
+        text,
+        record.get('num_comments', 0),
+        record.get('score', 0),
+        record.get('upvote_ratio'),
+    )
+
+# Same shape and filters as advanced_scraping.comment_row (num_replies is derived after the import)
+def comment_record_row(record):
+    body = record.get('body')
+    author = record.get('author') or "[deleted]"
+    # Skip empty comments or of automod
+    if not body or body.strip() == '' or author == 'AutoModerator':
+        return None
+
+    post_id = strip_prefix(record.get('link_id'))
+    return (
+        post_id,
+        record['id'],
+        body,
+        author,
+        to_iso(record['created_utc']),
+        record.get('parent_id'),
+        record.get('depth', 0),
+        record.get('score', 0),
+        parent_comment_id(record.get('parent_id')),
+        post_id,
+    )
+
+# Folds the newest imported post of each subreddit into the scraper watermark
+def update_scraping_state(conn, newest_by_subreddit):
+    c = conn.cursor()
+    for subreddit_name, newest_utc in newest_by_subreddit.items():
+        c.execute('''
+            INSERT INTO scraping_state (subreddit, newest_processed_utc) VALUES (?, ?)
+            ON CONFLICT(subreddit) DO UPDATE
+            SET newest_processed_utc = MAX(newest_processed_utc, excluded.newest_processed_utc)
+        ''', (subreddit_name, newest_utc))
+        logging.info(f"UPDATING newest_processed_utc for r/{subreddit_name} a {datetime.fromtimestamp(newest_utc)}")
+    conn.commit()
+
+# Dumps carry neither reply counts nor (always) depth: both are rebuilt in SQL for every thread
+# touched by the import (imported posts and posts of imported comments)
+def derive_comment_fields(conn, post_ids_table='imported_posts'):
+    c = conn.cursor()
+
+    c.execute(f'''
+        UPDATE comments
+        SET num_replies = (
+            SELECT COUNT(*) FROM comments AS r WHERE r.parent_comment_id = comments.comment_id
+        )
+        WHERE post_id IN (SELECT id FROM {post_ids_table})
+    ''')
+
+    # One level per pass, until every reply sits one below its parent
+    c.execute(f'''
+        UPDATE comments SET depth = 0
+        WHERE parent_comment_id IS NULL AND post_id IN (SELECT id FROM {post_ids_table})
+    ''')
+    while True:
+        c.execute(f'''
+            UPDATE comments
+            SET depth = (SELECT p.depth + 1 FROM comments AS p WHERE p.comment_id = comments.parent_comment_id)
+            WHERE parent_comment_id IS NOT NULL AND post_id IN (SELECT id FROM {post_ids_table})
+                AND depth IS NOT (SELECT p.depth + 1 FROM comments AS p WHERE p.comment_id = comments.parent_comment_id)
+                AND EXISTS (SELECT 1 FROM comments AS p WHERE p.comment_id = comments.parent_comment_id)
+        ''')
+        if c.rowcount <= 0:
+            break
+    conn.commit()
+
+def import_dumps(conn, submission_paths=(), comment_paths=(), subreddits=None, policy=None):
+    allowed = {s.lower() for s in subreddits} if subreddits else None
+    conn.execute('CREATE TEMP TABLE IF NOT EXISTS imported_posts (id TEXT PRIMARY KEY)')
+    writer = BulkWriter(conn, IMPORT_STATEMENTS, policy or CommitPolicy(max_rows=20000, max_seconds=30))
+    newest_by_subreddit = {}
+    stats = {'posts_read': 0, 'posts_kept': 0, 'comments_read': 0, 'comments_kept': 0}
+
+    # Submissions first: comments are only inserted when their post exists
+    for path in submission_paths:
+        logging.info(f"Importing submissions from {path}")
+        for record in iter_records(path):
+            stats['posts_read'] += 1
+            subreddit_name = record.get('subreddit')
+            # Without a subreddit the post could not be attributed, nor its watermark stored
+            if not subreddit_name:
+                continue
+            if allowed is not None and subreddit_name.lower() not in allowed:
+                continue
+
+            row = submission_record_row(record)
+            if row is None:
+                continue
+
+            writer.add('posts', row)
+            writer.add('imported_posts', (row[0],))
+            stats['posts_kept'] += 1
+
+            created_utc = float(record['created_utc'])
+            if created_utc > newest_by_subreddit.get(subreddit_name, 0):
+                newest_by_subreddit[subreddit_name] = created_utc
+
+    for path in comment_paths:
+        logging.info(f"Importing comments from {path}")
+        for record in iter_records(path):
+            stats['comments_read'] += 1
+            if allowed is not None and (record.get('subreddit') or '').lower() not in allowed:
+                continue
+
+            row = comment_record_row(record)
+            if row is None:
+                continue
+
+            writer.add('comments', row)
+            # Threads of posts scraped or imported earlier also get their reply counts rederived
+            writer.add('imported_posts', (row[0],))
+            stats['comments_kept'] += 1
+
+    writer.close()
+    derive_comment_fields(conn)
+    update_scraping_state(conn, newest_by_subreddit)
+
+    logging.info(f"IMPORT ENDED. Posts: {stats['posts_kept']}/{stats['posts_read']}, comments (before post filter): {stats['comments_kept']}/{stats['comments_read']}")
+    return stats
+
+def main():
+    setup_logging()
+
+    parser = argparse.ArgumentParser(description="Bulk import of NDJSON Reddit dumps into reddit-posts.db")
+    parser.add_argument('--db', default='reddit-posts.db')
+    parser.add_argument('--submissions', nargs='*', default=[], help="Submission dumps (.ndjson, .gz or .zst)")
+    parser.add_argument('--comments', nargs='*', default=[], help="Comment dumps (.ndjson, .gz or .zst)")
+    parser.add_argument('--subreddits', nargs='*', default=None, help="Keep only these subreddits")
+    parser.add_argument('--commit-rows', type=int, default=20000)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    conn.execute("PRAGMA foreign_keys = ON") # Activate foreign keys
+    configure_connection(conn)
+    create_tables(conn)
+
+    start_time = time.time()
+    import_dumps(conn, args.submissions, args.comments, args.subreddits, CommitPolicy(max_rows=args.commit_rows, max_seconds=30))
+    conn.close()
+
+    elapsed_time = time.time() - start_time
+    logging.info(f"Total execution time: {elapsed_time} s")
+
+if __name__ == "__main__":
+    main()
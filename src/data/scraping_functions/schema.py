@@ -0,0 +1,138 @@
+import logging
+
+# Database schema, and the helpers around it, shared by the scrapers, the dump importer and the
+# offline DB->CSV steps. Only the standard library is imported here, so the offline steps do not
+# need the Reddit client stack
+
+def setup_logging():
+    logging.basicConfig(
+        level=logging.INFO,
+    )
+
+# 't1_abc' -> 'abc' for replies to comments, None for top-level comments ('t3_...')
+def parent_comment_id(parent_id):
+    if parent_id and parent_id.startswith('t1_'):
+        return parent_id[3:]
+    return None
+
+# Database set-up functions
+# Creating main table
+def create_tables(conn):
+    c = conn.cursor()
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS posts(
+        id TEXT PRIMARY KEY,
+        subreddit TEXT,
+        author TEXT,
+        title TEXT,
+        date TEXT,
+        text TEXT,
+        num_comments INTEGER,
+        score INTEGER,
+        upvote_ratio REAL
+    )      
+    ''')
+
+    c.execute('''
+       CREATE TABLE IF NOT EXISTS comments(
+        post_id TEXT,
+        comment_id TEXT PRIMARY KEY,
+        text TEXT,
+        author TEXT,
+        date TEXT,
+        parent_id TEXT,
+        depth INTEGER,
+        num_replies INTEGER,
+        score INTEGER,
+        parent_comment_id TEXT,
+        FOREIGN KEY (post_id) REFERENCES posts(id)
+    )  
+    ''')
+
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS scraping_state (
+            subreddit TEXT PRIMARY KEY,
+            newest_processed_utc REAL
+        )
+    ''')
+
+    conn.commit()
+    migrate_schema(conn)
+
+# Schema migrations, tracked through PRAGMA user_version
+SCHEMA_VERSION = 2
+
+def migrate_schema(conn):
+    c = conn.cursor()
+    version = c.execute('PRAGMA user_version').fetchone()[0]
+
+    if version < 1:
+        # v1: parent comment id stored without the 't1_' prefix, so that the
+        # comment->comment self-join can be served by an index
+        columns = {row[1] for row in c.execute('PRAGMA table_info(comments)')}
+        if 'parent_comment_id' not in columns:
+            logging.info("Migrating comments: adding parent_comment_id")
+            c.execute('ALTER TABLE comments ADD COLUMN parent_comment_id TEXT')
+        c.execute('''
+            UPDATE comments SET parent_comment_id = SUBSTR(parent_id, 4)
+            WHERE parent_id LIKE 't1_%' AND parent_comment_id IS NULL
+        ''')
+
+        c.execute('CREATE INDEX IF NOT EXISTS idx_comments_post_author ON comments(post_id, author)')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_comments_parent_comment ON comments(parent_comment_id)')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_comments_author_date ON comments(author, date, num_replies)')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_posts_author_date ON posts(author, date, num_comments)')
+        c.execute('ANALYZE')
+
+    if version < 2:
+        # v2: ingestion order of posts and comments in an explicit ingest_seq column, drawn from a
+        # per-table counter by insert triggers. Unlike the implicit rowid of these TEXT-keyed
+        # tables, it is never renumbered by VACUUM nor reused after deletes, so it can serve as
+        # the watermark of incremental consumers (csv_query_converter.refresh_interactions)
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS ingest_sequence (
+                name TEXT PRIMARY KEY,
+                seq INTEGER NOT NULL
+            )
+        ''')
+        for table in ('posts', 'comments'):
+            columns = {row[1] for row in c.execute(f'PRAGMA table_info({table})')}
+            if 'ingest_seq' not in columns:
+                logging.info(f"Migrating {table}: adding ingest_seq")
+                c.execute(f'ALTER TABLE {table} ADD COLUMN ingest_seq INTEGER')
+            # Rows already stored keep their insertion order
+            c.execute(f'UPDATE {table} SET ingest_seq = rowid WHERE ingest_seq IS NULL')
+            c.execute(f'''
+                INSERT OR IGNORE INTO ingest_sequence (name, seq)
+                SELECT '{table}', COALESCE(MAX(ingest_seq), 0) FROM {table}
+            ''')
+            c.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_ingest_seq ON {table}(ingest_seq)')
+            c.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_ingest_seq AFTER INSERT ON {table}
+                BEGIN
+                    UPDATE ingest_sequence SET seq = seq + 1 WHERE name = '{table}';
+                    UPDATE {table} SET ingest_seq = (SELECT seq FROM ingest_sequence WHERE name = '{table}')
+                    WHERE rowid = NEW.rowid;
+                END
+            ''')
+
+        # Authors whose engagement changed after insertion: a post or comment crossing zero
+        # comments/replies (e.g. reply counts rederived by import_dumps) is logged, so that
+        # incremental builds recount those authors instead of keeping the insert-time value
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS engagement_changes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                author TEXT
+            )
+        ''')
+        for table, column in (('posts', 'num_comments'), ('comments', 'num_replies')):
+            c.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_engagement_change AFTER UPDATE OF {column} ON {table}
+                WHEN (OLD.{column} <> 0) IS NOT (NEW.{column} <> 0)
+                BEGIN
+                    INSERT INTO engagement_changes (author) VALUES (NEW.author);
+                END
+            ''')
+
+    c.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+    conn.commit()
@@ -3,6 +3,11 @@ from pprint import pprint
 import sqlite3
 from datetime import datetime
 import time
+from bulk_writer import BulkWriter, CommitPolicy, configure_connection
+
+INSERT_STATEMENTS = {
+    'posts': 'INSERT OR IGNORE INTO posts VALUES (?,?,?,?,?,?)',
+}
 
 def create_tables(conn):
     c = conn.cursor()
@@ -40,7 +45,7 @@ def set_last_after(conn,subreddit, after):
 
     conn.commit()
 
-def parse(subreddit, after='', conn=None):
+def parse(subreddit, after='', writer=None):
     url_tamplate = 'https://www.reddit.com/r/{}/top.json?t=all' # dynamic url
     headers = {
         'User-Agent' : 'Analysa'
@@ -50,7 +55,6 @@ def parse(subreddit, after='', conn=None):
     response = requests.get(url, headers=headers)
 
     if response.ok:
-        c = conn.cursor()
         data = response.json()['data']
         for post in data['children']:
             pdata = post['data']
@@ -63,9 +67,7 @@ def parse(subreddit, after='', conn=None):
 
             print(f'{post_id} ({score}) {title}')
             
-            c.execute('INSERT OR IGNORE INTO posts VALUES (?,?,?,?,?,?)',
-                     (post_id, title, score, author, date, url) )
-        conn.commit()
+            writer.add('posts', (post_id, title, score, author, date, url))
         return data['after']
     else:
         print(f'Error: {response.status_code}')
@@ -76,20 +78,30 @@ def main():
 
     # Connecting the database
     conn = sqlite3.connect('reddit-posts.db')
+    configure_connection(conn)
     create_tables(conn)
-
+    writer = BulkWriter(conn, INSERT_STATEMENTS, CommitPolicy(max_rows=500, max_seconds=30))
 
     after = get_last_after(conn, subreddit)
+    pending_after = None
     try:
         while True:
-            after = parse(subreddit, after, conn)
+            after = parse(subreddit, after, writer)
             if not after:
                 break 
-            set_last_after(conn, subreddit, after)
+            pending_after = after
+            # Cursor is saved only once the pages before it are committed
+            writer.maybe_commit()
+            if writer.pending_rows == 0:
+                set_last_after(conn, subreddit, after)
+                pending_after = None
             time.sleep(2)
     except KeyboardInterrupt:
         print('Exiting ... ')
     finally:
+        writer.close()
+        if pending_after:
+            set_last_after(conn, subreddit, pending_after)
         conn.close()
 
 if __name__ == "__main__":
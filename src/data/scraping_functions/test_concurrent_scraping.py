@@ -0,0 +1,148 @@
+import sqlite3
+import threading
+
+import pytest
+
+import concurrent_scraping
+from concurrent_scraping import RateLimitedRequestor, TokenBucket, concurrent_scraping as run_scraping
+
+# concurrent_scraping driven by fake PRAW Subreddit/Submission/Comment objects on a temporary
+# database: no network, no credentials
+
+class FakeComment:
+    def __init__(self, submission_id, n, parent_id=None):
+        self.id = f'{submission_id}_c{n}'
+        self.body = f'comment {n}'
+        self.author = f'user{n}'
+        self.created_utc = 1_700_000_000 + n
+        self.parent_id = parent_id or f't3_{submission_id}'
+        self.depth = 0 if parent_id is None else 1
+        self.replies = []
+        self.score = 1
+
+class FakeComments:
+    def __init__(self, comments):
+        self.comments = comments
+
+    def replace_more(self, limit=None):
+        pass
+
+    def list(self):
+        return self.comments
+
+class FakeSubmission:
+    def __init__(self, subreddit, n, num_comments=2):
+        self.id = f'{subreddit.display_name}_p{n}'
+        self.subreddit = subreddit
+        self.author = f'author{n}'
+        self.title = f'title {n}'
+        # Newest first, as subreddit.new()
+        self.created_utc = 1_700_000_000 - n
+        self.selftext = f'text {n}'
+        self.num_comments = num_comments
+        self.score = 10
+        self.upvote_ratio = 0.9
+        top = [FakeComment(self.id, i) for i in range(num_comments)]
+        self.comments = FakeComments(top + [FakeComment(self.id, num_comments, parent_id=f't1_{top[0].id}')])
+
+class FakeSubreddit:
+    def __init__(self, name, num_posts):
+        self.display_name = name
+        self.num_posts = num_posts
+
+    def new(self, limit=None):
+        for n in range(self.num_posts):
+            yield FakeSubmission(self, n)
+
+def count(db_path, table):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+    finally:
+        conn.close()
+
+def test_stores_every_subreddit(tmp_path):
+    db_path = str(tmp_path / 'reddit.db')
+    subreddits = [FakeSubreddit(f'sub{i}', num_posts=20) for i in range(4)]
+
+    totals = run_scraping(subreddits, db_path=db_path, queue_size=8)
+
+    assert totals == {'post': 80, 'comment': 240}
+    assert count(db_path, 'posts') == 80
+    assert count(db_path, 'comments') == 240
+    conn = sqlite3.connect(db_path)
+    state = dict(conn.execute('SELECT subreddit, newest_processed_utc FROM scraping_state'))
+    conn.close()
+    assert state == {f'sub{i}': 1_700_000_000 for i in range(4)}
+
+def test_resumes_from_watermark(tmp_path):
+    db_path = str(tmp_path / 'reddit.db')
+    run_scraping([FakeSubreddit('sub', num_posts=5)], db_path=db_path)
+
+    # Only the post at the watermark is seen again, and it is already stored
+    totals = run_scraping([FakeSubreddit('sub', num_posts=5)], db_path=db_path)
+
+    assert totals['post'] == 1
+    assert count(db_path, 'posts') == 5
+
+def test_writer_error_is_raised(tmp_path, monkeypatch):
+    def failing_writer(db_path, rows_queue, num_workers, policy=None):
+        rows_queue.get()
+        raise sqlite3.OperationalError('disk full')
+
+    monkeypatch.setattr(concurrent_scraping, 'sqlite_writer', failing_writer)
+    subreddits = [FakeSubreddit(f'sub{i}', num_posts=50) for i in range(3)]
+
+    # A small queue fills up at once: the workers must stop instead of blocking on put()
+    result = {}
+    def run():
+        try:
+            run_scraping(subreddits, db_path=str(tmp_path / 'reddit.db'), queue_size=2)
+        except Exception as e:
+            result['error'] = e
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout=30)
+
+    assert not thread.is_alive()
+    assert isinstance(result.get('error'), sqlite3.OperationalError)
+
+class FakeSession:
+    def __init__(self):
+        self.headers = {}
+        self.requests = 0
+
+    def request(self, *args, **kwargs):
+        self.requests += 1
+        return 'response'
+
+class CountingLimiter:
+    def __init__(self):
+        self.acquired = 0
+
+    def acquire(self, tokens=1):
+        self.acquired += tokens
+
+def test_requestor_takes_a_token_per_request():
+    limiter = CountingLimiter()
+    session = FakeSession()
+    requestor = RateLimitedRequestor(user_agent='test-agent', session=session, limiter=limiter)
+
+    for _ in range(3):
+        assert requestor.request('GET', 'https://oauth.reddit.com/r/test/new') == 'response'
+
+    assert limiter.acquired == session.requests == 3
+
+def test_token_bucket_waits_for_refill():
+    now = [0.0]
+    slept = []
+    def sleep(seconds):
+        slept.append(seconds)
+        now[0] += seconds
+
+    bucket = TokenBucket(rate=2, capacity=2, clock=lambda: now[0], sleep=sleep)
+    for _ in range(4):
+        bucket.acquire()
+
+    assert slept == pytest.approx([0.5, 0.5])
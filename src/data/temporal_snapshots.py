@@ -0,0 +1,140 @@
+import sqlite3
+import argparse
+import os
+from datetime import date, timedelta
+
+from csv_query_converter import (
+    create_tables, ENGAGEMENT_ROWS, POST_COMMENT_PAIRS, COMMENT_COMMENT_PAIRS,
+    ingest_watermarks, filter_graph, write_graph
+)
+
+# Temporal snapshots of the interaction graph. All windows are computed together:
+# posts/comments are read once and every row is bucketed into the windows it falls in
+# during aggregation, so N windows cost about as much as a single graph
+
+def month_windows(start, end):
+    windows = []
+    current = date(start.year, start.month, 1)
+    while current < end:
+        following = date(current.year + current.month // 12, current.month % 12 + 1, 1)
+        windows.append((current.strftime('%Y-%m'), current, following))
+        current = following
+    return windows
+
+def week_windows(start, end):
+    windows = []
+    current = start - timedelta(days=start.weekday())  # Weeks start on Monday
+    while current < end:
+        following = current + timedelta(days=7)
+        year, week, _ = current.isocalendar()
+        windows.append((f"{year}-W{week:02d}", current, following))
+        current = following
+    return windows
+
+def sliding_windows(start, end, size_days, step_days):
+    windows = []
+    current = start
+    while current + timedelta(days=size_days) <= end:
+        following = current + timedelta(days=size_days)
+        windows.append((f"{current.isoformat()}_{following.isoformat()}", current, following))
+        current += timedelta(days=step_days)
+    return windows
+
+def make_windows(freq, start, end, size_days=30, step_days=7):
+    if freq == 'monthly':
+        return month_windows(start, end)
+    if freq == 'weekly':
+        return week_windows(start, end)
+    if freq == 'sliding':
+        return sliding_windows(start, end, size_days, step_days)
+    raise ValueError(f"Unknown window frequency: {freq}")
+
+# An interaction belongs to a window when both its sides fall in it, which is what the
+# single '>= since' cutoff of csv_query_converter does with an open-ended window
+SNAPSHOT_ENGAGEMENT = f'''
+    INSERT INTO snapshot_engagement (label, author, engagement)
+    SELECT w.label, r.author, COUNT(*)
+    FROM ({ENGAGEMENT_ROWS}) AS r
+    JOIN snapshot_windows AS w ON r.date >= w.start AND r.date < w.end
+    GROUP BY w.label, r.author
+'''
+
+SNAPSHOT_INTERACTIONS = f'''
+    INSERT INTO snapshot_interactions (label, src, dst, weight)
+    SELECT w.label, MIN(r.src, r.dst) AS u, MAX(r.src, r.dst) AS v, COUNT(*)
+    FROM ({POST_COMMENT_PAIRS} UNION ALL {COMMENT_COMMENT_PAIRS}) AS r
+    JOIN snapshot_windows AS w
+        ON r.child_date >= w.start AND r.child_date < w.end
+        AND r.parent_date >= w.start AND r.parent_date < w.end
+    GROUP BY w.label, u, v
+'''
+
+def aggregate_snapshots(conn, windows):
+    c = conn.cursor()
+    c.execute('PRAGMA temp_store = FILE')
+    for table in ('snapshot_windows', 'snapshot_engagement', 'snapshot_interactions'):
+        c.execute(f'DROP TABLE IF EXISTS temp.{table}')
+
+    c.execute('CREATE TEMP TABLE snapshot_windows (label TEXT PRIMARY KEY, start TEXT, end TEXT)')
+    c.executemany('INSERT INTO snapshot_windows VALUES (?, ?, ?)',
+                  [(label, start.isoformat(), end.isoformat()) for label, start, end in windows])
+    c.execute('CREATE TEMP TABLE snapshot_engagement (label TEXT, author TEXT, engagement INTEGER)')
+    c.execute('CREATE TEMP TABLE snapshot_interactions (label TEXT, src TEXT, dst TEXT, weight INTEGER)')
+
+    # Full ingest_seq range, cut at the earliest window start
+    new_posts, new_comments = ingest_watermarks(conn)
+    params = {
+        'old_posts': 0, 'new_posts': new_posts,
+        'old_comments': 0, 'new_comments': new_comments,
+        'since': min(start for _, start, _ in windows).isoformat(),
+    }
+    c.execute(SNAPSHOT_ENGAGEMENT, params)
+    c.execute(SNAPSHOT_INTERACTIONS, params)
+
+    c.execute('CREATE INDEX temp.idx_snapshot_engagement ON snapshot_engagement(label)')
+    c.execute('CREATE INDEX temp.idx_snapshot_interactions ON snapshot_interactions(label)')
+
+def export_snapshots(conn, windows, out_dir='src/data/snapshots'):
+    aggregate_snapshots(conn, windows)
+    c = conn.cursor()
+
+    for label, start, end in windows:
+        print(f"=== Window {label} [{start}, {end}) ===")
+        c.execute('SELECT author, engagement FROM snapshot_engagement WHERE label = ?', (label,))
+        all_users = {user: count for user, count in c.fetchall()}
+        c.execute('SELECT src, dst, weight FROM snapshot_interactions WHERE label = ?', (label,))
+        edge_dict = {(u, v): w for u, v, w in c.fetchall()}
+
+        if not all_users or not edge_dict:
+            print("No interactions in this window, skipping")
+            continue
+
+        final_nodes, final_edges = filter_graph(all_users, edge_dict)
+
+        window_dir = os.path.join(out_dir, label)
+        os.makedirs(window_dir, exist_ok=True)
+        write_graph(final_nodes, final_edges,
+                    os.path.join(window_dir, 'nodes.csv'), os.path.join(window_dir, 'edges.csv'))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--freq', choices=['monthly', 'weekly', 'sliding'], default='monthly')
+    parser.add_argument('--start', type=date.fromisoformat, default=date(2025, 1, 1))
+    parser.add_argument('--end', type=date.fromisoformat, default=date.today())
+    parser.add_argument('--size-days', type=int, default=30, help="Sliding window length")
+    parser.add_argument('--step-days', type=int, default=7, help="Sliding window step")
+    parser.add_argument('--out-dir', default='src/data/snapshots')
+    args = parser.parse_args()
+
+    windows = make_windows(args.freq, args.start, args.end, args.size_days, args.step_days)
+    if not windows:
+        window = f"{args.size_days}-day windows" if args.freq == 'sliding' else f"{args.freq} windows"
+        parser.error(f"No {window} fit in [{args.start}, {args.end})")
+    print(f"Computing {len(windows)} {args.freq} snapshots")
+
+    connection = sqlite3.connect('reddit-posts.db')
+    create_tables(connection)  # Applies pending schema migrations
+    export_snapshots(connection, windows, args.out_dir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+import pytest
+
+pa = pytest.importorskip('pyarrow')
+pq = pytest.importorskip('pyarrow.parquet')
+
+from artifacts import ArtifactWriter
+
+# ArtifactWriter batches whose first rows carry no value for a column
+
+def test_null_first_batch_is_widened(tmp_path):
+    path = str(tmp_path / 'texts.csv')
+    with ArtifactWriter(path, ['author', 'score', 'date'], csv_copy=True) as writer:
+        writer.write([('a', None, None), ('b', None, None)])
+        writer.write([('c', 1.5, None)])
+        writer.write([('d', 2.0, '2025-01-01')])
+
+    table = pq.read_table(str(tmp_path / 'texts.parquet'))
+    assert table.schema.field('score').type == pa.float64()
+    assert table.column('author').to_pylist() == ['a', 'b', 'c', 'd']
+    assert table.column('score').to_pylist() == [None, None, 1.5, 2.0]
+    assert table.column('date').to_pylist() == [None, None, None, '2025-01-01']
+
+def test_explicit_types(tmp_path):
+    path = str(tmp_path / 'nodes.csv')
+    with ArtifactWriter(path, ['id', 'engagement'], types={'id': 'string', 'engagement': 'int64'}) as writer:
+        writer.write([(None, None)])
+        writer.write([('u', 3)])
+
+    table = pq.read_table(str(tmp_path / 'nodes.parquet'))
+    assert table.column('id').to_pylist() == [None, 'u']
+    assert table.column('engagement').to_pylist() == [None, 3]
+    assert table.schema.field('engagement').type == pa.int64()
+
+def test_empty_writer_keeps_types(tmp_path):
+    path = str(tmp_path / 'edges.csv')
+    ArtifactWriter(path, ['source', 'weight'], types={'weight': 'double'}).close()
+
+    table = pq.read_table(str(tmp_path / 'edges.parquet'))
+    assert table.schema.field('source').type == pa.string()
+    assert table.schema.field('weight').type == pa.float64()
@@ -0,0 +1,146 @@
+import random
+import sqlite3
+from collections import Counter
+
+import pytest
+
+from csv_query_converter import refresh_interactions
+from schema import create_tables
+
+# Incremental builds of user_engagement / user_interactions against a rebuild from scratch and
+# against the interaction rules computed in Python, on a small random database
+
+SINCE = '2025-01-01'
+USERS = [f'user{i}' for i in range(25)] + ['[deleted]']
+
+class Thread:
+    def __init__(self, conn, rng):
+        self.conn = conn
+        self.rng = rng
+        self.posts = 0
+        self.comments = []
+
+    def date(self, earlier=False):
+        # Some rows fall before the cutoff, and backfilled ones are dated before the earlier inserts
+        month = self.rng.randint(1, 3) if earlier else self.rng.randint(4, 12)
+        year = 2024 if self.rng.random() < 0.1 else 2025
+        return f'{year}-{month:02d}-{self.rng.randint(1, 28):02d}T00:00:00+00:00'
+
+    def add_posts(self, num_posts, earlier=False):
+        for _ in range(num_posts):
+            post_id = f'p{self.posts}'
+            self.posts += 1
+            self.conn.execute('''
+                INSERT INTO posts (id, subreddit, author, title, date, text, num_comments, score, upvote_ratio)
+                VALUES (?, 'sub', ?, 'title', ?, ?, ?, 1, 1.0)
+            ''', (post_id, self.rng.choice(USERS), self.date(earlier),
+                  '[removed]' if self.rng.random() < 0.05 else 'text', self.rng.randint(0, 3)))
+            thread = []
+            for _ in range(self.rng.randint(0, 6)):
+                self.add_comment(post_id, self.rng.choice(thread) if thread and self.rng.random() < 0.5 else None,
+                                 earlier, thread)
+        self.conn.commit()
+
+    def add_comment(self, post_id, parent, earlier, thread):
+        comment_id = f'c{len(self.comments)}'
+        self.comments.append(comment_id)
+        thread.append(comment_id)
+        self.conn.execute('''
+            INSERT INTO comments (post_id, comment_id, text, author, date, parent_id, depth, num_replies, score, parent_comment_id)
+            VALUES (?, ?, ?, ?, ?, ?, 0, ?, 1, ?)
+        ''', (post_id, comment_id, '[removed]' if self.rng.random() < 0.05 else 'text', self.rng.choice(USERS),
+              self.date(earlier), f't1_{parent}' if parent else f't3_{post_id}', self.rng.randint(0, 1), parent))
+
+def tables(conn):
+    engagement = dict(conn.execute('SELECT author, engagement FROM user_engagement'))
+    interactions = {(src, dst): weight for src, dst, weight in conn.execute('SELECT src, dst, weight FROM user_interactions')}
+    return engagement, interactions
+
+# The interaction rules of csv_query_converter, row by row
+def expected_tables(conn):
+    posts = {row[0]: row for row in conn.execute('SELECT id, author, date, text, num_comments FROM posts')}
+    comments = {row[0]: row for row in conn.execute(
+        'SELECT comment_id, post_id, author, date, text, num_replies, parent_comment_id FROM comments')}
+
+    engagement = Counter()
+    for _, author, date, _, num_comments in posts.values():
+        if author != '[deleted]' and num_comments != 0 and date >= SINCE:
+            engagement[author] += 1
+    for _, _, author, date, _, num_replies, _ in comments.values():
+        if author != '[deleted]' and num_replies != 0 and date >= SINCE:
+            engagement[author] += 1
+
+    def pair(src, dst, src_date, dst_date, src_text, dst_text):
+        if ('[deleted]' not in (src, dst) and src != dst and '[removed]' not in (src_text, dst_text)
+                and src_date >= SINCE and dst_date >= SINCE):
+            interactions[(min(src, dst), max(src, dst))] += 1
+
+    interactions = Counter()
+    for _, post_id, author, date, text, _, parent in comments.values():
+        if post_id in posts:
+            _, post_author, post_date, post_text, _ = posts[post_id]
+            pair(post_author, author, post_date, date, post_text, text)
+        if parent in comments:
+            _, _, parent_author, parent_date, parent_text, _, _ = comments[parent]
+            pair(author, parent_author, date, parent_date, text, parent_text)
+    return dict(engagement), dict(interactions)
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'reddit.db'))
+    create_tables(conn)
+    yield conn
+    conn.close()
+
+def rebuild(conn):
+    refresh_interactions(conn, since=SINCE, rebuild=True)
+    return tables(conn)
+
+def test_incremental_build_matches_rebuild(conn):
+    thread = Thread(conn, random.Random(3))
+    thread.add_posts(40)
+    refresh_interactions(conn, since=SINCE)
+
+    # New rows, then a backfill dated before everything already built
+    thread.add_posts(30)
+    refresh_interactions(conn, since=SINCE)
+    thread.add_posts(20, earlier=True)
+    refresh_interactions(conn, since=SINCE)
+
+    incremental = tables(conn)
+    assert incremental == rebuild(conn)
+    assert incremental == expected_tables(conn)
+
+def test_late_replies_and_reply_count_changes(conn):
+    thread = Thread(conn, random.Random(5))
+    thread.add_posts(40)
+    refresh_interactions(conn, since=SINCE)
+
+    # Replies to comments built earlier, and reply counts rederived after insertion
+    for i, parent in enumerate(thread.comments[:15]):
+        post_id = conn.execute('SELECT post_id FROM comments WHERE comment_id = ?', (parent,)).fetchone()[0]
+        thread.add_comment(post_id, parent, earlier=i % 2 == 0, thread=[])
+    conn.execute('UPDATE comments SET num_replies = 1 - num_replies WHERE rowid % 4 = 0')
+    conn.commit()
+    refresh_interactions(conn, since=SINCE)
+
+    incremental = tables(conn)
+    assert incremental == rebuild(conn)
+    assert incremental == expected_tables(conn)
+
+def test_vacuum_does_not_lose_rows(conn):
+    thread = Thread(conn, random.Random(7))
+    thread.add_posts(30)
+    refresh_interactions(conn, since=SINCE)
+
+    # Comments of deleted accounts count nowhere; removing them lets VACUUM renumber the rowids,
+    # so that the next rows get rowids below those already built
+    conn.execute("DELETE FROM comments WHERE author = '[deleted]'")
+    conn.commit()
+    conn.execute('VACUUM')
+    thread.add_posts(10)
+    refresh_interactions(conn, since=SINCE)
+
+    incremental = tables(conn)
+    assert incremental == rebuild(conn)
+    assert incremental == expected_tables(conn)
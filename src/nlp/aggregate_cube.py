@@ -0,0 +1,280 @@
+import argparse
+import sqlite3
+import time
+import sys
+import os
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data'))
+from artifacts import read_artifact
+
+# Materialized aggregates of the texts for the research questions and the chatbot, so that a
+# question such as "sentiment trend of topic X among bridges" reads a few cube rows instead of
+# re-joining topic_data, hub_bridge_df and the score artifacts. Cells are keyed by
+#   cube_day    (community_id, community_type, role, topic_id, day)
+#   cube_month  (community_type, role, topic_id, month), the roll-up used when the question
+#               needs neither the community nor the day
+# and hold the text count plus sentiment sums (neg/neu/pos probabilities and the -1/0/1
+# polarity of 1st_rq.ipynb, over n_sentiment texts) and emotion score sums (over n_emotion).
+# Updates are deltas folded with upserts, as csv_query_converter folds interactions:
+# cube_texts remembers the cell of every text already counted and whether its sentiment and
+# emotion scores were added, so new texts, and scores arriving after their texts, are added
+# once. Texts of authors outside the graph have community_id -1 and an empty type and role.
+# A new partition or role assignment changes the cells of old texts: rebuild the cube then
+
+DEFAULT_CUBE = 'src/nlp/aggregate_cube.db'
+SENTIMENT_MEASURES = ['neg_sum', 'neu_sum', 'pos_sum', 'polarity_sum']
+SENTIMENT_COLUMNS = {'neg_sum': 'neg_percentage', 'neu_sum': 'neu_percentage', 'pos_sum': 'pos_percentage'}
+POLARITY = {'negative': -1, 'neutral': 0, 'positive': 1}
+
+CUBES = {
+    'cube_day': ['community_id', 'community_type', 'role', 'topic_id', 'day'],
+    'cube_month': ['community_type', 'role', 'topic_id', 'month'],
+}
+
+def create_cube_tables(conn):
+    c = conn.cursor()
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS cube_texts (
+            id TEXT PRIMARY KEY,
+            community_id INTEGER,
+            community_type TEXT,
+            role TEXT,
+            topic_id INTEGER,
+            day TEXT,
+            has_sentiment INTEGER DEFAULT 0,
+            has_emotion INTEGER DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+    measures = ', '.join(f'{m} REAL DEFAULT 0' for m in SENTIMENT_MEASURES)
+    for table, keys in CUBES.items():
+        key_columns = ', '.join(keys)
+        c.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                {key_columns},
+                n INTEGER DEFAULT 0,
+                n_sentiment INTEGER DEFAULT 0,
+                n_emotion INTEGER DEFAULT 0,
+                {measures},
+                PRIMARY KEY ({key_columns})
+            ) WITHOUT ROWID
+        ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_cube_day_topic_day ON cube_day(topic_id, day)')
+    c.execute('CREATE TABLE IF NOT EXISTS cube_topics (topic_id INTEGER PRIMARY KEY, topic TEXT)')
+    conn.commit()
+
+def table_columns(conn, table):
+    return [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+
+# Emotion sums are one emo_<label> column per GoEmotions label, added the first time the label
+# is seen
+def ensure_emotion_columns(conn, labels):
+    for table in CUBES:
+        existing = set(table_columns(conn, table))
+        for label in labels:
+            if f'emo_{label}' not in existing:
+                conn.execute(f'ALTER TABLE {table} ADD COLUMN emo_{label} REAL DEFAULT 0')
+
+# Cell of each text: topic_data rows joined with the hub_bridge_df roles of their authors
+def text_cells(texts, users):
+    users = users.drop_duplicates('id').set_index('id')
+    cells = pd.DataFrame({'id': texts['id'].astype(str).to_numpy()})
+    author_rows = users.reindex(texts['author'].to_numpy())
+    cells['community_id'] = author_rows['community_id'].fillna(-1).astype(np.int64).to_numpy()
+    cells['community_type'] = author_rows['community_type'].fillna('').astype(str).to_numpy()
+    is_hub = author_rows['is_hub'].fillna(False).astype(bool).to_numpy()
+    is_bridge = author_rows['is_bridge'].fillna(False).astype(bool).to_numpy()
+    cells['role'] = np.where(is_hub, 'Hub', np.where(is_bridge, 'Bridge', 'Average'))
+    cells.loc[cells['community_id'] < 0, 'role'] = ''
+    cells['topic_id'] = texts['topic_id'].astype(np.int64).to_numpy()
+    cells['day'] = pd.to_datetime(texts['date'], utc=True).dt.strftime('%Y-%m-%d').to_numpy()
+    return cells
+
+def load_temp(conn, name, df):
+    conn.execute(f'DROP TABLE IF EXISTS temp.{name}')
+    conn.execute(f'CREATE TEMP TABLE {name} ({", ".join(df.columns)})')
+    rows = df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+    conn.executemany(f'INSERT INTO {name} VALUES ({", ".join("?" * len(df.columns))})', rows)
+
+# Adds the sums of `source` (a temp table with the cell columns of cube_texts) to both cubes
+def upsert_cells(conn, source, measures):
+    for table, keys in CUBES.items():
+        select_keys = [("substr(day, 1, 7) AS month" if key == 'month' else key) for key in keys]
+        conn.execute(f'''
+            INSERT INTO {table} ({", ".join(keys + list(measures))})
+            SELECT {", ".join(select_keys + [f"{expr} AS {m}" for m, expr in measures.items()])}
+            FROM {source}
+            WHERE true
+            GROUP BY {", ".join(keys)}
+            ON CONFLICT({", ".join(keys)}) DO UPDATE SET
+                {", ".join(f"{m} = {m} + excluded.{m}" for m in measures)}
+        ''')
+
+def add_texts(conn, texts, users):
+    cells = text_cells(texts, users).drop_duplicates('id')
+    load_temp(conn, 'new_texts', cells)
+    conn.execute('DROP TABLE IF EXISTS temp.added_texts')
+    conn.execute('''
+        CREATE TEMP TABLE added_texts AS
+        SELECT * FROM new_texts WHERE id NOT IN (SELECT id FROM cube_texts)
+    ''')
+    conn.execute('''
+        INSERT INTO cube_texts (id, community_id, community_type, role, topic_id, day)
+        SELECT id, community_id, community_type, role, topic_id, day FROM added_texts
+    ''')
+    upsert_cells(conn, 'added_texts', {'n': 'COUNT(*)'})
+
+    topics = texts[['topic_id', 'topic']].drop_duplicates('topic_id')
+    conn.executemany('INSERT OR REPLACE INTO cube_topics (topic_id, topic) VALUES (?, ?)',
+                     topics.astype(object).itertuples(index=False, name=None))
+    return conn.execute('SELECT COUNT(*) FROM added_texts').fetchone()[0]
+
+# Scores of texts already in the cube whose scores of this kind were not added yet
+def add_scores(conn, scores, flag, measures, count_column):
+    load_temp(conn, 'new_scores', scores)
+    conn.execute('DROP TABLE IF EXISTS temp.added_scores')
+    conn.execute(f'''
+        CREATE TEMP TABLE added_scores AS
+        SELECT t.id, t.community_id, t.community_type, t.role, t.topic_id, t.day, s.*
+        FROM new_scores AS s
+        JOIN cube_texts AS t ON t.id = s.score_id
+        WHERE t.{flag} = 0
+    ''')
+    upsert_cells(conn, 'added_scores', {count_column: 'COUNT(*)', **{m: f'SUM({m})' for m in measures}})
+    conn.execute(f'UPDATE cube_texts SET {flag} = 1 WHERE id IN (SELECT id FROM added_scores)')
+    return conn.execute('SELECT COUNT(*) FROM added_scores').fetchone()[0]
+
+def add_sentiments(conn, sentiments, model):
+    sentiments = sentiments[(sentiments['model'] == model) & sentiments['predicted_sentiment'].notna()]
+    scores = pd.DataFrame({'score_id': sentiments['id'].astype(str).to_numpy()})
+    for measure, column in SENTIMENT_COLUMNS.items():
+        scores[measure] = sentiments[column].astype(float).to_numpy()
+    scores['polarity_sum'] = sentiments['predicted_sentiment'].map(POLARITY).to_numpy()
+    return add_scores(conn, scores.drop_duplicates('score_id'), 'has_sentiment', SENTIMENT_MEASURES, 'n_sentiment')
+
+def add_emotions(conn, emotions):
+    labels = [column[:-len('_score')] for column in emotions.columns if column.endswith('_score')]
+    ensure_emotion_columns(conn, labels)
+    scores = pd.DataFrame({'score_id': emotions['id'].astype(str).to_numpy()})
+    for label in labels:
+        scores[f'emo_{label}'] = emotions[f'{label}_score'].astype(float).to_numpy()
+    return add_scores(conn, scores.drop_duplicates('score_id'), 'has_emotion',
+                      [f'emo_{label}' for label in labels], 'n_emotion')
+
+# Folds new texts and scores into the cube in one transaction; any argument can be None
+def update_cube(conn, texts=None, users=None, sentiments=None, emotions=None, model='bertweet'):
+    added = {'texts': 0, 'sentiments': 0, 'emotions': 0}
+    with conn:
+        if texts is not None:
+            added['texts'] = add_texts(conn, texts, users)
+        if sentiments is not None:
+            added['sentiments'] = add_sentiments(conn, sentiments, model)
+        if emotions is not None:
+            added['emotions'] = add_emotions(conn, emotions)
+    return added
+
+def clear_cube(conn):
+    with conn:
+        for table in ['cube_texts', 'cube_topics'] + list(CUBES):
+            conn.execute(f'DELETE FROM {table}')
+
+# Measures a query can ask for: the stored sums and counts, and <measure>_mean for the
+# sentiment (over n_sentiment) and emotion (over n_emotion) sums
+def measure_expression(name, columns):
+    if name in ('n', 'n_sentiment', 'n_emotion') or (name in columns and (name.endswith('_sum') or name.startswith('emo_'))):
+        return f'SUM({name})'
+    base = name[:-len('_mean')] if name.endswith('_mean') else None
+    if base is not None and base + '_sum' in SENTIMENT_MEASURES:
+        return f'CAST(SUM({base}_sum) AS REAL) / NULLIF(SUM(n_sentiment), 0)'
+    if base is not None and base.startswith('emo_') and base in columns:
+        return f'SUM({base}) / NULLIF(SUM(n_emotion), 0)'
+    raise ValueError(f"Unknown measure: {name}")
+
+# Aggregates grouped by `by` among community_id, community_type, role, topic_id, topic, day and
+# month, with equality (or list membership) filters in `where`. Month-level questions that
+# involve neither the community nor the day are answered from cube_month
+def query_cube(conn, by=('day',), where=None, measures=('n', 'polarity_mean')):
+    by, where = list(by), dict(where or {})
+    dimensions = set(by) | set(where)
+    table = 'cube_month' if dimensions <= {'community_type', 'role', 'topic_id', 'topic', 'month'} else 'cube_day'
+    columns = table_columns(conn, table)
+    expressions = {'month': 'substr(day, 1, 7)' if table == 'cube_day' else 'month', 'topic': 'cube_topics.topic'}
+    for dimension in dimensions:
+        if dimension not in CUBES['cube_day'] + ['month', 'topic']:
+            raise ValueError(f"Unknown dimension: {dimension}")
+
+    select = [f'{expressions.get(d, f"{table}.{d}")} AS {d}' for d in by]
+    select += [f'{measure_expression(m, columns)} AS {m}' for m in measures]
+    sql = f'SELECT {", ".join(select)} FROM {table}'
+    if 'topic' in dimensions:
+        sql += f' JOIN cube_topics ON cube_topics.topic_id = {table}.topic_id'
+
+    params = []
+    conditions = []
+    for dimension, value in where.items():
+        values = list(value) if isinstance(value, (list, tuple, set)) else [value]
+        conditions.append(f'{expressions.get(dimension, f"{table}.{dimension}")} IN ({", ".join("?" * len(values))})')
+        params.extend(v.item() if isinstance(v, np.generic) else v for v in values)
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(conditions)
+    if by:
+        sql += f' GROUP BY {", ".join(by)} ORDER BY {", ".join(by)}'
+    return pd.read_sql_query(sql, conn, params=params)
+
+def open_cube(path=DEFAULT_CUBE):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    create_cube_tables(conn)
+    return conn
+
+# Score artifacts that were not produced yet are skipped, their scores are added by a later update
+def read_optional(path):
+    try:
+        return read_artifact(path)
+    except FileNotFoundError:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Materialized community x topic x role x day aggregates")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    update = subparsers.add_parser('update', help="Fold new texts and scores into the cube")
+    update.add_argument('--topics', default='src/nlp/topic_modeling/topic_data.csv')
+    update.add_argument('--users', default='src/data/distribuitions/hub_bridge_df.csv')
+    update.add_argument('--sentiments', default='src/nlp/sentiment/sentiment_scores.csv')
+    update.add_argument('--emotions', default='src/nlp/sentiment/emotion_scores.csv')
+    update.add_argument('--model', default='bertweet', help="Sentiment model of the sums")
+    update.add_argument('--rebuild', action='store_true', help="Start from an empty cube (new partition or roles)")
+    query = subparsers.add_parser('query')
+    query.add_argument('--by', nargs='+', default=['day'])
+    query.add_argument('--measures', nargs='+', default=['n', 'polarity_mean'])
+    query.add_argument('--topic-id', type=int, nargs='+', default=None)
+    query.add_argument('--community-id', type=int, nargs='+', default=None)
+    query.add_argument('--community-type', nargs='+', default=None)
+    query.add_argument('--role', nargs='+', default=None)
+    for subparser in (update, query):
+        subparser.add_argument('--cube', default=DEFAULT_CUBE)
+    args = parser.parse_args()
+
+    conn = open_cube(args.cube)
+    if args.command == 'update':
+        if args.rebuild:
+            clear_cube(conn)
+        start = time.perf_counter()
+        texts = read_artifact(args.topics, columns=['author', 'id', 'date', 'topic', 'topic_id'])
+        users = read_artifact(args.users, columns=['id', 'community_id', 'community_type', 'is_hub', 'is_bridge'])
+        sentiments = read_optional(args.sentiments)
+        emotions = read_optional(args.emotions)
+        added = update_cube(conn, texts, users, sentiments, emotions, args.model)
+        print(f"added {added['texts']} texts, {added['sentiments']} sentiment and {added['emotions']} emotion scores "
+              f"in {time.perf_counter() - start:.1f}s")
+    else:
+        where = {name: value for name, value in [('topic_id', args.topic_id), ('community_id', args.community_id),
+                                                  ('community_type', args.community_type), ('role', args.role)]
+                 if value is not None}
+        print(query_cube(conn, args.by, where, args.measures).to_string(index=False))
+    conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import argparse
+import os
+import random
+import string
+import tempfile
+import time
+import sys
+from collections import Counter
+
+import pandas as pd
+import regex as re
+from nltk import pos_tag, word_tokenize
+from nltk.corpus import stopwords, wordnet
+from nltk.stem import WordNetLemmatizer
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data'))
+from artifacts import read_artifact
+from text_preprocessing import preprocess
+
+# Docs/s of text_preprocessing.py against the cells of text_preprocessing.ipynb (one apply per
+# step, per-row lemmatization), and check that both give the same cleaned_dataset
+
+# The notebook cells (only the redundant axis=1 of the final drop removed, pandas 3 rejects it)
+def notebook_pipeline(df):
+    df = df.copy()
+    df['text'] = df['text'].apply(lambda x: str(x))
+    df['clean_text'] = df['text'].str.lower()
+
+    def remove_urls(text):
+        return re.sub(r'https?://\S+|www\.\S+', '', text)
+
+    def remove_html(text):
+        return re.sub(r'<.*?>', '', text)
+
+    df['clean_text'] = df['clean_text'].apply(lambda x : remove_html(x))
+    df['clean_text'] = df['clean_text'].apply(lambda x : remove_urls(x))
+
+    def remove_punctation(text):
+        punctuations = string.punctuation
+        return text.translate(str.maketrans(punctuations, ' ' * len(punctuations)))
+
+    df['clean_text'] = df['clean_text'].apply(lambda x: remove_punctation(x))
+
+    STOPWORDS = set(stopwords.words('english'))
+
+    def remove_stopwords(text):
+        return " ".join([word for word in text.split() if word not in STOPWORDS])
+
+    df['clean_text'] = df['clean_text'].apply(lambda x: remove_stopwords(x))
+
+    word_count = Counter()
+    for text in df['clean_text']:
+        for word in text.split():
+            word_count[word] += 1
+
+    RARE_WORDS = set(word for (word, wc) in word_count.most_common()[:-10:-1])
+
+    def remove_words(text, words_list):
+        return " ".join([word for word in text.split() if word not in words_list])
+
+    df['clean_text']=df['clean_text'].apply(lambda x: remove_words(x, RARE_WORDS))
+
+    def remove_special_chars(text):
+        text = re.sub('[^a-zA-Z0-9]', ' ', text)
+        text = re.sub(r'\s+', ' ', text)
+        return text
+
+    df['clean_text'] = df['clean_text'].apply(lambda x: remove_special_chars(x))
+
+    lemmatizer = WordNetLemmatizer()
+    stop_words = set(stopwords.words("english"))
+    wordnet_map = {"N":wordnet.NOUN, "V": wordnet.VERB, "J": wordnet.ADJ, "R": wordnet.ADV}
+
+    def lemmatize_words(text):
+        tokens = word_tokenize(text.lower())
+        tokens = [t for t in tokens if t not in stop_words and len(t) > 2]
+
+        pos_tags = pos_tag(tokens)
+        return " ".join([lemmatizer.lemmatize(word, wordnet_map.get(pos[0], wordnet.NOUN))
+                         for word, pos in pos_tags])
+
+    df["lemmatized_text"] = df["clean_text"].apply(lemmatize_words)
+
+    df.drop(columns=['text'], inplace=True)
+    df = df.dropna(subset=['clean_text'])
+    df = df[df['clean_text'] != '']
+    df.reset_index(drop=True, inplace=True)
+    return df
+
+WORDS = [f"word{i}" for i in range(3000)] + ["the", "and", "running", "cats", "better", "I'm", "don't", "cannot", "gonna", "Über", "naïve"]
+NOISE = ["<b>", "</i>", "<a href='x'>", "https://example.com/a?b=1", "www.reddit.com/r/x", "!!", "...", "#tag",
+         "@user", "(yes)", "&amp;", "\n", "😀", "$100", "50%"]
+
+def synthetic_texts(num_rows, seed=42):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(num_rows):
+        tokens = [rng.choice(NOISE) if rng.random() < 0.1 else rng.choice(WORDS) for _ in range(rng.randint(0, 80))]
+        text = ' '.join(tokens) if rng.random() > 0.01 else None
+        rows.append({'author': f"user_{rng.randint(0, 999)}", 'id': f"t1_{i:08x}", 'text': text,
+                     'type': 'comment' if rng.random() < 0.9 else 'post', 'date': f"2025-03-{rng.randint(1, 28):02d}"})
+    return pd.DataFrame(rows)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--input', default='src/nlp/raw_textual_df.csv')
+    parser.add_argument('--rows', type=int, default=20000, help="First rows of the input")
+    parser.add_argument('--synthetic', action='store_true', help="Generated texts instead of the input")
+    parser.add_argument('--chunksize', type=int, default=2000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, os.cpu_count() or 1])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = os.path.join(tmp, 'raw_textual_df.csv')
+        df = synthetic_texts(args.rows) if args.synthetic else pd.read_csv(args.input, nrows=args.rows)
+        df.to_csv(input_path, index=False)
+        raw = pd.read_csv(input_path, dtype=str)
+
+        start = time.perf_counter()
+        expected = notebook_pipeline(raw)
+        notebook_time = time.perf_counter() - start
+        print(f"{len(raw)} documents\n")
+        print(f"{'pipeline':<24}{'s':>8}{'docs/s':>10}{'speed-up':>10}{'same output':>13}")
+        print(f"{'notebook':<24}{notebook_time:>8.2f}{len(raw) / notebook_time:>10.0f}{'1.0x':>10}{'-':>13}")
+
+        for workers in args.workers:
+            output_path = os.path.join(tmp, f'cleaned_dataset_{workers}.csv')
+            start = time.perf_counter()
+            preprocess(input_path, output_path, args.chunksize, workers)
+            elapsed = time.perf_counter() - start
+
+            result = read_artifact(output_path)
+            same = (list(result.columns) == list(expected.columns) and len(result) == len(expected)
+                    and all(result[c].fillna('').astype(str).equals(expected[c].fillna('').astype(str)) for c in expected.columns))
+            print(f"{f'module, {workers} workers':<24}{elapsed:>8.2f}{len(raw) / elapsed:>10.0f}"
+                  f"{notebook_time / elapsed:>9.1f}x{str(same):>13}")
+
+if __name__ == "__main__":
+    main()
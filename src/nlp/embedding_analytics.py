@@ -0,0 +1,207 @@
+import argparse
+import sys
+import os
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data'))
+from artifacts import read_artifact
+from embedding_store import EmbeddingStore
+
+# Embedding analytics of the research-question notebooks on whole matrices instead of per-row
+# Python loops. The leave-one-out community centroid of 2nd_research_question.ipynb,
+#   loo_i = sum_{j != i} w_j e_j / sum_{j != i} w_j   over the members j of i's community,
+# is computed in closed form as (S_c - w_i e_i) / (W_c - w_i) from the per-community sums
+# S_c = sum w_j e_j and W_c = sum w_j, so every community costs one pass over its members
+# instead of one re-average per member. Single-member communities keep the user's own
+# embedding, as the notebook does.
+# The user pairs of 3rd_research_question.ipynb are drawn as distinct integers in
+# [0, n * (n - 1) / 2) and decoded to (i, j) with i < j, so no list of combinations is ever
+# built. Unless they are at least half of the range, the integers are drawn with replacement
+# in batches and deduplicated until k distinct ones are found, so memory is O(k) and not
+# O(n^2) as with a draw without replacement. Their cosines are row-wise dot products of the normalized embedding matrix,
+# evaluated in batches of batch_size pairs
+
+# (n, dim) leave-one-out centroids; rows without a group (NaN) or without an embedding are NaN
+def leave_one_out_centroids(embeddings, groups, weights=None):
+    embeddings = np.asarray(embeddings, dtype=np.float64)
+    codes, uniques = pd.factorize(np.asarray(groups))
+    weights = np.ones(len(codes)) if weights is None else np.asarray(weights, dtype=np.float64)
+
+    valid = (codes >= 0) & ~np.isnan(embeddings).any(axis=1)
+    k = len(uniques)
+    weighted = embeddings[valid] * weights[valid, None]
+    sums = np.zeros((k, embeddings.shape[1]))
+    np.add.at(sums, codes[valid], weighted)
+    totals = np.bincount(codes[valid], weights=weights[valid], minlength=k)
+
+    loo = np.full(embeddings.shape, np.nan)
+    rest = totals[codes[valid]] - weights[valid]
+    alone = rest <= 0
+    centroids = (sums[codes[valid]] - weighted) / np.where(alone, 1, rest)[:, None]
+    centroids[alone] = embeddings[valid][alone]
+    loo[valid] = centroids
+    return loo
+
+# Cosine similarity of every row of a with the same row of b; zero vectors give 0, as
+# sklearn's cosine_similarity
+def rowwise_cosine(a, b):
+    a, b = np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64)
+    norms_a = np.linalg.norm(a, axis=1)
+    norms_b = np.linalg.norm(b, axis=1)
+    return np.einsum('ij,ij->i', a, b) / (np.where(norms_a == 0, 1, norms_a) * np.where(norms_b == 0, 1, norms_b))
+
+# users_role (hub_bridge_df rows) with role, user_embedding, loo_community_embedding and
+# cosine_similarity columns. Each row weighs as many times as its id appears in its community,
+# as the notebook's value_counts weights
+def role_similarity(users_role, user_store):
+    users_role = users_role.copy()
+    users_role['role'] = np.where(users_role['is_hub'], 'Hub', np.where(users_role['is_bridge'], 'Bridge', 'Average'))
+
+    embeddings = user_store.get(users_role['id'], missing='nan')
+    weights = users_role.groupby(['community_id', 'id'], dropna=False)['id'].transform('size').to_numpy()
+    loo = leave_one_out_centroids(embeddings, users_role['community_id'], weights)
+
+    users_role['user_embedding'] = list(embeddings)
+    users_role['loo_community_embedding'] = list(loo)
+    users_role['cosine_similarity'] = rowwise_cosine(embeddings, loo)
+    return users_role
+
+# Start of row i in the lexicographic order of the pairs (i, j), i < j < n
+def _row_start(i, n):
+    return i * (2 * n - i - 1) // 2
+
+# (i, j) of the pair indices t; the float square root is corrected by one row when it is off
+def decode_pairs(t, n):
+    t = np.asarray(t, dtype=np.int64)
+    i = (n - 2 - np.floor(np.sqrt(-8.0 * t + 4.0 * n * (n - 1) - 7) / 2 - 0.5)).astype(np.int64)
+    i = np.where(_row_start(i, n) > t, i - 1, i)
+    i = np.where(_row_start(i + 1, n) <= t, i + 1, i)
+    return i, t - _row_start(i, n) + i + 1
+
+# k distinct integers of range(total), in random order. accept filters the candidates
+# (rejection sampling) and share is the fraction of range(total) it is expected to keep;
+# at least k integers of range(total) must be accepted
+def _distinct_integers(rng, total, k, accept=None, share=1.0):
+    if 2 * k >= total:
+        t = rng.permutation(total)
+        return (t if accept is None else t[accept(t)])[:k]
+
+    chosen = np.zeros(0, dtype=np.int64)
+    while len(chosen) < k:
+        # Oversampled by the share of accepted integers, plus a margin; batches stay O(k)
+        draw = min(int((k - len(chosen)) / share * 1.1) + 16, 4 * k + 1024)
+        t = rng.integers(0, total, size=draw, dtype=np.int64)
+        chosen = np.union1d(chosen, t if accept is None else t[accept(t)])
+    # Sorted by union1d: shuffled, and the surplus dropped at random
+    return rng.permutation(chosen)[:k]
+
+# k distinct unordered pairs of range(n) (all of them when there are fewer)
+def sample_pairs(n, k, seed=None):
+    rng = np.random.default_rng(seed)
+    total = n * (n - 1) // 2
+    return decode_pairs(_distinct_integers(rng, total, min(k, total)), n)
+
+# Up to per_community distinct pairs inside every community, as row indices. codes are
+# integer community codes, -1 for rows outside any community
+def intra_community_pairs(codes, per_community, seed=None):
+    rng = np.random.default_rng(seed)
+    codes = np.asarray(codes)
+    order = np.argsort(codes, kind='stable')
+    bounds = np.flatnonzero(np.diff(codes[order])) + 1
+    left, right = [], []
+    for members in np.split(order, bounds):
+        if len(members) < 2 or codes[members[0]] < 0:
+            continue
+        i, j = sample_pairs(len(members), per_community, rng)
+        left.append(members[i])
+        right.append(members[j])
+    if not left:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(left), np.concatenate(right)
+
+# k distinct pairs of rows from different communities: pairs of all the rows are drawn and
+# the intra-community ones are rejected
+def inter_community_pairs(codes, k, seed=None):
+    rng = np.random.default_rng(seed)
+    codes = np.asarray(codes)
+    valid = np.flatnonzero(codes >= 0)
+    n = len(valid)
+    total = n * (n - 1) // 2
+    sizes = np.bincount(codes[valid])
+    inter = total - int((sizes * (sizes - 1) // 2).sum())
+    k = min(k, inter)
+    if k == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    def between_communities(t):
+        i, j = decode_pairs(t, n)
+        return codes[valid[i]] != codes[valid[j]]
+
+    i, j = decode_pairs(_distinct_integers(rng, total, k, between_communities, inter / total), n)
+    return valid[i], valid[j]
+
+# Pairs drawn separately within every stratum (e.g. community_type): intra-community pairs
+# with per_stratum spread evenly over the stratum's communities, or per_stratum
+# inter-community pairs between its communities. Returns the rows and the stratum of each pair
+def stratified_pairs(codes, strata, per_stratum, kind='intra', seed=None):
+    rng = np.random.default_rng(seed)
+    codes = np.asarray(codes)
+    strata = np.asarray(strata)
+    left, right, labels = [], [], []
+    for stratum in pd.unique(strata):
+        rows = np.flatnonzero(strata == stratum)
+        sub_codes, _ = pd.factorize(codes[rows])
+        if kind == 'intra':
+            num_communities = max(1, len(np.unique(sub_codes[sub_codes >= 0])))
+            i, j = intra_community_pairs(sub_codes, per_stratum // num_communities, rng)
+        elif kind == 'inter':
+            i, j = inter_community_pairs(sub_codes, per_stratum, rng)
+        else:
+            raise ValueError(f"Unknown pair kind: {kind}")
+        left.append(rows[i])
+        right.append(rows[j])
+        labels.append(np.full(len(i), stratum, dtype=object))
+    if not left:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=object)
+    return np.concatenate(left), np.concatenate(right), np.concatenate(labels)
+
+# Rows scaled to unit norm (zero rows stay zero), so that cosines are dot products
+def normalize_rows(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+# Cosine of matrix[left[p]] and matrix[right[p]] for every pair p, batch_size pairs at a time
+def pair_cosines(matrix, left, right, batch_size=1 << 16):
+    normalized = normalize_rows(matrix)
+    sims = np.empty(len(left), dtype=np.float32)
+    for start in range(0, len(left), batch_size):
+        end = start + batch_size
+        sims[start:end] = np.einsum('ij,ij->i', normalized[left[start:end]], normalized[right[start:end]])
+    return sims
+
+# rq2_summary_stats.csv
+def summary_stats(users_role):
+    return users_role.groupby(['community_type', 'role']).agg(
+        count=('id', 'count'),
+        mean_cosine=('cosine_similarity', 'mean'),
+        median_cosine=('cosine_similarity', 'median'),
+        std_cosine=('cosine_similarity', 'std'),
+    ).reset_index()
+
+def main():
+    parser = argparse.ArgumentParser(description="Role vs leave-one-out community similarity (research question 2)")
+    parser.add_argument('--users', default='src/data/distribuitions/hub_bridge_df.csv')
+    parser.add_argument('--user-embeddings', default='src/nlp/user_embeddings')
+    parser.add_argument('--output', default='src/research_question/rq2_summary_stats.csv')
+    args = parser.parse_args()
+
+    users_role = role_similarity(read_artifact(args.users), EmbeddingStore(args.user_embeddings))
+    summary = summary_stats(users_role)
+    summary.to_csv(args.output, index=False)
+    print(summary.to_string(index=False))
+
+if __name__ == "__main__":
+    main()
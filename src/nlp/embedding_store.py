@@ -0,0 +1,167 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+# Embeddings (texts, users, communities) as one contiguous float32 or float16 matrix in a .npy
+# file, opened memory-mapped, plus the ids of its rows. For a store at 'src/nlp/user_embeddings':
+#   user_embeddings.vectors.npy  (rows, dim) matrix, row i is the embedding of ids[i]
+#   user_embeddings.ids.npy      row ids, strings or integers, saved without pickle
+# Opening a store only maps the matrix, the pages are read when rows are used, and lookups by
+# a list of ids are one Index.get_indexer call plus one fancy indexing of the matrix.
+# encode_to_store writes the output of each encode batch into the mapped file, so the whole
+# matrix never has to be held in memory
+
+VECTORS_SUFFIX = '.vectors.npy'
+IDS_SUFFIX = '.ids.npy'
+
+def store_paths(path):
+    base = path[:-len('.npy')] if path.endswith('.npy') else path
+    return base + VECTORS_SUFFIX, base + IDS_SUFFIX
+
+# Strings become a fixed-width unicode array, so that no pickling is needed
+def ids_array(ids):
+    ids = np.asarray(list(ids))
+    if ids.dtype == object:
+        ids = ids.astype(str)
+    return ids
+
+class EmbeddingStore:
+    def __init__(self, path, mmap_mode='r'):
+        vectors_path, ids_path = store_paths(path)
+        self.vectors = np.load(vectors_path, mmap_mode=mmap_mode)
+        self.ids = np.load(ids_path, allow_pickle=False)
+        self.index = pd.Index(self.ids)
+        if len(self.ids) != len(self.vectors):
+            raise ValueError(f"{ids_path} has {len(self.ids)} ids for {len(self.vectors)} embeddings")
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, id):
+        return id in self.index
+
+    @property
+    def dim(self):
+        return self.vectors.shape[1]
+
+    # Row of each id, -1 for the unknown ones
+    def rows(self, ids):
+        return self.index.get_indexer(ids_array(ids))
+
+    # (len(ids), dim) float32 matrix; unknown ids raise a KeyError, or get NaN rows with missing='nan'
+    def get(self, ids, missing='raise'):
+        rows = self.rows(ids)
+        unknown = rows < 0
+        if unknown.any() and missing == 'raise':
+            raise KeyError(f"{unknown.sum()} ids are not in the store, e.g. {np.asarray(ids)[unknown][:5].tolist()}")
+        result = np.asarray(self.vectors[np.where(unknown, 0, rows)], dtype=np.float32)
+        result[unknown] = np.nan
+        return result
+
+    # {id: embedding} with the rows of the mapped matrix as values (views, nothing is copied),
+    # for the code written against the dicts of the old pickled arrays
+    def as_dict(self):
+        return dict(zip(self.ids.tolist(), self.vectors))
+
+# Writes a whole matrix, e.g. the user or community embeddings aggregated from the text ones
+def write_store(path, ids, vectors, dtype=np.float32):
+    vectors_path, ids_path = store_paths(path)
+    ids = ids_array(ids)
+    vectors = np.asarray(vectors)
+    if len(ids) != len(vectors):
+        raise ValueError(f"{len(ids)} ids for {len(vectors)} embeddings")
+    # Written to a temporary name and renamed, so that readers never map a partial file
+    np.save(vectors_path + '.tmp.npy', np.ascontiguousarray(vectors, dtype=dtype))
+    np.save(ids_path + '.tmp.npy', ids, allow_pickle=False)
+    os.replace(vectors_path + '.tmp.npy', vectors_path)
+    os.replace(ids_path + '.tmp.npy', ids_path)
+    return EmbeddingStore(path)
+
+# Encodes the texts in chunks of chunk_size and writes every chunk into the mapped matrix.
+# model is a SentenceTransformer or a CachedEncoder; encode_options go to model.encode
+def encode_to_store(model, texts, ids, path, dtype=np.float32, chunk_size=10000, **encode_options):
+    vectors_path, ids_path = store_paths(path)
+    ids = ids_array(ids)
+    if len(ids) != len(texts):
+        raise ValueError(f"{len(ids)} ids for {len(texts)} texts")
+    encode_options['convert_to_numpy'] = True
+
+    matrix = None
+    for start in range(0, len(texts), chunk_size):
+        chunk = model.encode(list(texts[start:start + chunk_size]), **encode_options)
+        if matrix is None:
+            matrix = np.lib.format.open_memmap(vectors_path + '.tmp.npy', mode='w+', dtype=dtype,
+                                               shape=(len(texts), chunk.shape[1]))
+        matrix[start:start + len(chunk)] = chunk
+    if matrix is None:
+        raise ValueError("No texts to encode")
+    matrix.flush()
+    del matrix
+
+    np.save(ids_path + '.tmp.npy', ids, allow_pickle=False)
+    os.replace(vectors_path + '.tmp.npy', vectors_path)
+    os.replace(ids_path + '.tmp.npy', ids_path)
+    return EmbeddingStore(path)
+
+# One store from several: rows are taken in order and a later store replaces the rows of the
+# ids it shares with an earlier one. Rows are copied store by store into the mapped output, so
+# the merged matrix is never held in memory. path may be one of the sources
+def merge_stores(path, sources, dtype=None, chunk_size=100000):
+    stores = [EmbeddingStore(source) for source in sources if os.path.exists(store_paths(source)[1])]
+    if not stores:
+        raise ValueError("No stores to merge")
+    ids = np.concatenate([store.ids for store in stores])
+    keep = ~pd.Index(ids).duplicated(keep='last')
+    dtype = dtype or stores[0].vectors.dtype
+
+    vectors_path, ids_path = store_paths(path)
+    matrix = np.lib.format.open_memmap(vectors_path + '.tmp.npy', mode='w+', dtype=dtype,
+                                       shape=(int(keep.sum()), stores[0].dim))
+    offset = written = 0
+    for store in stores:
+        rows = np.flatnonzero(keep[offset:offset + len(store)])
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            matrix[written:written + len(chunk)] = store.vectors[chunk]
+            written += len(chunk)
+        offset += len(store)
+    matrix.flush()
+    del matrix
+
+    np.save(ids_path + '.tmp.npy', ids_array(ids[keep]), allow_pickle=False)
+    os.replace(vectors_path + '.tmp.npy', vectors_path)
+    os.replace(ids_path + '.tmp.npy', ids_path)
+    return EmbeddingStore(path)
+
+# Old calculate_embeddings.ipynb output: object array of (id, embedding list) rows, or a plain
+# matrix (text_embeddings.npy) whose ids are given separately
+def convert_pickled(npy_path, out_path, ids=None, dtype=np.float32):
+    data = np.load(npy_path, allow_pickle=True)
+    if data.dtype == object:
+        ids = [row[0] for row in data]
+        vectors = np.stack([np.asarray(row[1], dtype=np.float32) for row in data])
+    elif ids is None:
+        raise ValueError(f"{npy_path} has no ids, pass them with --ids")
+    else:
+        vectors = data
+    return write_store(out_path, ids, vectors, dtype)
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert pickled embedding arrays to memory-mapped stores")
+    parser.add_argument('paths', nargs='+', help="e.g. src/nlp/user_embeddings.npy")
+    parser.add_argument('--ids', default=None, help="One id per line, for plain matrices")
+    parser.add_argument('--float16', action='store_true')
+    args = parser.parse_args()
+
+    ids = None
+    if args.ids is not None:
+        with open(args.ids) as f:
+            ids = [line.rstrip('\n') for line in f]
+    for path in args.paths:
+        store = convert_pickled(path, path, ids, np.float16 if args.float16 else np.float32)
+        print(f"{path} -> {store_paths(path)[0]} ({len(store)} x {store.dim}, {store.vectors.dtype})")
+
+if __name__ == "__main__":
+    main()
@@ -1,50 +1,141 @@
-import pandas as pd
 import sqlite3
-import numpy as np
-from tqdm import tqdm
+import argparse
+import hashlib
 import csv
-from collections import Counter
-
-# Connecting to database
-connection = sqlite3.connect('reddit-posts.db')
-cursor = connection.cursor()
-
-# Getting valid users
-df = pd.read_csv('src/data/nodes.csv')
-users = df['id'].tolist()
-
-# Retriving all texts for both posts and comments tables
-cursor.execute('''
-    SELECT p.author, p.id, p.text, 'post' AS type, p.date
-    FROM posts as p
-    WHERE p.text <> '[removed]' AND p.date >= '2025-01-01'
-        UNION ALL
-    SELECT c.author, c.comment_Id, c.text, 'comment' AS type, c.date
-    FROM comments as c
-    WHERE c.text <> '[removed]' AND c.date >= '2025-01-01'
-''')
-
-res = cursor.fetchall()
-cursor.close()
-
-print(f"Operation sample: {res[0]}")
-
-# Retrieving valid users
-users = pd.read_csv('src/data/nodes.csv')
-users_id = users['id'].tolist()
-valid_users_set =set(users_id)
-
-count = 0
-
-# Writing results in a csv file
-with open('src/nlp/raw_textual_df.csv', 'w') as csv_file:
-    writer = csv.writer(csv_file, delimiter=',')
-    writer.writerow(['author', 'id', 'text', 'type', 'date'])
-
-    for row in res:
-        if row[0] in valid_users_set:
-            count += 1
-            writer.writerow(row)
-
-print(f"Total texts retrieved: {len(res)}")
-print(f"Total texts with valid user: {count}")
\ No newline at end of file
+import sys
+import os
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data'))
+from artifacts import read_artifact
+from csv_query_converter import create_tables
+
+# Texts of the graph users are filtered in SQL (join against a temporary table of node ids)
+# and streamed to the output in fetchmany batches, posts then comments, each in ingest_seq
+# order. The last ingest_seq written for each table is the resume point, the way
+# csv_query_converter tracks graph_state: an interrupted export resumes right after the last
+# written row, and a repeated one appends the rows inserted since, backfilled ones included
+TEXTS_QUERIES = {
+    'posts': '''
+        SELECT p.author, p.id, p.text, 'post' AS type, p.date, p.ingest_seq
+        FROM posts as p
+        JOIN graph_users AS u ON u.id = p.author
+        WHERE p.ingest_seq > :last_seq AND p.text <> '[removed]' AND p.date >= :since
+        ORDER BY p.ingest_seq
+    ''',
+    'comments': '''
+        SELECT c.author, c.comment_Id, c.text, 'comment' AS type, c.date, c.ingest_seq
+        FROM comments as c
+        JOIN graph_users AS u ON u.id = c.author
+        WHERE c.ingest_seq > :last_seq AND c.text <> '[removed]' AND c.date >= :since
+        ORDER BY c.ingest_seq
+    ''',
+}
+
+def create_export_state(conn):
+    # The state was a (date, type, id) position before ingest_seq: such a state is dropped,
+    # forcing one new export
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(text_export_state)')}
+    if columns and 'posts_seq' not in columns:
+        conn.execute('DROP TABLE text_export_state')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS text_export_state (
+            output_path TEXT PRIMARY KEY,
+            nodes_hash TEXT,
+            since_date TEXT,
+            posts_seq INTEGER,
+            comments_seq INTEGER,
+            byte_offset INTEGER
+        )
+    ''')
+    conn.commit()
+
+# Loads the node ids into an indexed temp table; the hash identifies the graph the export belongs to
+def load_graph_users(conn, nodes_path):
+    conn.execute('DROP TABLE IF EXISTS temp.graph_users')
+    conn.execute('CREATE TEMP TABLE graph_users (id TEXT PRIMARY KEY) WITHOUT ROWID')
+
+    digest = hashlib.sha1()
+    # Usernames such as 'null' or 'nan' must stay strings
+    ids = read_artifact(nodes_path, columns=['id'], dtype=str, keep_default_na=False)['id'].tolist()
+    for node_id in ids:
+        digest.update(node_id.encode('utf-8') + b'\n')
+    conn.executemany('INSERT OR IGNORE INTO graph_users (id) VALUES (?)', ((node_id,) for node_id in ids))
+
+    count = conn.execute('SELECT COUNT(*) FROM graph_users').fetchone()[0]
+    return count, digest.hexdigest()
+
+def get_export_state(conn, output_path, nodes_hash, since):
+    row = conn.execute('''
+        SELECT nodes_hash, since_date, posts_seq, comments_seq, byte_offset
+        FROM text_export_state WHERE output_path = ?
+    ''', (output_path,)).fetchone()
+
+    # Resuming only makes sense for the same graph, cutoff and a file still in place
+    if (row is None or row[0] != nodes_hash or row[1] != since
+            or not os.path.exists(output_path) or os.path.getsize(output_path) < row[4]):
+        return None
+    return {'posts': row[2], 'comments': row[3]}, row[4]
+
+def set_export_state(conn, output_path, nodes_hash, since, seqs, byte_offset):
+    conn.execute('''
+        INSERT OR REPLACE INTO text_export_state
+        (output_path, nodes_hash, since_date, posts_seq, comments_seq, byte_offset)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (output_path, nodes_hash, since, seqs['posts'], seqs['comments'], byte_offset))
+    conn.commit()
+
+def export_texts(conn, nodes_path, output_path, since='2025-01-01', batch_size=10000, resume=True):
+    create_tables(conn)  # Applies pending schema migrations (ingest_seq)
+    create_export_state(conn)
+    users_count, nodes_hash = load_graph_users(conn, nodes_path)
+    print(f"Valid users loaded: {users_count}")
+
+    state = get_export_state(conn, output_path, nodes_hash, since) if resume else None
+    if state is None:
+        seqs, byte_offset = {'posts': 0, 'comments': 0}, 0
+        with open(output_path, 'w') as csv_file:
+            csv.writer(csv_file, delimiter=',').writerow(['author', 'id', 'text', 'type', 'date'])
+        print("Starting a new export")
+    else:
+        seqs, byte_offset = state
+        # Drops anything written after the last recorded batch (interrupted run)
+        with open(output_path, 'r+b') as f:
+            f.truncate(byte_offset)
+        print(f"Resuming export after post #{seqs['posts']} and comment #{seqs['comments']}")
+
+    count = 0
+    with open(output_path, 'a') as csv_file:
+        writer = csv.writer(csv_file, delimiter=',')
+        for table, query in TEXTS_QUERIES.items():
+            cursor = conn.cursor()
+            cursor.execute(query, {'since': since, 'last_seq': seqs[table]})
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                writer.writerows(row[:5] for row in rows)
+                csv_file.flush()
+                count += len(rows)
+                seqs[table] = rows[-1][5]
+                set_export_state(conn, output_path, nodes_hash, since, seqs, csv_file.tell())
+            cursor.close()
+
+    return count
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nodes', default='src/data/nodes.csv')
+    parser.add_argument('--output', default='src/nlp/raw_textual_df.csv')
+    parser.add_argument('--since', default='2025-01-01')
+    parser.add_argument('--batch-size', type=int, default=10000)
+    parser.add_argument('--full', action='store_true', help="Ignore the saved state and rebuild the export from scratch")
+    args = parser.parse_args()
+
+    # Connecting to database
+    connection = sqlite3.connect('reddit-posts.db')
+
+    count = export_texts(connection, args.nodes, args.output, args.since, args.batch_size, resume=not args.full)
+    print(f"Total texts with valid user: {count}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+import argparse
+import hashlib
+import sqlite3
+import time
+
+import numpy as np
+
+# On-disk cache of model outputs (text embeddings, sentiment and emotion probabilities) shared
+# by the NLP stages. An entry is keyed by (model name, model revision, sha1 of clean_text) and
+# holds the output vector as raw float32 bytes, so a refresh after new texts were exported only
+# runs the model on the texts it has never seen. Lookups and inserts go through a temporary
+# table and executemany, a few statements per batch whatever its size. The cache is bounded
+# in bytes: when an insert goes over max_bytes the least recently used entries are dropped
+# down to EVICT_TO of the bound. WAL journaling lets the scoring workers share one file; every
+# transaction that writes takes the write lock up front (BEGIN IMMEDIATE), so that it waits on
+# the busy timeout instead of failing when another worker committed after its first read
+
+DEFAULT_CACHE = 'src/nlp/nlp_cache.db'
+DEFAULT_MAX_BYTES = 8 * 1024 ** 3
+EVICT_TO = 0.9
+
+def text_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).digest()
+
+# Commit hash of the Hugging Face snapshot the model was loaded from, for transformers models
+# and SentenceTransformer (through its first module); 'local' when it is not known
+def model_revision(model):
+    config = getattr(model, 'config', None)
+    if config is None and hasattr(model, '__getitem__'):
+        config = getattr(getattr(model[0], 'auto_model', None), 'config', None)
+    return getattr(config, '_commit_hash', None) or 'local'
+
+class ResultCache:
+    def __init__(self, path=DEFAULT_CACHE, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS nlp_cache (
+                model TEXT,
+                revision TEXT,
+                text_hash BLOB,
+                vector BLOB,
+                size INTEGER,
+                last_used REAL,
+                PRIMARY KEY (model, revision, text_hash)
+            ) WITHOUT ROWID
+        ''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_nlp_cache_last_used ON nlp_cache(last_used, size)')
+        self.conn.execute('CREATE TEMP TABLE IF NOT EXISTS lookup (text_hash BLOB PRIMARY KEY) WITHOUT ROWID')
+        self.conn.commit()
+
+    # {hash: vector} of the hashes found; the hits are marked as used now
+    def get_many(self, model, revision, hashes):
+        with self.conn:
+            self.conn.execute('BEGIN IMMEDIATE')
+            self.conn.execute('DELETE FROM lookup')
+            self.conn.executemany('INSERT OR IGNORE INTO lookup (text_hash) VALUES (?)', ((h,) for h in hashes))
+            rows = self.conn.execute('''
+                SELECT c.text_hash, c.vector
+                FROM nlp_cache AS c
+                JOIN lookup AS l ON l.text_hash = c.text_hash
+                WHERE c.model = ? AND c.revision = ?
+            ''', (model, revision)).fetchall()
+            self.conn.execute('''
+                UPDATE nlp_cache SET last_used = ?
+                WHERE model = ? AND revision = ? AND text_hash IN (SELECT text_hash FROM lookup)
+            ''', (time.time(), model, revision))
+        return {bytes(h): np.frombuffer(vector, dtype=np.float32) for h, vector in rows}
+
+    def put_many(self, model, revision, hashes, vectors):
+        now = time.time()
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with self.conn:
+            self.conn.execute('BEGIN IMMEDIATE')
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO nlp_cache (model, revision, text_hash, vector, size, last_used) VALUES (?, ?, ?, ?, ?, ?)',
+                ((model, revision, h, v.tobytes(), v.nbytes, now) for h, v in zip(hashes, vectors))
+            )
+        self.evict()
+
+    def total_bytes(self):
+        return self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM nlp_cache').fetchone()[0]
+
+    # Least recently used entries first, until the cache is back to EVICT_TO of max_bytes
+    def evict(self):
+        total = self.total_bytes()
+        if self.max_bytes is None or total <= self.max_bytes:
+            return 0
+        with self.conn:
+            self.conn.execute('BEGIN IMMEDIATE')
+            deleted = self.conn.execute('''
+                DELETE FROM nlp_cache WHERE (model, revision, text_hash) IN (
+                    SELECT model, revision, text_hash FROM (
+                        SELECT model, revision, text_hash, size,
+                               SUM(size) OVER (ORDER BY last_used, model, revision, text_hash) AS freed
+                        FROM nlp_cache
+                    )
+                    WHERE freed - size < ?
+                )
+            ''', (total - EVICT_TO * self.max_bytes,)).rowcount
+        return deleted
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+# (len(texts), dim) outputs of compute(texts) through the cache: only the distinct texts
+# missing from it are computed, in one call, then stored
+def cached_vectors(cache, model, revision, texts, compute):
+    if len(texts) == 0:
+        return np.asarray(compute([]), dtype=np.float32)
+    hashes = [text_hash(text) for text in texts]
+    found = cache.get_many(model, revision, set(hashes))
+
+    missing = {}
+    for h, text in zip(hashes, texts):
+        if h not in found and h not in missing:
+            missing[h] = text
+    if missing:
+        computed = np.asarray(compute(list(missing.values())), dtype=np.float32)
+        cache.put_many(model, revision, list(missing), computed)
+        found.update(zip(missing, computed))
+
+    return np.stack([found[h] for h in hashes])
+
+# InferenceEngine through the cache, usable wherever the engine is (score_sentiment, score_emotions)
+class CachedEngine:
+    def __init__(self, engine, cache, model_name, revision=None):
+        self.engine = engine
+        self.cache = cache
+        self.model_name = model_name
+        self.revision = revision or model_revision(engine.model)
+
+    def predict_proba(self, texts, progress=False):
+        return cached_vectors(self.cache, self.model_name, self.revision, texts,
+                              lambda missing: self.engine.predict_proba(missing, progress=progress))
+
+# SentenceTransformer through the cache; encode always returns a numpy array
+class CachedEncoder:
+    def __init__(self, model, cache, model_name, revision=None):
+        self.model = model
+        self.cache = cache
+        self.model_name = model_name
+        self.revision = revision or model_revision(model)
+
+    def encode(self, sentences, **kwargs):
+        kwargs['convert_to_numpy'] = True
+        return cached_vectors(self.cache, self.model_name, self.revision, list(sentences),
+                              lambda missing: self.model.encode(missing, **kwargs))
+
+def main():
+    parser = argparse.ArgumentParser(description="Size and eviction of the NLP result cache")
+    parser.add_argument('--cache', default=DEFAULT_CACHE)
+    parser.add_argument('--max-gb', type=float, default=None, help="Evict down to this size")
+    args = parser.parse_args()
+
+    max_bytes = int(args.max_gb * 1024 ** 3) if args.max_gb is not None else None
+    with ResultCache(args.cache, max_bytes) as cache:
+        deleted = cache.evict()
+        for model, revision, entries, size in cache.conn.execute(
+                'SELECT model, revision, COUNT(*), SUM(size) FROM nlp_cache GROUP BY model, revision'):
+            print(f"{model}@{revision[:12]}: {entries} entries, {size / 1024 ** 2:.1f} MiB")
+        print(f"total {cache.total_bytes() / 1024 ** 2:.1f} MiB, {deleted} evicted")
+
+if __name__ == "__main__":
+    main()
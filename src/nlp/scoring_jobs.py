@@ -0,0 +1,229 @@
+import argparse
+import glob
+import time
+import sys
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sentiment'))
+from artifacts import read_artifact, write_artifact
+from nlp_cache import DEFAULT_CACHE, DEFAULT_MAX_BYTES, ResultCache, CachedEngine, CachedEncoder
+from embedding_store import IDS_SUFFIX, store_paths, write_store, merge_stores
+
+# Model scoring of cleaned_dataset.csv (sentiment, emotions, text embeddings) as a resumable
+# job. The ids not scored yet by the model are sorted and split into id-range shards; worker
+# processes load the model once and score whole shards. Every shard is written to a temporary
+# file and renamed into <shards_dir>/<model name>/<first id>-<last id>, so a shard is either
+# complete or absent and a crash loses at most the shards in flight. On restart the ids of the
+# finished shards, and those of the output artifact for the same model, are skipped.
+# At the end the shards are merged into the output artifact, replacing the rows of the
+# same (model, id) instead of appending them again. Model outputs go through the shared NLP
+# result cache, so texts already scored under other ids (or by an earlier run whose shards were
+# removed) are not run through the model again.
+# Text embeddings go to the memory-mapped text_embeddings store read by the notebooks and the
+# topic stage: every shard is a small store, and the merge copies them into the output store
+
+STAGES = {
+    'sentiment': {
+        'model': "finiteautomata/bertweet-base-sentiment-analysis",
+        'name': "bertweet",
+        'output': 'src/nlp/sentiment/sentiment_scores.csv',
+    },
+    'emotions': {
+        'model': "SamLowe/roberta-base-go_emotions",
+        'name': "goemotions",
+        'output': 'src/nlp/sentiment/emotion_scores.csv',
+    },
+    'embeddings': {
+        'model': 'all-MiniLM-L6-v2',
+        'name': "minilm",
+        'output': 'src/nlp/text_embeddings',
+    },
+}
+
+_stage = None
+_scorer = None
+
+# One model per process; the cores are shared between the workers instead of every worker
+# starting one torch thread per core
+def _init_worker(stage, model_name, name, workers, batch_size, quantize, cache_path, cache_max_bytes):
+    global _stage, _scorer
+    import torch
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // workers))
+
+    _stage = stage
+    cache = ResultCache(cache_path, cache_max_bytes) if cache_path else None
+    if stage == 'embeddings':
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(model_name)
+        if cache is not None:
+            model = CachedEncoder(model, cache, model_name)
+        _scorer = lambda df: score_embeddings(model, df, batch_size)
+        return
+
+    from inference_engine import load_model, InferenceEngine, score_sentiment, score_emotions
+    # The sentiment notebook loads bertweet with the slow tokenizer
+    tokenizer, model, device = load_model(model_name, use_fast=stage != 'sentiment', quantize=quantize)
+    engine = InferenceEngine(tokenizer, model, device, batch_size=batch_size)
+    if cache is not None:
+        # Quantized outputs differ slightly, they are cached under their own key
+        engine = CachedEngine(engine, cache, model_name + ('+int8' if quantize else ''))
+    if stage == 'sentiment':
+        _scorer = lambda df: score_sentiment(engine, df, model_name=name, progress=False)
+    else:
+        _scorer = lambda df: score_emotions(engine, df, model_name=name, progress=False)
+
+# (len(df), dim) float32 text embeddings, as calculate_embeddings.ipynb encodes them
+def score_embeddings(model, df, batch_size):
+    embeddings = model.encode(df['clean_text'].tolist(), batch_size=batch_size, convert_to_numpy=True)
+    return np.asarray(embeddings, dtype=np.float32)
+
+def is_store(path):
+    return os.path.exists(store_paths(path)[1])
+
+# Finished shards: artifacts, or embedding stores once their ids file (written last) is there
+def shard_files(shards_dir):
+    files = {}
+    for path in glob.glob(os.path.join(shards_dir, '*')):
+        filename = os.path.basename(path)
+        if filename.startswith('.tmp-') or filename.endswith('.tmp.npy'):
+            continue
+        if filename.endswith(IDS_SUFFIX):
+            base = filename[:-len(IDS_SUFFIX)]
+            files[base] = os.path.join(shards_dir, base)
+            continue
+        base, ext = os.path.splitext(filename)
+        if ext in ('.csv', '.parquet', '.arrow'):
+            files[base] = os.path.join(shards_dir, base + '.csv')
+    return sorted(files.values())
+
+def read_ids(path):
+    if is_store(path):
+        return np.load(store_paths(path)[1], allow_pickle=False).astype(str)
+    return read_artifact(path, columns=['id'], dtype=str, keep_default_na=False)['id']
+
+# Ids already scored by the model: finished shards, plus the rows of the output artifact
+# (every row of an output store, which only holds the stage's model)
+def scored_ids(shards_dir, output, name):
+    done = set()
+    for path in shard_files(shards_dir):
+        done.update(read_ids(path))
+    if is_store(output):
+        done.update(read_ids(output))
+        return done
+    try:
+        existing = read_artifact(output, columns=['id', 'model'], dtype=str, keep_default_na=False)
+        done.update(existing.loc[existing['model'] == name, 'id'])
+    except FileNotFoundError:
+        pass
+    return done
+
+# Pending rows sorted by id and cut into shards of shard_size consecutive ids
+def plan_shards(df, done, shard_size):
+    pending = df[~df['id'].isin(done)].drop_duplicates('id').sort_values('id', kind='stable')
+    return [pending.iloc[i:i + shard_size] for i in range(0, len(pending), shard_size)]
+
+def shard_name(shard):
+    return f"{shard['id'].iloc[0]}-{shard['id'].iloc[-1]}"
+
+# Scores a shard and publishes it with a rename, which is atomic on the same file system
+def score_shard(shard, shards_dir):
+    result = _scorer(shard)
+    name = shard_name(shard)
+    if _stage == 'embeddings':
+        write_store(os.path.join(shards_dir, name), shard['id'], result)
+        return len(shard), len(result)
+    written = write_artifact(result, os.path.join(shards_dir, f'.tmp-{name}.csv'))
+    os.replace(written, os.path.join(shards_dir, name + os.path.splitext(written)[1]))
+    return len(shard), len(result)
+
+# Output artifact = its rows of the other models and ids + every finished shard
+def merge_shards(shards_dir, output, name):
+    shards = [read_artifact(path, dtype={'id': str}) for path in shard_files(shards_dir)]
+    if not shards:
+        return 0
+    scored = pd.concat(shards, ignore_index=True).drop_duplicates(['model', 'id'], keep='last')
+    try:
+        existing = read_artifact(output, dtype={'id': str})
+        replaced = (existing['model'] == name) & existing['id'].isin(scored['id'])
+        scored = pd.concat([existing[~replaced], scored], ignore_index=True)
+    except FileNotFoundError:
+        pass
+    write_artifact(scored, output)
+    return len(scored)
+
+# Output store = its rows of the other ids + every finished shard store
+def merge_store_shards(shards_dir, output):
+    shards = shard_files(shards_dir)
+    if not shards:
+        return 0
+    return len(merge_stores(output, [output] + shards))
+
+def run(stage, input_path, output=None, model=None, name=None, shards_dir='src/nlp/scoring_shards',
+        shard_size=2000, workers=1, batch_size=64, quantize=False, merge=True, cache_path=DEFAULT_CACHE,
+        cache_max_bytes=DEFAULT_MAX_BYTES):
+    defaults = STAGES[stage]
+    model, name, output = model or defaults['model'], name or defaults['name'], output or defaults['output']
+    shards_dir = os.path.join(shards_dir, name)
+    os.makedirs(shards_dir, exist_ok=True)
+
+    df = read_artifact(input_path, columns=['author', 'id', 'clean_text'], dtype={'id': str})
+    if stage != 'sentiment':
+        # Only the sentiment scores keep a row for missing texts
+        df = df[df['clean_text'].map(lambda text: isinstance(text, str))]
+    shards = plan_shards(df, scored_ids(shards_dir, output, name), shard_size)
+    print(f"{stage} ({name}): {len(df)} texts, {sum(len(s) for s in shards)} to score in {len(shards)} shards")
+
+    initargs = (stage, model, name, workers, batch_size, quantize, cache_path, cache_max_bytes)
+    docs = 0
+    start = time.perf_counter()
+    progress = tqdm(total=len(shards), unit='shard')
+    if workers == 1:
+        _init_worker(*initargs)
+        for shard in shards:
+            docs += score_shard(shard, shards_dir)[0]
+            progress.update()
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as executor:
+            futures = [executor.submit(score_shard, shard, shards_dir) for shard in shards]
+            for future in as_completed(futures):
+                docs += future.result()[0]
+                progress.update()
+    progress.close()
+    elapsed = time.perf_counter() - start
+    if docs:
+        print(f"{docs} documents scored in {elapsed:.1f}s ({docs / elapsed:.1f} docs/s)")
+
+    if merge:
+        rows = merge_store_shards(shards_dir, output) if stage == 'embeddings' else merge_shards(shards_dir, output, name)
+        print(f"{output}: {rows} rows")
+    return docs
+
+def main():
+    parser = argparse.ArgumentParser(description="Resumable, sharded model scoring of the cleaned texts")
+    parser.add_argument('stage', choices=list(STAGES))
+    parser.add_argument('--input', default='src/nlp/cleaned_dataset.csv')
+    parser.add_argument('--output', default=None, help="Defaults to the artifact of the stage's notebook")
+    parser.add_argument('--model', default=None, help="Hugging Face model, defaults to the stage's one")
+    parser.add_argument('--name', default=None, help="Value of the 'model' column, defaults to the stage's one")
+    parser.add_argument('--shards-dir', default='src/nlp/scoring_shards')
+    parser.add_argument('--shard-size', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--quantize', action='store_true', help="int8 dynamic quantization (CPU)")
+    parser.add_argument('--no-merge', action='store_true', help="Only score the shards")
+    parser.add_argument('--cache', default=DEFAULT_CACHE, help="NLP result cache, '' to disable it")
+    parser.add_argument('--cache-max-gb', type=float, default=DEFAULT_MAX_BYTES / 1024 ** 3)
+    args = parser.parse_args()
+
+    run(args.stage, args.input, args.output, args.model, args.name, args.shards_dir, args.shard_size,
+        args.workers, args.batch_size, args.quantize, merge=not args.no_merge, cache_path=args.cache,
+        cache_max_bytes=int(args.cache_max_gb * 1024 ** 3))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+import torch
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'data'))
+from artifacts import read_artifact
+from inference_engine import SENTIMENT_MODEL, load_model, InferenceEngine
+
+# Docs/s of the notebooks' scoring (one model call per text or chunk, batch size 1) against
+# InferenceEngine, with and without int8 quantization, and how close the probabilities are
+
+# polarity_scores / emotions_scores of the notebooks, returning the probabilities
+def notebook_scores(text, tokenizer, model, device):
+    max_length = model.config.max_position_embeddings
+    if len(text) >= (max_length - 2):
+        token_ids = tokenizer.encode(text, add_special_tokens=False)
+        scores = []
+        for i in range(0, len(token_ids), max_length - 4):
+            input_ids = [tokenizer.cls_token_id] + token_ids[i:i + max_length - 4] + [tokenizer.sep_token_id]
+            inputs = {
+                "input_ids": torch.tensor([input_ids], device=device),
+                "attention_mask": torch.tensor([[1] * len(input_ids)], device=device)
+            }
+            with torch.no_grad():
+                outputs = model(**inputs)
+            scores.append(outputs.logits.softmax(dim=-1))
+        scores_tensor = torch.mean(torch.stack(scores), dim=0).squeeze(0)
+    else:
+        encoded_text = tokenizer(text, return_tensors='pt').to(device)
+        with torch.no_grad():
+            output = model(**encoded_text)
+        scores_tensor = output.logits[0].softmax(dim=-1)
+    return scores_tensor.detach().cpu().numpy()
+
+WORDS = ("the people think this is really good but not great and why would they hate that love thanks "
+         "awful post comment time work game government money news right wrong same again never always").split()
+
+# Mostly short comments, a few posts longer than the model input
+def synthetic_texts(num_rows, seed=42):
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(num_rows):
+        length = rng.randint(400, 1500) if rng.random() < 0.03 else rng.randint(1, 60)
+        texts.append(' '.join(rng.choice(WORDS) for _ in range(length)))
+    return texts
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', default=SENTIMENT_MODEL)
+    parser.add_argument('--input', default='src/nlp/cleaned_dataset.csv')
+    parser.add_argument('--rows', type=int, default=1000, help="First non-empty texts of the input")
+    parser.add_argument('--synthetic', action='store_true', help="Generated texts instead of the input")
+    parser.add_argument('--use-slow-tokenizer', action='store_true', help="As the sentiment notebook loads bertweet")
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--max-batch-tokens', type=int, default=8192)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        texts = synthetic_texts(args.rows)
+    else:
+        df = read_artifact(args.input)
+        texts = [t for t in df['clean_text'] if isinstance(t, str) and len(t.strip()) > 0][:args.rows]
+    torch.manual_seed(0)
+
+    tokenizer, model, device = load_model(args.model, use_fast=not args.use_slow_tokenizer)
+    start = time.perf_counter()
+    expected = np.stack([notebook_scores(text, tokenizer, model, device) for text in texts])
+    notebook_time = time.perf_counter() - start
+    print(f"{len(texts)} documents on {device}\n")
+    print(f"{'scoring':<22}{'s':>8}{'docs/s':>10}{'speed-up':>10}{'max abs diff':>14}{'same label':>12}")
+    print(f"{'notebook, batch=1':<22}{notebook_time:>8.2f}{len(texts) / notebook_time:>10.1f}{'1.0x':>10}{'-':>14}{'-':>12}")
+
+    for name, quantize in [('engine', False), ('engine, int8', True)]:
+        if quantize:
+            tokenizer, model, device = load_model(args.model, use_fast=not args.use_slow_tokenizer, quantize=True)
+        engine = InferenceEngine(tokenizer, model, device, args.batch_size, args.max_batch_tokens)
+        start = time.perf_counter()
+        probs = engine.predict_proba(texts)
+        elapsed = time.perf_counter() - start
+        diff = np.abs(probs - expected).max()
+        same = (probs.argmax(axis=1) == expected.argmax(axis=1)).mean()
+        print(f"{name:<22}{elapsed:>8.2f}{len(texts) / elapsed:>10.1f}{notebook_time / elapsed:>9.1f}x"
+              f"{diff:>14.2e}{same:>11.1%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import numpy as np
+import pandas as pd
+import torch
+from tqdm import tqdm
+from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+# Batched inference for the sequence classification models of the sentiment and emotion
+# notebooks. Every text becomes one or more model inputs (segments) exactly as the notebooks
+# build them: texts of at least max_length - 2 characters are split into chunks of
+# max_length - 4 tokens, the others are encoded whole, each with <s> and </s>.
+# The segments of all the texts, chunks of long texts included, are sorted by length and
+# packed into batches of at most batch_size segments and max_batch_tokens padded tokens, each
+# padded only to its own longest segment. The softmax of every segment goes back to its text,
+# and the texts with several chunks get the mean of their chunks, as the notebooks compute it
+
+SENTIMENT_MODEL = "finiteautomata/bertweet-base-sentiment-analysis"
+EMOTION_MODEL = "SamLowe/roberta-base-go_emotions"
+SENTIMENT_LABELS = ['negative', 'neutral', 'positive']
+GOEMOTIONS_LABELS = [
+    'admiration', 'amusement', 'anger', 'annoyance', 'approval', 'caring',
+    'confusion', 'curiosity', 'desire', 'disappointment', 'disapproval',
+    'disgust', 'embarrassment', 'excitement', 'fear', 'gratitude', 'grief',
+    'joy', 'love', 'nervousness', 'optimism', 'pride', 'realization',
+    'relief', 'remorse', 'sadness', 'surprise', 'neutral', 'contradiction'
+]
+
+# quantize: int8 dynamic quantization of the Linear layers (weights stored in int8, activations
+# quantized on the fly), which only runs on CPU
+def load_model(model_name, use_fast=True, quantize=False, device=None):
+    tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=use_fast)
+    model = AutoModelForSequenceClassification.from_pretrained(model_name)
+    model.eval()
+
+    if quantize:
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        device = torch.device("cpu")
+    elif device is None:
+        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    model.to(device)
+    return tokenizer, model, device
+
+class InferenceEngine:
+    def __init__(self, tokenizer, model, device, batch_size=64, max_batch_tokens=8192):
+        self.tokenizer = tokenizer
+        self.model = model
+        self.device = device
+        self.batch_size = batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.max_length = model.config.max_position_embeddings
+        self.num_labels = model.config.num_labels
+
+    # Token ids of every segment and the index of the text it belongs to
+    def segments(self, texts):
+        cls_id, sep_id = self.tokenizer.cls_token_id, self.tokenizer.sep_token_id
+        chunk_length = self.max_length - 4
+        segments, owners = [], []
+        for i, text in enumerate(texts):
+            token_ids = self.tokenizer.encode(text, add_special_tokens=False)
+            if len(text) >= self.max_length - 2:
+                chunks = [token_ids[j:j + chunk_length] for j in range(0, len(token_ids), chunk_length)]
+            else:
+                # Same ids as tokenizer(text) for the <s> ... </s> models used here
+                chunks = [token_ids]
+            for chunk in chunks:
+                segments.append([cls_id] + chunk + [sep_id])
+                owners.append(i)
+        return segments, np.asarray(owners, dtype=np.int64)
+
+    # Positions of the segments of each batch, longest segments first
+    def batches(self, lengths):
+        batch, width = [], 0
+        for i in np.argsort(-lengths, kind='stable'):
+            width = max(width, lengths[i]) if batch else lengths[i]
+            if batch and (len(batch) == self.batch_size or width * (len(batch) + 1) > self.max_batch_tokens):
+                yield np.asarray(batch)
+                batch, width = [], lengths[i]
+            batch.append(i)
+        if batch:
+            yield np.asarray(batch)
+
+    def run_batch(self, segments):
+        width = max(len(segment) for segment in segments)
+        input_ids = torch.full((len(segments), width), self.tokenizer.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(segments), width), dtype=torch.long)
+        for row, segment in enumerate(segments):
+            input_ids[row, :len(segment)] = torch.tensor(segment, dtype=torch.long)
+            attention_mask[row, :len(segment)] = 1
+
+        with torch.inference_mode():
+            logits = self.model(input_ids=input_ids.to(self.device), attention_mask=attention_mask.to(self.device)).logits
+        return logits.softmax(dim=-1).float().cpu().numpy()
+
+    # (len(texts), num_labels) probabilities; NaN rows for texts without any token
+    def predict_proba(self, texts, progress=False):
+        segments, owners = self.segments(texts)
+        lengths = np.array([len(segment) for segment in segments], dtype=np.int64)
+
+        probs = np.zeros((len(segments), self.num_labels), dtype=np.float32)
+        batches = list(self.batches(lengths))
+        for batch in tqdm(batches, disable=not progress):
+            probs[batch] = self.run_batch([segments[i] for i in batch])
+
+        sums = np.zeros((len(texts), self.num_labels), dtype=np.float64)
+        np.add.at(sums, owners, probs)
+        counts = np.bincount(owners, minlength=len(texts))
+        with np.errstate(invalid='ignore'):
+            return (sums / counts[:, None]).astype(np.float32)
+
+# sentiment_scores rows: texts that are not strings or are blank get empty scores. Texts
+# without any token are left out, as the notebook loop skipped them on the error
+def score_sentiment(engine, df, model_name="bertweet", labels=SENTIMENT_LABELS, progress=True):
+    texts = df['clean_text']
+    valid = texts.map(lambda text: isinstance(text, str) and len(text.strip()) > 0).to_numpy()
+    probs = np.full((len(df), len(labels)), np.nan, dtype=np.float32)
+    probs[valid] = engine.predict_proba(texts[valid].tolist(), progress=progress)
+    keep = ~valid | ~np.isnan(probs).any(axis=1)
+
+    result = pd.DataFrame({'author': df['author'].to_numpy(), 'id': df['id'].to_numpy(), 'model': model_name})
+    for column, k in zip(['neg_percentage', 'neu_percentage', 'pos_percentage'], range(len(labels))):
+        result[column] = probs[:, k]
+    result['predicted_sentiment'] = [labels[p.argmax()] if ok else None for p, ok in zip(probs, valid)]
+    return result[keep].reset_index(drop=True)
+
+# emotion_scores rows: one <label>_score column per model output. Texts that are not strings
+# or have no token are left out, as in the notebook loop
+def score_emotions(engine, df, model_name="goemotions", labels=GOEMOTIONS_LABELS, progress=True):
+    df = df[df['clean_text'].map(lambda text: isinstance(text, str))]
+    probs = engine.predict_proba(df['clean_text'].tolist(), progress=progress)
+    keep = ~np.isnan(probs).any(axis=1)
+    df, probs = df[keep], probs[keep]
+
+    result = pd.DataFrame({'author': df['author'].to_numpy(), 'id': df['id'].to_numpy(), 'model': model_name})
+    for emotion, k in zip(labels, range(probs.shape[1])):
+        result[f"{emotion}_score"] = probs[:, k]
+    result['predicted_emotion'] = [labels[k] for k in probs.argmax(axis=1)]
+    result['predicted_confidence'] = probs.max(axis=1)
+    return result
@@ -0,0 +1,115 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from aggregate_cube import create_cube_tables, update_cube, query_cube, CUBES, POLARITY
+
+# The cube built by successive updates against the same aggregates computed with a pandas
+# merge/groupby of all the texts and scores
+
+EMOTIONS = ['joy', 'anger']
+
+def make_data(seed=0, num_texts=400, num_users=40):
+    rng = np.random.default_rng(seed)
+    users = pd.DataFrame({
+        'id': [f'user{i}' for i in range(num_users)],
+        'community_id': rng.integers(0, 4, size=num_users),
+        'community_type': rng.choice(['echo', 'mixed'], size=num_users),
+        'is_hub': rng.random(num_users) < 0.2,
+        'is_bridge': rng.random(num_users) < 0.2,
+    })
+    # Some authors are outside the graph
+    authors = rng.choice([f'user{i}' for i in range(num_users + 10)], size=num_texts)
+    topic_ids = rng.integers(-1, 5, size=num_texts)
+    days = pd.Timestamp('2025-01-01', tz='UTC') + pd.to_timedelta(rng.integers(0, 90 * 24, size=num_texts), unit='h')
+    texts = pd.DataFrame({
+        'author': authors,
+        'id': [f't{i}' for i in range(num_texts)],
+        'date': days.strftime('%Y-%m-%d %H:%M:%S+00:00'),
+        'topic': [f'topic {t}' for t in topic_ids],
+        'topic_id': topic_ids,
+    })
+
+    scored = rng.random(num_texts) < 0.8
+    probabilities = rng.dirichlet(np.ones(3), size=scored.sum())
+    sentiments = pd.DataFrame({
+        'id': texts['id'][scored].to_numpy(),
+        'model': rng.choice(['bertweet', 'roberta'], p=[0.9, 0.1], size=scored.sum()),
+        'predicted_sentiment': rng.choice(list(POLARITY) + [None], size=scored.sum()),
+        'neg_percentage': probabilities[:, 0],
+        'neu_percentage': probabilities[:, 1],
+        'pos_percentage': probabilities[:, 2],
+    })
+
+    scored = rng.random(num_texts) < 0.7
+    emotions = pd.DataFrame({'id': texts['id'][scored].to_numpy()})
+    for label in EMOTIONS:
+        emotions[f'{label}_score'] = rng.random(scored.sum())
+    return texts, users, sentiments, emotions
+
+MEASURES = ['n', 'n_sentiment', 'n_emotion', 'polarity_mean', 'neg_mean', 'emo_joy_mean']
+
+def expected_aggregates(texts, users, sentiments, emotions, by):
+    df = texts.merge(users.rename(columns={'id': 'author'}), on='author', how='left')
+    df['community_id'] = df['community_id'].fillna(-1).astype(np.int64)
+    df['community_type'] = df['community_type'].fillna('')
+    df['role'] = np.where(df['is_hub'].fillna(False).astype(bool), 'Hub',
+                          np.where(df['is_bridge'].fillna(False).astype(bool), 'Bridge', 'Average'))
+    df.loc[df['community_id'] < 0, 'role'] = ''
+    df['day'] = pd.to_datetime(df['date'], utc=True).dt.strftime('%Y-%m-%d')
+    df['month'] = df['day'].str[:7]
+
+    sentiments = sentiments[(sentiments['model'] == 'bertweet') & sentiments['predicted_sentiment'].notna()]
+    sentiments = sentiments.assign(polarity=sentiments['predicted_sentiment'].map(POLARITY))
+    df = df.merge(sentiments[['id', 'neg_percentage', 'polarity']], on='id', how='left')
+    df = df.merge(emotions[['id', 'joy_score']], on='id', how='left')
+
+    return df.groupby(by).agg(
+        n=('id', 'size'),
+        n_sentiment=('polarity', 'count'),
+        n_emotion=('joy_score', 'count'),
+        polarity_mean=('polarity', 'mean'),
+        neg_mean=('neg_percentage', 'mean'),
+        emo_joy_mean=('joy_score', 'mean'),
+    ).reset_index()
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(':memory:')
+    create_cube_tables(conn)
+    yield conn
+    conn.close()
+
+def cube_rows(conn):
+    return {table: sorted(conn.execute(f'SELECT * FROM {table}')) for table in ['cube_texts'] + list(CUBES)}
+
+@pytest.mark.parametrize('by', [
+    ['community_id', 'role', 'day'],
+    ['month', 'community_id'],
+    ['community_type', 'role', 'month'],
+    ['topic'],
+])
+def test_incremental_updates_match_groupby(conn, by):
+    texts, users, sentiments, emotions = make_data()
+    first, second = texts.iloc[:250], texts.iloc[250:]
+
+    # Scores of texts not in the cube yet are added by the update that brings the texts
+    update_cube(conn, first, users, sentiments=sentiments.iloc[:200])
+    update_cube(conn, second, users, sentiments=sentiments, emotions=emotions.iloc[:150])
+    update_cube(conn, emotions=emotions)
+
+    actual = query_cube(conn, by=by, measures=MEASURES)
+    expected = expected_aggregates(texts, users, sentiments, emotions, by)
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+
+def test_repeated_update_adds_nothing(conn):
+    texts, users, sentiments, emotions = make_data(seed=1)
+    update_cube(conn, texts, users, sentiments, emotions)
+    before = cube_rows(conn)
+
+    added = update_cube(conn, texts, users, sentiments, emotions)
+
+    assert added == {'texts': 0, 'sentiments': 0, 'emotions': 0}
+    assert cube_rows(conn) == before
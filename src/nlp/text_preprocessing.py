@@ -0,0 +1,169 @@
+import argparse
+import functools
+import pickle
+import string
+import re as std_re
+import tempfile
+import time
+import sys
+import os
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import regex as re
+from nltk import pos_tag_sents, word_tokenize
+from nltk.corpus import stopwords, wordnet
+from nltk.stem import WordNetLemmatizer
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data'))
+from artifacts import ArtifactWriter
+
+# Preprocessing of text_preprocessing.ipynb as a streaming job. raw_textual_df.csv is read in
+# chunks and every chunk is one task for the worker processes; each document goes through the
+# precompiled cleaning steps in a single function call instead of one DataFrame.apply per step.
+# The rare words the notebook removes are the least frequent ones over the whole corpus, so
+# there are two passes:
+#   1. lower case, HTML, URLs, punctuation and stopwords; the word counts are merged and the
+#      cleaned chunks spilled to a temporary file
+#   2. rare words, special characters and the lemmatization of the spilled chunks, with the
+#      POS tagging of a whole chunk in one pos_tag_sents call
+# Chunks are merged and written in input order, so the output is the one of the notebook
+
+HTML_PATTERN = re.compile(r'<.*?>')
+URL_PATTERN = re.compile(r'https?://\S+|www\.\S+')
+# Two steps of the notebook as one standard-library pattern each, same output:
+#   punctuation -> ' ' then split():  the runs of characters that are neither punctuation nor
+#                                      whitespace (re's \s is str.isspace, as split() uses)
+#   [^a-zA-Z0-9] -> ' ' then \s+ -> ' ': every run of other characters becomes one space
+WORD_PATTERN = std_re.compile('[^\\s' + std_re.escape(string.punctuation) + ']+')
+SPECIAL_CHARS_PATTERN = std_re.compile('[^a-zA-Z0-9]+')
+RARE_WORDS_COUNT = 9
+
+_stop_words = None
+_wordnet_map = None
+_lemmatizer = None
+
+def _init_worker():
+    global _stop_words, _wordnet_map, _lemmatizer
+    _stop_words = set(stopwords.words('english'))
+    _wordnet_map = {"N": wordnet.NOUN, "V": wordnet.VERB, "J": wordnet.ADJ, "R": wordnet.ADV}
+    _lemmatizer = WordNetLemmatizer()
+
+# Lower case, HTML tags, URLs, punctuation, stopwords
+def clean_text(text):
+    text = URL_PATTERN.sub('', HTML_PATTERN.sub('', text.lower()))
+    return " ".join([word for word in WORD_PATTERN.findall(text) if word not in _stop_words])
+
+# Rare words, then special characters
+def finish_text(text, rare_words):
+    text = " ".join([word for word in text.split() if word not in rare_words])
+    return SPECIAL_CHARS_PATTERN.sub(' ', text)
+
+@functools.lru_cache(maxsize=None)
+def lemmatize(word, pos):
+    return _lemmatizer.lemmatize(word, pos)
+
+# Cleaned texts only contain [a-zA-Z0-9 ], so sentence splitting cannot split them and is skipped
+def lemmatize_texts(texts):
+    sentences = [[t for t in word_tokenize(text.lower(), preserve_line=True) if t not in _stop_words and len(t) > 2]
+                 for text in texts]
+    return [" ".join([lemmatize(word, _wordnet_map.get(pos[0], wordnet.NOUN)) for word, pos in tagged])
+            for tagged in pos_tag_sents(sentences)]
+
+def clean_texts(texts):
+    cleaned = [clean_text(str(text)) for text in texts]
+    word_count = Counter()
+    for text in cleaned:
+        word_count.update(text.split())
+    return cleaned, word_count
+
+def finish_texts(texts, rare_words):
+    finished = [finish_text(text, rare_words) for text in texts]
+    return finished, lemmatize_texts(finished)
+
+# Same ordering as Counter.most_common()[:-10:-1] in the notebook: lowest counts, and among
+# equal counts the words seen last
+def rare_words(word_count, n=RARE_WORDS_COUNT):
+    return set(word for (word, wc) in word_count.most_common()[:-n - 1:-1])
+
+# fn over the (rows, texts) items, results in input order with at most `window` items in flight
+def ordered_map(executor, fn, items, *args, window=4):
+    pending = deque()
+    for rows, texts in items:
+        if executor is None:
+            yield rows, fn(texts, *args)
+            continue
+        pending.append((rows, executor.submit(fn, texts, *args)))
+        if len(pending) >= window:
+            rows, future = pending.popleft()
+            yield rows, future.result()
+    while pending:
+        rows, future = pending.popleft()
+        yield rows, future.result()
+
+# Every column as text, so that the types cannot change from one chunk to the next; missing
+# texts still become 'nan' as in the notebook
+def read_chunks(input_path, chunksize):
+    for chunk in pd.read_csv(input_path, chunksize=chunksize, dtype=str):
+        yield chunk.drop(columns=['text']), chunk['text'].tolist()
+
+def read_spill(spill):
+    spill.seek(0)
+    while True:
+        try:
+            yield pickle.load(spill)
+        except EOFError:
+            return
+
+def preprocess(input_path, output_path, chunksize=5000, workers=None):
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        _init_worker()
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+
+    try:
+        with tempfile.TemporaryFile() as spill:
+            word_count = Counter()
+            for rows, (cleaned, counts) in ordered_map(executor, clean_texts, read_chunks(input_path, chunksize),
+                                                       window=2 * workers):
+                # Merged in input order, as the notebook's Counter sees the words
+                word_count.update(counts)
+                pickle.dump((rows, cleaned), spill, protocol=pickle.HIGHEST_PROTOCOL)
+            rare = rare_words(word_count)
+
+            writer = None
+            docs = 0
+            for rows, (cleaned, lemmatized) in ordered_map(executor, finish_texts, read_spill(spill), rare,
+                                                           window=2 * workers):
+                docs += len(rows)
+                rows = rows.assign(clean_text=cleaned, lemmatized_text=lemmatized)
+                rows = rows[rows['clean_text'] != '']
+                if writer is None:
+                    # Read with dtype=str: a batch where a column is all missing is still a string column
+                    writer = ArtifactWriter(output_path, list(rows.columns), types=dict.fromkeys(rows.columns, 'string'))
+                rows = rows.astype(object).where(rows.notna(), None)
+                writer.write(list(rows.itertuples(index=False, name=None)))
+            written = writer.close() if writer is not None else 0
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return docs, written
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--input', default='src/nlp/raw_textual_df.csv')
+    parser.add_argument('--output', default='src/nlp/cleaned_dataset.csv')
+    parser.add_argument('--chunksize', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    docs, rows = preprocess(args.input, args.output, args.chunksize, args.workers)
+    elapsed = time.perf_counter() - start
+    print(f"{docs} documents, {rows} non-empty written in {elapsed:.1f}s ({docs / elapsed:.0f} docs/s)")
+
+if __name__ == "__main__":
+    main()
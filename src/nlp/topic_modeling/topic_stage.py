@@ -0,0 +1,248 @@
+import argparse
+import json
+import time
+import sys
+import os
+
+import numpy as np
+import pandas as pd
+from bertopic import BERTopic
+from bertopic.representation import MaximalMarginalRelevance
+from hdbscan import HDBSCAN
+from sentence_transformers import SentenceTransformer
+from sklearn.feature_extraction import text
+from sklearn.feature_extraction.text import CountVectorizer
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'data'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from artifacts import read_artifact, write_artifact
+from embedding_store import EmbeddingStore
+from nlp_cache import DEFAULT_CACHE, ResultCache, CachedEncoder
+
+# Topic stage of global_community_topic.ipynb as a job with two modes:
+#   fit     the notebook's BERTopic model on every non-empty text, with the embeddings read from
+#           the text embedding store (same all-MiniLM-L6-v2 model) and HDBSCAN's core distances
+#           computed by parallel workers; the fitted model is saved with its UMAP and HDBSCAN
+#           (pickle), together with the outlier rate and mean topic probability of the fit
+#   assign  only the texts of cleaned_dataset missing from topic_data go through the saved
+#           model (UMAP transform + HDBSCAN approximate_predict), their outliers are reduced
+#           with the same strategy, and the rows are appended to topic_data and folded into the
+#           count files. When the outlier rate or the mean probability of the new texts drifts
+#           from the fit by more than the tolerance, or the fit statistics are missing, a full
+#           refit is reported (or run)
+# Texts without a stored embedding are encoded through the shared NLP result cache
+
+EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+DEFAULT_MODEL_DIR = 'src/nlp/topic_modeling/topic_model'
+OUTPUT_DIR = 'src/nlp/topic_modeling'
+DRIFT_TOLERANCE = 0.1
+
+# Defining customized stopwords-like list of words in order to obtain more detailed topic (without noise)
+CUSTOM_STOPWORDS = [
+    # Reddit/platform specific
+    "reddit", "subreddit", "sub", "thread", "post", "posts", "comment", "comments",
+    "commenters", "upvotes", "upvote", "downvotes", "op", "changemyview",
+    "deltaboards", "deltalog", "unpopularopinion",
+
+    # Conversation/structure
+    "replying", "paragraphs", "discussion", "debates",
+
+    # Noise
+    "omggg", "ella", "becky", "scarlet",
+
+    # Too generic / cross-topic
+    "people", "thing", "things", "stuff", "way", "lot", "good", "bad"
+]
+
+# The notebook's model (its UMAP settings were never passed to BERTopic, which keeps its
+# default UMAP); workers is HDBSCAN's core_dist_n_jobs (-1: every core)
+def build_topic_model(embedding_model, workers=-1):
+    vectorizer_model = CountVectorizer(
+        stop_words=list(text.ENGLISH_STOP_WORDS.union(CUSTOM_STOPWORDS)),
+        min_df=0.001,
+        max_df=0.7,
+        max_features=30000
+    )
+    hdbscan_model = HDBSCAN(
+        min_cluster_size=300,
+        min_samples=10,
+        cluster_selection_epsilon=0.01,
+        prediction_data=True,
+        memory='./hdbscan_cache/',
+        core_dist_n_jobs=workers
+    )
+    return BERTopic(
+        embedding_model=embedding_model,
+        vectorizer_model=vectorizer_model,
+        hdbscan_model=hdbscan_model,
+        representation_model=MaximalMarginalRelevance(diversity=0.3),
+        verbose=True,
+        calculate_probabilities=True,
+        nr_topics=25
+    )
+
+# Non-empty texts, as the notebook filters them
+def load_texts(path):
+    text_df = read_artifact(path)
+    text_df['clean_text'] = text_df['clean_text'].fillna('').astype(str)
+    return text_df[text_df['clean_text'].str.strip() != ''].reset_index(drop=True)
+
+# Embeddings of the texts: rows of the text embedding store, the others encoded through the cache
+def document_embeddings(text_df, embedding_model, store_path, cache_path=DEFAULT_CACHE):
+    ids = text_df['id'].astype(str)
+    embeddings = None
+    missing = np.ones(len(text_df), dtype=bool)
+    if store_path is not None and os.path.exists(store_path + '.vectors.npy'):
+        store = EmbeddingStore(store_path)
+        embeddings = store.get(ids, missing='nan')
+        missing = np.isnan(embeddings).any(axis=1)
+    if missing.any():
+        encoder = CachedEncoder(embedding_model, ResultCache(cache_path), EMBEDDING_MODEL) if cache_path else embedding_model
+        encoded = np.asarray(encoder.encode(text_df.loc[missing, 'clean_text'].tolist(), show_progress_bar=True,
+                                            convert_to_numpy=True), dtype=np.float32)
+        if embeddings is None:
+            embeddings = encoded
+        else:
+            embeddings[missing] = encoded
+    print(f"{len(text_df) - missing.sum()} stored embeddings, {missing.sum()} encoded")
+    return embeddings
+
+# Outlier rate before the reduction and mean probability of the assigned topic
+def assignment_stats(topics, probs):
+    topics = np.asarray(topics)
+    probs = np.atleast_2d(np.asarray(probs))
+    return {'outlier_rate': float((topics == -1).mean()), 'mean_probability': float(probs.max(axis=1).mean())}
+
+def label_topics(topic_model, text_df, topics, probs):
+    new_topics = topic_model.reduce_outliers(text_df['clean_text'].tolist(), topics, strategy="probabilities", probabilities=probs)
+    topic_info = topic_model.get_topic_info()
+    topic_id_to_name = dict(zip(topic_info['Topic'], topic_info['Name']))
+
+    text_df = text_df.copy()
+    text_df['topic'] = [topic_id_to_name.get(topic, f"Topic {topic}") for topic in new_topics]
+    text_df['topic_id'] = new_topics
+    return text_df.drop(columns=['clean_text'])
+
+# The notebook's count files, from texts labelled with topic and topic_id
+def topic_counts(topic_df, community_df):
+    merged_df = topic_df.merge(community_df, left_on='author', right_on='id', how='inner')
+    community = merged_df.groupby(['community_id', 'topic', 'topic_id']).size().reset_index(name='count')
+    hubs = merged_df.loc[merged_df['is_hub']].groupby(['community_id', 'topic']).size().reset_index(name='count')
+    bridges = merged_df.loc[merged_df['is_bridge']].groupby(['community_id', 'topic']).size().reset_index(name='count')
+    return {'community_topic_counts': community, 'hub_topic_counts': hubs, 'bridge_topic_counts': bridges}
+
+# Percent of each topic in its community, and the 5 largest topics of each community
+def finish_counts(counts):
+    for df in counts.values():
+        df['percent'] = df['count'] / df.groupby('community_id')['count'].transform('sum')
+    community = counts['community_topic_counts']
+    top_n = community.sort_values(['community_id', 'count'], ascending=[True, False], kind='stable')
+    counts['top_n_topics'] = top_n.groupby('community_id').head(5).reset_index(drop=True)
+    return counts
+
+def write_counts(counts, output_dir):
+    for name, df in counts.items():
+        df.to_csv(os.path.join(output_dir, f'{name}.csv'), index=False)
+
+# Counts of the new texts added to the existing files
+def add_counts(output_dir, new_counts):
+    counts = {}
+    for name, df in new_counts.items():
+        keys = [column for column in df.columns if column != 'count']
+        old = pd.read_csv(os.path.join(output_dir, f'{name}.csv')).drop(columns=['percent'])
+        counts[name] = pd.concat([old, df]).groupby(keys, as_index=False)['count'].sum()
+    return finish_counts(counts)
+
+def fit(texts_path, users_path, store_path, model_dir, output_dir, workers=-1, cache_path=DEFAULT_CACHE):
+    text_df = load_texts(texts_path)
+    embedding_model = SentenceTransformer(EMBEDDING_MODEL)
+    embeddings = document_embeddings(text_df, embedding_model, store_path, cache_path)
+
+    topic_model = build_topic_model(embedding_model, workers)
+    topics, probs = topic_model.fit_transform(text_df['clean_text'].tolist(), embeddings)
+    topic_df = label_topics(topic_model, text_df, topics, probs)
+
+    write_artifact(topic_df, os.path.join(output_dir, 'topic_data.csv'))
+    write_counts(finish_counts(topic_counts(topic_df, read_artifact(users_path))), output_dir)
+
+    topic_model.save(model_dir, serialization='pickle', save_embedding_model=False)
+    with open(model_dir + '.json', 'w') as f:
+        json.dump({'documents': len(text_df), **assignment_stats(topics, probs)}, f)
+    return len(topic_df)
+
+# Statistics of the fit saved next to the model, None when they are missing or incomplete
+# (e.g. a model saved by an older version of the notebook)
+def load_baseline(model_dir):
+    try:
+        with open(model_dir + '.json') as f:
+            baseline = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if not all(isinstance(baseline.get(key), (int, float)) for key in ('outlier_rate', 'mean_probability')):
+        return None
+    return baseline
+
+def drifted(baseline, stats, tolerance=DRIFT_TOLERANCE):
+    return (stats['outlier_rate'] - baseline['outlier_rate'] > tolerance
+            or baseline['mean_probability'] - stats['mean_probability'] > tolerance)
+
+def assign(texts_path, users_path, store_path, model_dir, output_dir, cache_path=DEFAULT_CACHE,
+           tolerance=DRIFT_TOLERANCE):
+    topic_path = os.path.join(output_dir, 'topic_data.csv')
+    topic_df = read_artifact(topic_path)
+    text_df = load_texts(texts_path)
+    text_df = text_df[~text_df['id'].astype(str).isin(topic_df['id'].astype(str))].reset_index(drop=True)
+    if len(text_df) == 0:
+        return 0, False
+
+    # Checked before any output is written: without the fit statistics drift cannot be measured
+    baseline = load_baseline(model_dir)
+    if baseline is None:
+        print(f"No valid fit statistics in {model_dir}.json: the model needs a refit")
+        return 0, True
+
+    embedding_model = SentenceTransformer(EMBEDDING_MODEL)
+    topic_model = BERTopic.load(model_dir, embedding_model=embedding_model)
+    embeddings = document_embeddings(text_df, embedding_model, store_path, cache_path)
+    topics, probs = topic_model.transform(text_df['clean_text'].tolist(), embeddings)
+    new_df = label_topics(topic_model, text_df, topics, probs)
+
+    write_artifact(pd.concat([topic_df, new_df], ignore_index=True), topic_path)
+    write_counts(add_counts(output_dir, topic_counts(new_df, read_artifact(users_path))), output_dir)
+
+    stats = assignment_stats(topics, probs)
+    print(f"fit: outliers {baseline['outlier_rate']:.1%}, mean probability {baseline['mean_probability']:.3f}; "
+          f"new texts: outliers {stats['outlier_rate']:.1%}, mean probability {stats['mean_probability']:.3f}")
+    return len(new_df), drifted(baseline, stats, tolerance)
+
+def main():
+    parser = argparse.ArgumentParser(description="BERTopic stage: full fit or incremental topic assignment")
+    parser.add_argument('command', choices=['fit', 'assign'])
+    parser.add_argument('--input', default='src/nlp/cleaned_dataset.csv')
+    parser.add_argument('--users', default='src/data/distribuitions/hub_bridge_df.csv')
+    parser.add_argument('--embeddings', default='src/nlp/text_embeddings', help="Text embedding store, '' to encode")
+    parser.add_argument('--model-dir', default=DEFAULT_MODEL_DIR)
+    parser.add_argument('--output-dir', default=OUTPUT_DIR)
+    parser.add_argument('--workers', type=int, default=-1, help="HDBSCAN core distance workers")
+    parser.add_argument('--cache', default=DEFAULT_CACHE, help="NLP result cache, '' to disable it")
+    parser.add_argument('--tolerance', type=float, default=DRIFT_TOLERANCE)
+    parser.add_argument('--refit-on-drift', action='store_true')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    store = args.embeddings or None
+    if args.command == 'fit':
+        rows = fit(args.input, args.users, store, args.model_dir, args.output_dir, args.workers, args.cache)
+        print(f"fitted on {rows} texts in {time.perf_counter() - start:.0f}s")
+        return
+
+    rows, drift = assign(args.input, args.users, store, args.model_dir, args.output_dir, args.cache, args.tolerance)
+    print(f"assigned {rows} new texts in {time.perf_counter() - start:.0f}s")
+    if drift:
+        print("topic drift detected, or no fit statistics: a full refit is recommended")
+        if args.refit_on_drift:
+            rows = fit(args.input, args.users, store, args.model_dir, args.output_dir, args.workers, args.cache)
+            print(f"refitted on {rows} texts in {time.perf_counter() - start:.0f}s")
+
+if __name__ == "__main__":
+    main()
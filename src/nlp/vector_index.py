@@ -0,0 +1,261 @@
+import argparse
+import json
+import time
+import sys
+import os
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data'))
+from artifacts import read_artifact
+from embedding_store import EmbeddingStore, ids_array
+from embedding_analytics import normalize_rows
+
+# Inverted-file (IVF) nearest-neighbour index over an embedding store, in NumPy. The unit-norm
+# embeddings are clustered with spherical k-means into nlist lists and stored grouped by list,
+# so a query scores the nlist centroids, then only the vectors of its nprobe closest lists,
+# each list being one contiguous matrix product. Scores are cosine similarities.
+# Rows can carry attributes (community_id, community_type, role) and searches take equality
+# filters on them; a filter matching fewer rows than the probed lists hold, or leaving fewer
+# than k of them in the probed lists, is answered by the exact scan of the matching rows.
+# An index is a directory next to its store ('src/nlp/user_embeddings.ivf') with one .npy per
+# array, the vectors being memory-mapped on load
+
+KMEANS_ITERATIONS = 20
+TRAIN_POINTS_PER_LIST = 64
+
+def default_nlist(n):
+    return max(1, min(n, int(4 * np.sqrt(n))))
+
+# (len(x), k) top-k positions and scores of a score matrix, best first
+def top_k(scores, k):
+    k = min(k, scores.shape[1])
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    best = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-best, axis=1, kind='stable')
+    return np.take_along_axis(part, order, axis=1), np.take_along_axis(best, order, axis=1)
+
+def assign(vectors, centroids, chunk_size=65536):
+    labels = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk_size):
+        labels[start:start + chunk_size] = (vectors[start:start + chunk_size] @ centroids.T).argmax(axis=1)
+    return labels
+
+# Centroids of spherical k-means on a sample of the unit vectors; empty lists are re-seeded
+# with random points
+def train_centroids(vectors, nlist, seed=0, iterations=KMEANS_ITERATIONS):
+    rng = np.random.default_rng(seed)
+    sample = vectors[np.sort(rng.choice(len(vectors), size=min(len(vectors), nlist * TRAIN_POINTS_PER_LIST), replace=False))]
+    centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+    for _ in range(iterations):
+        labels = assign(sample, centroids)
+        order = np.argsort(labels, kind='stable')
+        counts = np.bincount(labels, minlength=nlist)
+        empty = counts == 0
+        sums = np.zeros_like(centroids)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        sums[~empty] = np.add.reduceat(sample[order], starts[~empty], axis=0)
+        sums[empty] = sample[rng.choice(len(sample), size=empty.sum(), replace=False)]
+        centroids = normalize_rows(sums)
+    return centroids
+
+class VectorIndex:
+    def __init__(self, ids, vectors, centroids, offsets, order, attributes=None):
+        self.ids = ids
+        # Unit vectors grouped by list: list l is vectors[offsets[l]:offsets[l + 1]], and
+        # vectors[p] is the embedding of ids[order[p]]
+        self.vectors = vectors
+        self.centroids = centroids
+        self.offsets = offsets
+        self.order = order
+        self.attributes = attributes or {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, ids, embeddings, attributes=None, nlist=None, seed=0):
+        vectors = normalize_rows(embeddings)
+        nlist = nlist or default_nlist(len(vectors))
+        centroids = train_centroids(vectors, nlist, seed)
+        labels = assign(vectors, centroids)
+        order = np.argsort(labels, kind='stable')
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(labels, minlength=nlist), out=offsets[1:])
+        attributes = {name: np.asarray(values) for name, values in (attributes or {}).items()}
+        return cls(ids_array(ids), np.ascontiguousarray(vectors[order]), centroids, offsets, order, attributes)
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        for name in ('ids', 'vectors', 'centroids', 'offsets', 'order'):
+            np.save(os.path.join(path, name + '.npy'), getattr(self, name), allow_pickle=False)
+        for name, values in self.attributes.items():
+            np.save(os.path.join(path, f'attr_{name}.npy'), ids_array(values), allow_pickle=False)
+        with open(os.path.join(path, 'index.json'), 'w') as f:
+            json.dump({'rows': len(self.ids), 'nlist': len(self.centroids), 'attributes': list(self.attributes)}, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(os.path.join(path, 'index.json')) as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(path, name + '.npy'), allow_pickle=False)
+                  for name in ('ids', 'centroids', 'offsets', 'order')}
+        vectors = np.load(os.path.join(path, 'vectors.npy'), mmap_mode='r')
+        attributes = {name: np.load(os.path.join(path, f'attr_{name}.npy'), allow_pickle=False)
+                      for name in meta['attributes']}
+        return cls(arrays['ids'], vectors, arrays['centroids'], arrays['offsets'], arrays['order'], attributes)
+
+    # Boolean mask over the positions of self.vectors for equality filters {attribute: value}
+    def filter_mask(self, where):
+        if not where:
+            return None
+        unknown = sorted(set(where) - set(self.attributes))
+        if unknown:
+            raise ValueError(f"The index has no {', '.join(unknown)} attribute "
+                             f"(attributes: {', '.join(sorted(self.attributes)) or 'none'})")
+        mask = np.ones(len(self.ids), dtype=bool)
+        for name, value in where.items():
+            values = self.attributes[name]
+            mask &= values == np.asarray(value).astype(values.dtype)
+        return mask[self.order]
+
+    def search(self, queries, k=10, nprobe=8, where=None):
+        queries = normalize_rows(np.atleast_2d(queries))
+        mask = self.filter_mask(where)
+        nprobe = min(nprobe, len(self.centroids))
+        probes = top_k(queries @ self.centroids.T, nprobe)[0]
+        matching = np.flatnonzero(mask) if mask is not None else None
+        # A filter matching fewer rows than the probed lists hold is scanned exactly
+        exact = matching is not None and len(matching) <= nprobe * len(self.ids) / len(self.centroids)
+
+        positions = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for q, lists in enumerate(probes):
+            if exact:
+                candidates = matching
+            else:
+                candidates = np.concatenate([np.arange(self.offsets[l], self.offsets[l + 1]) for l in lists])
+            if mask is not None and not exact:
+                candidates = candidates[mask[candidates]]
+                if len(candidates) < k:
+                    candidates = matching
+            if len(candidates) == 0:
+                continue
+            best, best_scores = top_k((self.vectors[candidates] @ queries[q])[None, :], k)
+            positions[q, :best.shape[1]] = candidates[best[0]]
+            scores[q, :best.shape[1]] = best_scores[0]
+        return self.result(positions, scores)
+
+    # Exact top-k over every (matching) row, the reference for recall
+    def brute_force(self, queries, k=10, where=None, chunk_size=65536):
+        queries = normalize_rows(np.atleast_2d(queries))
+        mask = self.filter_mask(where)
+        candidates = np.flatnonzero(mask) if mask is not None else np.arange(len(self.ids))
+        positions = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for start in range(0, len(candidates), chunk_size):
+            chunk = candidates[start:start + chunk_size]
+            merged_positions = np.concatenate([positions, np.broadcast_to(chunk, (len(queries), len(chunk)))], axis=1)
+            merged_scores = np.concatenate([scores, queries @ self.vectors[chunk].T], axis=1)
+            best, scores = top_k(merged_scores, k)
+            positions = np.take_along_axis(merged_positions, best, axis=1)
+        return self.result(positions, scores)
+
+    # Ids of the result positions (None where fewer than k rows matched) and their cosines
+    def result(self, positions, scores):
+        found = positions >= 0
+        ids = np.full(positions.shape, None, dtype=object)
+        ids[found] = self.ids[self.order[positions[found]]]
+        return ids, scores
+
+    # recall@k of search against brute_force and the mean latency per query of both, in ms
+    def evaluate(self, queries, k=10, nprobe=8, where=None):
+        start = time.perf_counter()
+        found, _ = self.search(queries, k, nprobe, where)
+        search_ms = (time.perf_counter() - start) * 1000 / len(queries)
+        start = time.perf_counter()
+        exact, _ = self.brute_force(queries, k, where)
+        exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+        hits = []
+        for f, e in zip(found, exact):
+            expected = {id for id in e if id is not None}
+            hits.append(len(expected & set(f)) / max(1, len(expected)))
+        return {'recall': float(np.mean(hits)), 'search_ms': search_ms, 'brute_force_ms': exact_ms}
+
+# Attributes of the users (community_id, community_type, role) and of the communities
+# (community_type) from hub_bridge_df, aligned with the store ids
+def user_attributes(users, ids):
+    users = users.drop_duplicates('id').set_index('id').reindex(ids)
+    role = np.where(users['is_hub'] == True, 'Hub', np.where(users['is_bridge'] == True, 'Bridge', 'Average'))
+    return {
+        'community_id': users['community_id'].fillna(-1).astype(np.int64).to_numpy(),
+        'community_type': users['community_type'].fillna('').astype(str).to_numpy(),
+        'role': role,
+    }
+
+def community_attributes(users, ids):
+    types = users.groupby('community_id')['community_type'].first().reindex(ids)
+    return {'community_type': types.fillna('').astype(str).to_numpy()}
+
+def build_from_store(store_path, kind, users_path=None, nlist=None, seed=0):
+    store = EmbeddingStore(store_path)
+    attributes = None
+    if users_path is not None and kind in ('users', 'communities'):
+        users = read_artifact(users_path)
+        attributes = (user_attributes if kind == 'users' else community_attributes)(users, store.ids)
+    return VectorIndex.build(store.ids, store.vectors, attributes, nlist, seed)
+
+STORES = {
+    'users': 'src/nlp/user_embeddings',
+    'communities': 'src/nlp/community_embeddings',
+    'texts': 'src/nlp/text_embeddings',
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="IVF nearest-neighbour index over the embedding stores")
+    parser.add_argument('command', choices=['build', 'evaluate', 'query'])
+    parser.add_argument('--kind', choices=list(STORES), default='users')
+    parser.add_argument('--users', default='src/data/distribuitions/hub_bridge_df.csv')
+    parser.add_argument('--nlist', type=int, default=None)
+    parser.add_argument('--nprobe', type=int, default=8)
+    parser.add_argument('-k', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=200, help="Stored vectors used as queries by evaluate")
+    parser.add_argument('--text', default=None, help="Text to look up with query")
+    parser.add_argument('--model', default='all-MiniLM-L6-v2')
+    parser.add_argument('--community', type=int, default=None)
+    parser.add_argument('--role', choices=['Hub', 'Bridge', 'Average'], default=None)
+    args = parser.parse_args()
+
+    index_path = STORES[args.kind] + '.ivf'
+    if args.command == 'build':
+        start = time.perf_counter()
+        index = build_from_store(STORES[args.kind], args.kind, args.users, args.nlist)
+        index.save(index_path)
+        print(f"{index_path}: {len(index)} vectors in {len(index.centroids)} lists ({time.perf_counter() - start:.1f}s)")
+        return
+
+    if args.command == 'query' and args.text is None:
+        parser.error("query requires --text")
+    index = VectorIndex.load(index_path)
+    where = {name: value for name, value in [('community_id', args.community), ('role', args.role)] if value is not None}
+    unknown = sorted(set(where) - set(index.attributes))
+    if unknown:
+        parser.error(f"the {args.kind} index cannot be filtered on {', '.join(unknown)}")
+    if args.command == 'evaluate':
+        rng = np.random.default_rng(0)
+        queries = np.asarray(index.vectors[np.sort(rng.choice(len(index), size=min(args.queries, len(index)), replace=False))])
+        report = index.evaluate(queries, args.k, args.nprobe, where)
+        print(f"recall@{args.k} {report['recall']:.3f}, {report['search_ms']:.2f} ms/query "
+              f"(brute force {report['brute_force_ms']:.2f} ms/query)")
+        return
+
+    from sentence_transformers import SentenceTransformer
+    query = SentenceTransformer(args.model).encode([args.text], convert_to_numpy=True)
+    ids, scores = index.search(query, args.k, args.nprobe, where)
+    for id, score in zip(ids[0], scores[0]):
+        if id is not None:
+            print(f"{score:.3f}  {id}")
+
+if __name__ == "__main__":
+    main()